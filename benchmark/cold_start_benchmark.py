@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from run_extract_benchmark import find_regressions
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Handler module of every Lambda and the source folders on its path
+HANDLERS = {
+    "extract": ["extract", "common"],
+    "transform": ["transform", "common"],
+    "load": ["load", "common"],
+}
+
+# Modules a handler imports on first use rather than at import. They still cost time
+# during the first invocation of a container, so they are measured too.
+DEFERRED_IMPORTS = {
+    "extract": ["pyarrow.parquet"],
+    "transform": ["pg8000"],
+    "load": ["pyarrow.parquet"],
+}
+
+# Metrics compared against a baseline, and whether a higher value is better
+METRICS = {"cold_start_ms": False, "import_ms": False, "deferred_import_ms": False}
+
+
+def handler_env(handler):
+    """Returns the environment a handler is imported in: its source folders on
+    PYTHONPATH and a region for the boto3 clients created at import."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        os.path.join(ROOT, "src", folder) for folder in HANDLERS[handler]
+    )
+    env.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+    return env
+
+
+def run_python(code, env, importtime=False):
+    """
+    Runs code in a new interpreter, as a Lambda cold start does.
+
+    Returns:
+        tuple: (wall clock seconds, stderr of the interpreter)
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", code]
+
+    start = time.perf_counter()
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return seconds, completed.stderr
+
+
+def parse_importtime(stderr):
+    """
+    Parses the output of python -X importtime.
+
+    Args:
+        stderr (str): lines such as "import time:   1523 |   40211 |   pandas"
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth) in the order
+            the imports finished, depth 0 for modules imported by the code run itself
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def import_breakdown(handler, top):
+    """
+    Imports a handler under -X importtime.
+
+    Returns:
+        dict: import_ms of the handler module, deferred_import_ms of its
+            DEFERRED_IMPORTS and the top modules imported by either, by cumulative time
+    """
+    deferred = DEFERRED_IMPORTS.get(handler, [])
+    code = "; ".join(f"import {module}" for module in [handler, *deferred])
+    _, stderr = run_python(code, handler_env(handler), importtime=True)
+    imports = parse_importtime(stderr)
+
+    roots = [entry for entry in imports if entry[3] == 0]
+    import_us = next(entry[2] for entry in roots if entry[0] == handler)
+    deferred_us = sum(entry[2] for entry in roots if entry[0] in deferred)
+    heaviest = sorted(
+        (entry for entry in imports if entry[3] <= 1), key=lambda entry: -entry[2]
+    )[:top]
+
+    return {
+        "import_ms": round(import_us / 1000, 1),
+        "deferred_import_ms": round(deferred_us / 1000, 1),
+        "top_modules": [
+            {
+                "module": module,
+                "self_ms": round(self_us / 1000, 1),
+                "cumulative_ms": round(cumulative_us / 1000, 1),
+            }
+            for module, self_us, cumulative_us, _ in heaviest
+        ],
+    }
+
+
+def cold_start(handler, runs):
+    """Returns the median wall clock seconds of starting an interpreter and importing
+    a handler, and of starting an interpreter alone."""
+    env = handler_env(handler)
+    interpreter = [run_python("pass", env)[0] for _ in range(runs)]
+    with_handler = [run_python(f"import {handler}", env)[0] for _ in range(runs)]
+    return statistics.median(with_handler), statistics.median(interpreter)
+
+
+def run_benchmark(handlers, runs, top):
+    """Measures every handler, reporting an error instead of results for a handler
+    that can not be imported here, e.g. because a dependency is missing."""
+    results = []
+    for handler in handlers:
+        logger.info(f"Measuring the cold start of the {handler} Lambda...")
+        try:
+            total, interpreter = cold_start(handler, runs)
+            result = {
+                "scenario": handler,
+                "cold_start_ms": round(total * 1000, 1),
+                "interpreter_ms": round(interpreter * 1000, 1),
+                **import_breakdown(handler, top),
+            }
+        except Exception as e:
+            logger.error(f"Benchmark of {handler} failed: {e}")
+            result = {"scenario": handler, "error": str(e)}
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the import time and cold start of every Lambda handler."
+    )
+    parser.add_argument("--handlers", nargs="+", default=list(HANDLERS))
+    parser.add_argument(
+        "--runs", type=int, default=5, help="interpreter starts the median is taken of"
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="heaviest imports listed per handler"
+    )
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument(
+        "--baseline", help="results of an earlier run to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative change in a metric reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(args.handlers, args.runs, args.top)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(
+                results, json.load(f), args.tolerance, METRICS
+            )
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
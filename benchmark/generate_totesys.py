@@ -0,0 +1,373 @@
+import argparse
+import logging
+import os
+import time
+from pg8000.native import Connection
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger()
+
+SCHEMA = [
+    """CREATE TABLE currency (
+        currency_id SERIAL PRIMARY KEY,
+        currency_code VARCHAR(3) NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE department (
+        department_id SERIAL PRIMARY KEY,
+        department_name VARCHAR NOT NULL,
+        location VARCHAR,
+        manager VARCHAR,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE staff (
+        staff_id SERIAL PRIMARY KEY,
+        first_name VARCHAR NOT NULL,
+        last_name VARCHAR NOT NULL,
+        department_id INT NOT NULL,
+        email_address VARCHAR NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE address (
+        address_id SERIAL PRIMARY KEY,
+        address_line_1 VARCHAR NOT NULL,
+        address_line_2 VARCHAR,
+        district VARCHAR,
+        city VARCHAR NOT NULL,
+        postal_code VARCHAR NOT NULL,
+        country VARCHAR NOT NULL,
+        phone VARCHAR NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE counterparty (
+        counterparty_id SERIAL PRIMARY KEY,
+        counterparty_legal_name VARCHAR NOT NULL,
+        legal_address_id INT NOT NULL,
+        commercial_contact VARCHAR,
+        delivery_contact VARCHAR,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE design (
+        design_id SERIAL PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        design_name VARCHAR NOT NULL,
+        file_location VARCHAR NOT NULL,
+        file_name VARCHAR NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE payment_type (
+        payment_type_id SERIAL PRIMARY KEY,
+        payment_type_name VARCHAR NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE sales_order (
+        sales_order_id SERIAL PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL,
+        design_id INT NOT NULL,
+        staff_id INT NOT NULL,
+        counterparty_id INT NOT NULL,
+        units_sold INT NOT NULL,
+        unit_price NUMERIC(10, 2) NOT NULL,
+        currency_id INT NOT NULL,
+        agreed_delivery_date VARCHAR NOT NULL,
+        agreed_payment_date VARCHAR NOT NULL,
+        agreed_delivery_location_id INT NOT NULL
+    )""",
+    """CREATE TABLE purchase_order (
+        purchase_order_id SERIAL PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL,
+        staff_id INT NOT NULL,
+        counterparty_id INT NOT NULL,
+        item_code VARCHAR NOT NULL,
+        item_quantity INT NOT NULL,
+        item_unit_price NUMERIC NOT NULL,
+        currency_id INT NOT NULL,
+        agreed_delivery_date VARCHAR NOT NULL,
+        agreed_payment_date VARCHAR NOT NULL,
+        agreed_delivery_location_id INT NOT NULL
+    )""",
+    """CREATE TABLE transaction (
+        transaction_id SERIAL PRIMARY KEY,
+        transaction_type VARCHAR NOT NULL,
+        sales_order_id INT,
+        purchase_order_id INT,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE payment (
+        payment_id SERIAL PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        last_updated TIMESTAMP NOT NULL,
+        transaction_id INT NOT NULL,
+        counterparty_id INT NOT NULL,
+        payment_amount NUMERIC NOT NULL,
+        currency_id INT NOT NULL,
+        payment_type_id INT NOT NULL,
+        paid BOOLEAN NOT NULL,
+        payment_date VARCHAR NOT NULL,
+        company_ac_number INT NOT NULL,
+        counterparty_ac_number INT NOT NULL
+    )""",
+]
+
+TABLES = [
+    "currency",
+    "department",
+    "staff",
+    "address",
+    "counterparty",
+    "design",
+    "payment_type",
+    "sales_order",
+    "purchase_order",
+    "transaction",
+    "payment",
+]
+
+# created_at is spread over this period, 10% of rows get a later last_updated
+START = "2022-11-03 14:20:49.962"
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+
+TIMESTAMPS = (
+    f"TIMESTAMP '{START}' + (g * {SPAN_SECONDS}.0 / {{n}}) * INTERVAL '1 second'"
+)
+
+
+def table_sizes(rows):
+    """
+    Returns the number of rows generated for each table when sales_order has `rows` rows.
+    Reference tables grow slowly with the scale, the transactional tables in proportion.
+    """
+
+    return {
+        "currency": 3,
+        "department": 8,
+        "staff": max(20, rows // 5000),
+        "address": max(30, rows // 1000),
+        "counterparty": max(20, rows // 2000),
+        "design": max(10, rows // 2000),
+        "payment_type": 4,
+        "sales_order": rows,
+        "purchase_order": max(1, rows // 2),
+        "transaction": rows + max(1, rows // 2),
+        "payment": rows + max(1, rows // 2),
+    }
+
+
+def populate_queries(sizes):
+    """Returns the INSERT ... SELECT FROM generate_series statements filling each table."""
+
+    def ts(table):
+        return TIMESTAMPS.format(n=sizes[table])
+
+    def last_updated(table):
+        return (
+            f"{ts(table)} + CASE WHEN random() < 0.1 "
+            f"THEN random() * INTERVAL '30 days' ELSE INTERVAL '0' END"
+        )
+
+    def pick(table):
+        return f"1 + floor(random() * {sizes[table]})::int"
+
+    return {
+        "currency": f"""
+            INSERT INTO currency (currency_code, created_at, last_updated)
+            SELECT (ARRAY['GBP', 'USD', 'EUR'])[g], {ts('currency')}, {ts('currency')}
+            FROM generate_series(1, 3) g""",
+        "department": f"""
+            INSERT INTO department (department_name, location, manager, created_at, last_updated)
+            SELECT (ARRAY['Sales', 'Purchasing', 'Production', 'Dispatch', 'Finance',
+                          'Facilities', 'Communications', 'HR'])[g],
+                   (ARRAY['Manchester', 'Leeds', 'Leeds', 'Leds', 'Manchester',
+                          'Manchester', 'Leeds', 'Manchester'])[g],
+                   'Manager ' || g, {ts('department')}, {ts('department')}
+            FROM generate_series(1, 8) g""",
+        "staff": f"""
+            INSERT INTO staff (first_name, last_name, department_id, email_address,
+                               created_at, last_updated)
+            SELECT 'First' || g, 'Last' || g, 1 + g % 8,
+                   'first' || g || '.last@terrifictotes.com',
+                   {ts('staff')}, {last_updated('staff')}
+            FROM generate_series(1, {sizes['staff']}) g""",
+        "address": f"""
+            INSERT INTO address (address_line_1, address_line_2, district, city,
+                                 postal_code, country, phone, created_at, last_updated)
+            SELECT g || ' Alexie Cliffs', CASE WHEN g % 3 = 0 THEN 'Flat ' || g END,
+                   CASE WHEN g % 2 = 0 THEN 'District ' || g % 50 END,
+                   'City ' || g % 500, lpad((g % 99999)::text, 5, '0'),
+                   'Country ' || g % 120, '1803 ' || lpad((g % 999999)::text, 6, '0'),
+                   {ts('address')}, {last_updated('address')}
+            FROM generate_series(1, {sizes['address']}) g""",
+        "counterparty": f"""
+            INSERT INTO counterparty (counterparty_legal_name, legal_address_id,
+                                      commercial_contact, delivery_contact,
+                                      created_at, last_updated)
+            SELECT 'Counterparty ' || g || ' Ltd', {pick('address')},
+                   'Contact ' || g, 'Delivery ' || g,
+                   {ts('counterparty')}, {last_updated('counterparty')}
+            FROM generate_series(1, {sizes['counterparty']}) g""",
+        "design": f"""
+            INSERT INTO design (created_at, design_name, file_location, file_name,
+                                last_updated)
+            SELECT {ts('design')}, 'Design ' || g, '/usr/share/design' || g % 20,
+                   'design-' || md5(g::text) || '.json', {last_updated('design')}
+            FROM generate_series(1, {sizes['design']}) g""",
+        "payment_type": f"""
+            INSERT INTO payment_type (payment_type_name, created_at, last_updated)
+            SELECT (ARRAY['SALES_RECEIPT', 'SALES_REFUND', 'PURCHASE_PAYMENT',
+                          'PURCHASE_REFUND'])[g], {ts('payment_type')}, {ts('payment_type')}
+            FROM generate_series(1, 4) g""",
+        "sales_order": f"""
+            INSERT INTO sales_order (created_at, last_updated, design_id, staff_id,
+                                     counterparty_id, units_sold, unit_price, currency_id,
+                                     agreed_delivery_date, agreed_payment_date,
+                                     agreed_delivery_location_id)
+            SELECT {ts('sales_order')}, {last_updated('sales_order')},
+                   {pick('design')}, {pick('staff')}, {pick('counterparty')},
+                   1000 + floor(random() * 99000)::int,
+                   round((2 + random() * 2)::numeric, 2), 1 + g % 3,
+                   to_char({ts('sales_order')} + INTERVAL '5 days', 'YYYY-MM-DD'),
+                   to_char({ts('sales_order')} + INTERVAL '7 days', 'YYYY-MM-DD'),
+                   {pick('address')}
+            FROM generate_series(1, {sizes['sales_order']}) g""",
+        "purchase_order": f"""
+            INSERT INTO purchase_order (created_at, last_updated, staff_id, counterparty_id,
+                                        item_code, item_quantity, item_unit_price,
+                                        currency_id, agreed_delivery_date,
+                                        agreed_payment_date, agreed_delivery_location_id)
+            SELECT {ts('purchase_order')}, {last_updated('purchase_order')},
+                   {pick('staff')}, {pick('counterparty')}, upper(substr(md5(g::text), 1, 7)),
+                   1 + floor(random() * 1000)::int, round((random() * 1000)::numeric, 2),
+                   1 + g % 3,
+                   to_char({ts('purchase_order')} + INTERVAL '3 days', 'YYYY-MM-DD'),
+                   to_char({ts('purchase_order')} + INTERVAL '4 days', 'YYYY-MM-DD'),
+                   {pick('address')}
+            FROM generate_series(1, {sizes['purchase_order']}) g""",
+        "transaction": f"""
+            INSERT INTO transaction (transaction_type, sales_order_id, purchase_order_id,
+                                     created_at, last_updated)
+            SELECT CASE WHEN g <= {sizes['sales_order']} THEN 'SALE' ELSE 'PURCHASE' END,
+                   CASE WHEN g <= {sizes['sales_order']} THEN g END,
+                   CASE WHEN g > {sizes['sales_order']} THEN g - {sizes['sales_order']} END,
+                   {ts('transaction')}, {last_updated('transaction')}
+            FROM generate_series(1, {sizes['transaction']}) g""",
+        "payment": f"""
+            INSERT INTO payment (created_at, last_updated, transaction_id, counterparty_id,
+                                 payment_amount, currency_id, payment_type_id, paid,
+                                 payment_date, company_ac_number, counterparty_ac_number)
+            SELECT {ts('payment')}, {last_updated('payment')}, g, {pick('counterparty')},
+                   round((random() * 100000)::numeric, 2), 1 + g % 3, 1 + g % 4,
+                   random() < 0.5, to_char({ts('payment')}, 'YYYY-MM-DD'),
+                   floor(random() * 99999999)::int, floor(random() * 99999999)::int
+            FROM generate_series(1, {sizes['payment']}) g""",
+    }
+
+
+def generate(conn, rows, seed=0.42, with_indexes=True):
+    """
+    Drops and recreates the ToteSys tables and fills them with synthetic data.
+    Rows are generated inside PostgreSQL with generate_series, so even 50M rows only
+    take as long as the database needs to write them.
+
+    Args:
+        conn: a connection to the benchmark database
+        rows (int): number of sales_order rows, the other tables are scaled from it
+        seed (float): seed for PostgreSQL's random(), so runs are repeatable
+        with_indexes (bool): create (last_updated, primary key) indexes used by the
+            watermark queries of the extract
+    Returns:
+        dict: number of rows generated for each table
+    """
+
+    sizes = table_sizes(rows)
+    queries = populate_queries(sizes)
+
+    for table in reversed(TABLES):
+        conn.run(f"DROP TABLE IF EXISTS {table}")
+    for statement in SCHEMA:
+        conn.run(statement)
+
+    conn.run(f"SELECT setseed({float(seed)})")
+    for table in TABLES:
+        started = time.perf_counter()
+        conn.run(queries[table])
+        logger.info(
+            f"Generated {sizes[table]} rows for {table} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    if with_indexes:
+        for table in TABLES:
+            conn.run(
+                f"CREATE INDEX {table}_last_updated_idx "
+                f"ON {table} (last_updated, {table}_id)"
+            )
+    conn.run("ANALYZE")
+
+    return sizes
+
+
+def connect_from_args(args):
+    """Opens a connection to the benchmark database from command line arguments."""
+    return Connection(
+        user=args.user,
+        password=args.password,
+        host=args.host,
+        port=args.port,
+        database=args.database,
+    )
+
+
+def add_connection_arguments(parser):
+    """Adds the database connection options shared by the benchmark scripts."""
+    parser.add_argument("--host", default=os.environ.get("PGHOST", "localhost"))
+    parser.add_argument(
+        "--port", type=int, default=int(os.environ.get("PGPORT", "5432"))
+    )
+    parser.add_argument("--user", default=os.environ.get("PGUSER", "postgres"))
+    parser.add_argument("--password", default=os.environ.get("PGPASSWORD", "postgres"))
+    parser.add_argument(
+        "--database", default=os.environ.get("PGDATABASE", "totesys_bench")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill a local PostgreSQL database with synthetic ToteSys data."
+    )
+    add_connection_arguments(parser)
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=10000,
+        help="rows in sales_order (10k to 50M), the other tables are scaled from it",
+    )
+    parser.add_argument("--seed", type=float, default=0.42)
+    parser.add_argument(
+        "--no-indexes",
+        action="store_true",
+        help="skip the (last_updated, primary key) indexes",
+    )
+    args = parser.parse_args()
+
+    conn = connect_from_args(args)
+    conn.autocommit = True
+    try:
+        sizes = generate(conn, args.rows, args.seed, not args.no_indexes)
+    finally:
+        conn.close()
+    logger.info(f"Generated {sum(sizes.values())} rows in total")
+
+
+if __name__ == "__main__":
+    main()
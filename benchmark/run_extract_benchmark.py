@@ -0,0 +1,352 @@
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from generate_totesys import (
+    add_connection_arguments,
+    connect_from_args,
+    generate,
+    table_sizes,
+)
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_PATHS = [os.path.join(ROOT, "src", folder) for folder in ("extract", "common")]
+
+DATA_BUCKET = "banana-squad-ingested-data"
+CODE_BUCKET = "banana-squad-code"
+REGION = "eu-west-2"
+
+# Metrics compared against a baseline, and whether a higher value is better
+METRICS = {"rows_per_second": True, "mb_per_second": True, "peak_rss_mb": False}
+
+
+def scenarios(modes, formats, workers, upload_workers=(0,)):
+    """
+    Returns every combination of extract mode, output format, worker count and upload
+    worker count, leaving out COPY with Parquet which the extract does not support and
+    upload workers for the buffered mode which does not use them.
+    """
+    return [
+        {
+            "mode": mode,
+            "format": output_format,
+            "workers": worker_count,
+            "upload_workers": upload_worker_count,
+        }
+        for mode, output_format, worker_count, upload_worker_count in itertools.product(
+            modes, formats, workers, upload_workers
+        )
+        if not (mode == "copy" and output_format == "parquet")
+        and not (mode == "buffered" and upload_worker_count)
+    ]
+
+
+def scenario_name(scenario):
+    return (
+        f"{scenario['mode']}-{scenario['format']}-{scenario['workers']}w"
+        f"-{scenario['upload_workers']}u"
+    )
+
+
+def prepare_aws(endpoint, database):
+    """Creates the buckets and the database_credentials secret the extract Lambda expects."""
+    import boto3
+
+    s3_client = boto3.client("s3", endpoint_url=endpoint, region_name=REGION)
+    for bucket in (DATA_BUCKET, CODE_BUCKET):
+        s3_client.create_bucket(
+            Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": REGION}
+        )
+
+    secrets_client = boto3.client(
+        "secretsmanager", endpoint_url=endpoint, region_name=REGION
+    )
+    secrets_client.create_secret(
+        Name="database_credentials", SecretString=json.dumps(database)
+    )
+
+
+def clear_aws(endpoint):
+    """Empties both buckets and deletes the secret, so the next scenario starts clean."""
+    import boto3
+
+    s3 = boto3.resource("s3", endpoint_url=endpoint, region_name=REGION)
+    for bucket in (DATA_BUCKET, CODE_BUCKET):
+        s3.Bucket(bucket).objects.all().delete()
+        s3.Bucket(bucket).delete()
+
+    secrets_client = boto3.client(
+        "secretsmanager", endpoint_url=endpoint, region_name=REGION
+    )
+    secrets_client.delete_secret(
+        SecretId="database_credentials", ForceDeleteWithoutRecovery=True
+    )
+
+
+def ingested_bytes(s3_client):
+    """Returns the total size of the files stored in the ingested data bucket."""
+    total = 0
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=DATA_BUCKET):
+        total += sum(obj["Size"] for obj in page.get("Contents", []))
+    return total
+
+
+def run_scenario(scenario, endpoint, database, rows, updates, results):
+    """
+    Runs one benchmark scenario in a fresh process, so module level caches, imports and
+    the peak RSS measurement are not shared between scenarios.
+    The extract Lambda handler runs an initial extract, then, when updates is set, a
+    continuous extract after touching that many sales_order rows.
+    """
+    import resource
+
+    os.environ.update(
+        {
+            "EXTRACT_MODE": scenario["mode"],
+            "EXTRACT_FORMAT": scenario["format"],
+            "EXTRACT_WORKERS": str(scenario["workers"]),
+            "EXTRACT_UPLOAD_WORKERS": str(scenario["upload_workers"]),
+            "AWS_ENDPOINT_URL": endpoint,
+            "AWS_DEFAULT_REGION": REGION,
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+        }
+    )
+    sys.path[:0] = SOURCE_PATHS
+
+    import boto3
+    from pg8000.native import Connection
+    from extract import lambda_handler
+    from table_policies import is_table_due
+
+    prepare_aws(endpoint, database)
+    s3_client = boto3.client("s3", region_name=REGION)
+
+    result = {"scenario": scenario_name(scenario), **scenario}
+    try:
+        started = time.perf_counter()
+        report = lambda_handler({}, None)
+        seconds = time.perf_counter() - started
+        if report["result"] != "Success":
+            raise RuntimeError(report.get("error", report))
+
+        size = ingested_bytes(s3_client)
+        # the initial extract leaves out the tables its policies skip
+        now = time.time()
+        total_rows = sum(
+            size
+            for table, size in table_sizes(rows).items()
+            if is_table_due(table, {}, now)
+        )
+        result.update(
+            {
+                "initial_seconds": round(seconds, 3),
+                "rows": total_rows,
+                "megabytes": round(size / 2**20, 3),
+                "rows_per_second": round(total_rows / seconds, 1),
+                "mb_per_second": round(size / 2**20 / seconds, 3),
+            }
+        )
+
+        if updates:
+            conn = Connection(**database)
+            conn.run(
+                "UPDATE sales_order SET last_updated = clock_timestamp(), "
+                "units_sold = units_sold + 1 WHERE sales_order_id <= :updates",
+                updates=updates,
+            )
+            conn.close()
+
+            started = time.perf_counter()
+            report = lambda_handler({}, None)
+            seconds = time.perf_counter() - started
+            if report["result"] != "Success":
+                raise RuntimeError(report.get("error", report))
+            result["continuous_seconds"] = round(seconds, 3)
+            result["continuous_rows"] = updates
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        clear_aws(endpoint)
+
+    # ru_maxrss is in kilobytes on Linux
+    result["peak_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    results.put(result)
+
+
+def run_benchmark(scenario_list, endpoint, database, rows, updates=0):
+    """Runs each scenario in its own spawned process and returns their results."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    collected = []
+
+    for scenario in scenario_list:
+        logger.info(f"Running {scenario_name(scenario)}")
+        process = context.Process(
+            target=run_scenario,
+            args=(scenario, endpoint, database, rows, updates, results),
+        )
+        process.start()
+        process.join()
+        if results.empty():
+            result = {
+                "scenario": scenario_name(scenario),
+                **scenario,
+                "error": f"process exited with code {process.exitcode}",
+            }
+        else:
+            result = results.get()
+        logger.info(json.dumps(result))
+        collected.append(result)
+
+    return collected
+
+
+def find_regressions(results, baseline, tolerance, metrics=METRICS):
+    """
+    Compares results with a previous run of the benchmark.
+
+    Args:
+        results (list): results of this run
+        baseline (list): results of the run to compare against
+        tolerance (float): allowed relative change, e.g. 0.1 for 10%
+        metrics (dict): metric name -> whether a higher value is better
+    Returns:
+        list: a message for every metric that got worse by more than the tolerance
+    """
+    previous = {result["scenario"]: result for result in baseline}
+    regressions = []
+
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        if "error" in result and "error" not in before:
+            regressions.append(f"{result['scenario']}: failed with {result['error']}")
+            continue
+        for metric, higher_is_better in metrics.items():
+            if metric not in result or not before.get(metric):
+                continue
+            change = (result[metric] - before[metric]) / before[metric]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{result['scenario']}: {metric} {before[metric]} -> {result[metric]}"
+                )
+
+    return regressions
+
+
+def start_s3_server(port):
+    """Starts moto's server in this process as a local stand-in for S3 and Secrets Manager."""
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(port=port)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the extract Lambda against a local PostgreSQL database."
+    )
+    add_connection_arguments(parser)
+    parser.add_argument("--rows", type=int, default=10000, help="sales_order rows")
+    parser.add_argument(
+        "--skip-generate",
+        action="store_true",
+        help="reuse the data already in the database, --rows must match it",
+    )
+    parser.add_argument("--modes", nargs="+", default=["buffered", "stream", "copy"])
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4])
+    parser.add_argument(
+        "--upload-workers",
+        nargs="+",
+        type=int,
+        default=[0, 2],
+        help="threads uploading S3 parts while rows are read, 0 for none",
+    )
+    parser.add_argument(
+        "--updates",
+        type=int,
+        default=0,
+        help="sales_order rows updated before a continuous extract, 0 to skip it",
+    )
+    parser.add_argument(
+        "--s3-endpoint",
+        help="S3 compatible endpoint (e.g. MinIO or LocalStack), starts moto when not set",
+    )
+    parser.add_argument("--moto-port", type=int, default=5055)
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument(
+        "--baseline", help="results of an earlier run to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change in a metric reported as a regression",
+    )
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        conn = connect_from_args(args)
+        conn.autocommit = True
+        try:
+            generate(conn, args.rows)
+        finally:
+            conn.close()
+
+    server = None
+    endpoint = args.s3_endpoint
+    if endpoint is None:
+        server, endpoint = start_s3_server(args.moto_port)
+
+    database = {
+        "user": args.user,
+        "password": args.password,
+        "host": args.host,
+        "port": args.port,
+        "database": args.database,
+    }
+    try:
+        results = run_benchmark(
+            scenarios(args.modes, args.formats, args.workers, args.upload_workers),
+            endpoint,
+            database,
+            args.rows,
+            args.updates,
+        )
+    finally:
+        if server is not None:
+            server.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import boto3
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+# Module level state lives as long as the Lambda container, so it is shared by every
+# warm invocation of the same container
+SECRET_TTL_SECONDS = 300
+
+secret_cache = {}
+secret_cache_lock = threading.Lock()
+
+client_cache = {}
+client_cache_lock = threading.Lock()
+
+
+def get_secret(secret_name, region_name="eu-west-2", ttl=None):
+    """
+    Retrieves a secret from AWS Secrets Manager.
+    The secret is cached for ttl seconds, so warm invocations of a Lambda skip the
+    Secrets Manager round trip.
+
+    Args:
+        secret_name (str): The name of the secret in Secrets Manager
+        region_name (str): The AWS region where the Secrets Manager is hosted
+        ttl (int): Seconds the secret is cached for, defaults to SECRET_TTL_SECONDS
+    Returns:
+        dict: A dictionary of the secret values.
+    """
+    ttl = SECRET_TTL_SECONDS if ttl is None else ttl
+
+    with secret_cache_lock:
+        cached = secret_cache.get(secret_name)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    logger.info("Fetching database secrets...")
+    try:
+        client = boto3.client("secretsmanager", region_name=region_name)
+        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
+
+        if "SecretString" in get_secret_value_response:
+            secret = json.loads(get_secret_value_response["SecretString"])
+        else:
+            raise ValueError("Secret is stored as binary; function expects JSON.")
+    except Exception as e:
+        logger.error(f"Failed to retrieve secret: {e}")
+        raise RuntimeError(f"Failed to retrieve secret: {e}")
+
+    with secret_cache_lock:
+        secret_cache[secret_name] = (time.monotonic() + ttl, secret)
+    return secret
+
+
+def invalidate_secret(secret_name=None):
+    """Removes a secret from the cache (all secrets when no name is given), so the next
+    get_secret call fetches it from Secrets Manager again."""
+    with secret_cache_lock:
+        if secret_name is None:
+            secret_cache.clear()
+        else:
+            secret_cache.pop(secret_name, None)
+
+
+def get_client(create_fn):
+    """
+    Returns the client made by create_fn, calling create_fn only the first time it is
+    asked for in this Lambda container, so warm invocations reuse the client and its
+    open HTTP connections instead of building a new one. boto3 clients are thread safe,
+    so one client is shared by every thread. A create_fn that raises is not cached.
+
+    Args:
+        create_fn: function returning a new client, e.g. create_s3_client
+    Returns:
+        the cached client
+    """
+    with client_cache_lock:
+        if create_fn not in client_cache:
+            client_cache[create_fn] = create_fn()
+        return client_cache[create_fn]
+
+
+def clear_clients():
+    """Removes every cached client, so the next get_client call creates a new one."""
+    with client_cache_lock:
+        client_cache.clear()
+
+
+class ConnectionHolder:
+    """
+    Keeps one database connection open across warm invocations of a Lambda container.
+
+    get() checks the held connection is still alive with a cheap query and opens a new
+    one when it is not, so callers should not close the connection they are given; call
+    discard() instead when it may be left in a bad state. When opening a connection fails
+    and a secret name is given, the cached secret is dropped and the connection is tried
+    once more, in case the credentials have been rotated.
+
+    Args:
+        connect_fn: function opening a new connection
+        secret_name (str): name of the secret holding the connection's credentials
+    """
+
+    def __init__(self, connect_fn, secret_name=None):
+        self.connect_fn = connect_fn
+        self.secret_name = secret_name
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.conn is not None:
+                try:
+                    self.conn.run("SELECT 1")
+                    return self.conn
+                except Exception as e:
+                    logger.info(f"Cached connection is not usable, reconnecting: {e}")
+                    self.close_connection()
+
+            self.conn = self.open_connection()
+            return self.conn
+
+    def discard(self):
+        with self.lock:
+            self.close_connection()
+
+    def open_connection(self):
+        try:
+            return self.connect_fn()
+        except Exception:
+            if self.secret_name is None:
+                raise
+            invalidate_secret(self.secret_name)
+            return self.connect_fn()
+
+    def close_connection(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception as e:
+                logger.info(f"Error closing cached connection: {e}")
+        self.conn = None
@@ -0,0 +1,169 @@
+import json
+import os
+
+# Source tables each transform function reads, in the order they are passed to it.
+# The transform Lambda builds its transformations from this, and the extract Lambda
+# uses it to leave out tables no transform reads.
+TRANSFORM_SOURCES = {
+    "fact_sales_order": ["sales_order"],
+    "dim_counterparty": ["counterparty", "address"],
+    "dim_currency": ["currency"],
+    "dim_location": ["address"],
+    "dim_design": ["design"],
+    "dim_staff": ["staff", "department"],
+}
+
+# Column the extract adds to the rows of a source from EXTRACT_SOURCES, holding its id.
+# Every ToteSys database numbers its rows from 1, so the transforms key the rows of
+# several sources on it as well as on their primary keys.
+SOURCE_COLUMN = "source_id"
+
+# Columns each transform reads from its source tables. A table left out, or given None,
+# is read in full. The extract selects the union of these columns (plus the primary key
+# and last_updated it keeps its watermarks on) instead of every column.
+TRANSFORM_COLUMNS = {
+    "fact_sales_order": {"sales_order": None},
+    "dim_counterparty": {
+        "counterparty": [
+            "counterparty_id",
+            "counterparty_legal_name",
+            "legal_address_id",
+        ],
+        "address": [
+            "address_id",
+            "address_line_1",
+            "address_line_2",
+            "district",
+            "city",
+            "postal_code",
+            "country",
+            "phone",
+        ],
+    },
+    "dim_currency": {"currency": ["currency_id", "currency_code"]},
+    "dim_location": {
+        "address": [
+            "address_id",
+            "address_line_1",
+            "address_line_2",
+            "district",
+            "city",
+            "postal_code",
+            "country",
+            "phone",
+        ],
+    },
+    "dim_design": {
+        "design": ["design_id", "design_name", "file_location", "file_name"]
+    },
+    "dim_staff": {
+        "staff": [
+            "staff_id",
+            "first_name",
+            "last_name",
+            "department_id",
+            "email_address",
+        ],
+        "department": ["department_id", "department_name", "location"],
+    },
+}
+
+# refresh_seconds: minimum time between two extracts of the table, 0 for every run
+# mode: "incremental" extracts rows changed after the table's watermark, "full" the
+#       whole table every time it is refreshed, "checksum" the rows whose hash changed,
+#       found through checksums of primary key buckets, for tables whose last_updated
+#       can not be trusted
+# bucket_size: primary key values per checksum bucket in "checksum" mode
+# skip_if_unconsumed: leave the table out when no transform reads it
+# project_columns: only extract the columns listed in TRANSFORM_COLUMNS
+# partitions: number of primary key ranges every page is split into, each read on its
+#       own connection and stored as its own part file
+DEFAULT_TABLE_POLICY = {
+    "refresh_seconds": 0,
+    "mode": "incremental",
+    "bucket_size": 10000,
+    "skip_if_unconsumed": True,
+    "project_columns": True,
+    "partitions": 1,
+}
+
+# Tables that differ from the default. Reference data hardly ever changes, so it is
+# only checked once a day, and sales_order, by far the largest table, is read in parts.
+TABLE_POLICIES = {
+    "currency": {"refresh_seconds": 24 * 60 * 60},
+    "department": {"refresh_seconds": 24 * 60 * 60},
+    "sales_order": {"partitions": 4},
+}
+
+# JSON object of table name -> policy fields, merged over TABLE_POLICIES, e.g.
+# {"payment": {"skip_if_unconsumed": false}}
+EXTRACT_TABLE_POLICIES = json.loads(os.environ.get("EXTRACT_TABLE_POLICIES", "{}"))
+
+
+def get_consumed_tables():
+    """Returns the names of the tables read by at least one transform."""
+    return {table for sources in TRANSFORM_SOURCES.values() for table in sources}
+
+
+def get_table_policy(table):
+    """
+    Returns the extract policy of a table: DEFAULT_TABLE_POLICY, updated with the
+    table's entries in TABLE_POLICIES and then EXTRACT_TABLE_POLICIES.
+    """
+
+    return {
+        **DEFAULT_TABLE_POLICY,
+        **TABLE_POLICIES.get(table, {}),
+        **EXTRACT_TABLE_POLICIES.get(table, {}),
+    }
+
+
+def is_table_due(table, refreshed_at, now):
+    """
+    Checks whether a table's policy lets it be extracted now.
+
+    Args:
+        table (str): table name
+        refreshed_at (dict): table name -> time.time() of the table's last extract
+        now (float): time.time() of this extract
+    Returns:
+        bool: False when no transform reads the table and the policy skips unconsumed
+            tables, or when the table was extracted less than refresh_seconds ago
+    """
+
+    policy = get_table_policy(table)
+    if policy["skip_if_unconsumed"] and table not in get_consumed_tables():
+        return False
+    last_refresh = refreshed_at.get(table)
+    return last_refresh is None or now - last_refresh >= policy["refresh_seconds"]
+
+
+def get_extract_columns(table, primary_key):
+    """
+    Returns the columns of a table the transforms read, plus the primary key and
+    last_updated the extract keeps its watermarks on.
+
+    Args:
+        table (str): table name
+        primary_key (str): primary key column of the table
+    Returns:
+        list: column names, or None when every column is needed, i.e. when a transform
+            reads the whole table, no transform reads it, or its policy turns
+            projection off
+    """
+
+    if not get_table_policy(table)["project_columns"]:
+        return None
+
+    columns = [primary_key, "last_updated"]
+    consumed = False
+    for transform, sources in TRANSFORM_SOURCES.items():
+        if table not in sources:
+            continue
+        consumed = True
+        transform_columns = TRANSFORM_COLUMNS.get(transform, {}).get(table)
+        if transform_columns is None:
+            return None
+        columns.extend(column for column in transform_columns if column not in columns)
+
+    return columns if consumed else None
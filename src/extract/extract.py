@@ -1,172 +1,1381 @@
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pg8000.exceptions import InterfaceError, DatabaseError
+from pg8000.native import literal
 from botocore.exceptions import NoCredentialsError, ClientError
 from util_functions import (
+    DATABASE_SECRET,
     connect,
+    get_connection,
+    discard_connection,
+    get_client,
     create_s3_client,
     create_file_name,
     format_to_csv,
+    format_to_parquet,
     store_in_s3,
+    stream_query,
+    copy_query,
+    connection_pool,
+    borrowed_connections,
+    get_tables,
+    get_high_water_mark,
+    get_key_slices,
+    get_bucket_checksums,
+    get_changed_buckets,
+    get_row_hashes,
+    get_changed_rows,
+    get_page_end,
+    keyset_window,
+    load_manifest,
+    save_manifest,
+    load_row_hashes,
+    save_row_hashes,
+    get_change_counters,
+    get_unchanged_tables,
+    get_live_rows,
+    plan_table_strategy,
+    update_extract_history,
+    start_snapshot,
+    export_snapshot,
+    join_snapshot,
+    try_extract_lock,
+    release_extract_lock,
+    get_deadline,
+    invoke_continuation,
+    install_change_triggers,
+    listen_for_changes,
+    stop_listening_for_changes,
+    wait_for_changes,
+    ExtractCheckpoint,
+    S3StreamWriter,
+    UploadPipeline,
+)
+from table_policies import (
+    SOURCE_COLUMN,
+    get_table_policy,
+    is_table_due,
+    get_extract_columns,
 )
 import logging
 import json
+import os
+import time
 
 data_bucket = "banana-squad-ingested-data"
 code_bucket = "banana-squad-code"
+watermarks_file = "watermarks.json"
+change_counters_file = "change_counters.json"
+checkpoint_file = "initial_extract_checkpoint.json"
+refresh_times_file = "refresh_times.json"
+checksums_file = "checksums.json"
+row_hashes_prefix = "row_hashes"
+history_file = "extract_history.json"
+
+# "buffered" holds each table in memory and uploads it with one put_object call,
+# "stream" fetches batches from a server-side cursor into an S3 multipart upload,
+# "copy" streams the server's own CSV from COPY ... TO STDOUT into the multipart upload
+EXTRACT_MODE = os.environ.get("EXTRACT_MODE", "buffered")
+# "csv", or "parquet" for snappy compressed Parquet keeping the source column types
+# (Parquet is written from rows, so it works with the buffered and stream modes)
+EXTRACT_FORMAT = os.environ.get("EXTRACT_FORMAT", "csv")
+EXTRACT_BATCH_SIZE = int(os.environ.get("EXTRACT_BATCH_SIZE", "10000"))
+# Rows per keyset page, every page is stored as its own file
+EXTRACT_PAGE_SIZE = int(os.environ.get("EXTRACT_PAGE_SIZE", "500000"))
+# Upper bound on tables extracted at once, each worker holds its own connection
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "1"))
+# Seconds before the Lambda timeout after which an initial extract starts no new page,
+# it saves a checkpoint and continues in a new invocation instead
+EXTRACT_DEADLINE_MARGIN = int(os.environ.get("EXTRACT_DEADLINE_MARGIN", "30"))
+# A checkpoint saved less than this many seconds ago belongs to an initial extract
+# still running, so scheduled invocations leave it to the continuation invocations
+EXTRACT_CHECKPOINT_LEASE = int(os.environ.get("EXTRACT_CHECKPOINT_LEASE", "300"))
+# Threads uploading the parts written by the "stream" and "copy" modes while the next
+# rows are read, 0 uploads every part from the reading thread
+EXTRACT_UPLOAD_WORKERS = int(os.environ.get("EXTRACT_UPLOAD_WORKERS", "0"))
+# Parts queued or uploading at once (each up to 8MiB), shared by all tables
+EXTRACT_UPLOAD_QUEUE = int(os.environ.get("EXTRACT_UPLOAD_QUEUE", "4"))
+# Channel the change triggers (see install_change_triggers) notify on
+EXTRACT_NOTIFY_CHANNEL = os.environ.get("EXTRACT_NOTIFY_CHANNEL", "totesys_changes")
+# Seconds a listening invocation keeps collecting notifications after the first one
+# before it extracts the tables notified
+EXTRACT_NOTIFY_WINDOW = float(os.environ.get("EXTRACT_NOTIFY_WINDOW", "5"))
+# JSON list of the ToteSys databases to extract, each with an id tagging its files and
+# the secret holding its credentials, e.g.
+# [{"id": "eu", "secret": "totesys_eu"}, {"id": "us", "secret": "totesys_us"}]
+# Empty for the single database behind the database_credentials secret
+EXTRACT_SOURCES = json.loads(os.environ.get("EXTRACT_SOURCES", "[]"))
+# Upper bound on sources extracted at once, each with its own EXTRACT_WORKERS tables
+EXTRACT_SOURCE_WORKERS = int(os.environ.get("EXTRACT_SOURCE_WORKERS", "4"))
+# "1" lets continuous extracts read the changes of incremental tables in one full scan
+# when the planner (see plan_table_strategy) finds that cheaper than paging through the
+# keyset index, "0" always reads them page by page
+EXTRACT_PLANNER = os.environ.get("EXTRACT_PLANNER", "1") == "1"
+# Seconds per row of a full extract, used until a table's own cost has been measured
+EXTRACT_FULL_ROW_SECONDS = float(os.environ.get("EXTRACT_FULL_ROW_SECONDS", "0.00002"))
+# How much more reading a row through the keyset index costs than in a full scan
+EXTRACT_INCREMENTAL_COST_RATIO = float(
+    os.environ.get("EXTRACT_INCREMENTAL_COST_RATIO", "4")
+)
+
+upload_pipeline = (
+    UploadPipeline(EXTRACT_UPLOAD_WORKERS, EXTRACT_UPLOAD_QUEUE)
+    if EXTRACT_UPLOAD_WORKERS
+    else None
+)
 
 logging.basicConfig(
     level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
 
-def initial_extract(s3_client, conn):
+def source_id(source):
+    """Returns the id of a source from EXTRACT_SOURCES, None for the single database setup."""
+    return source["id"] if source else None
+
+
+def source_secret(source):
+    """Returns the name of the secret holding the credentials of a source's database."""
+    return source["secret"] if source else DATABASE_SECRET
+
+
+def source_key(source, file_name):
+    """Returns the key a source's manifest file is stored under in the code bucket, so
+    every source keeps its own watermarks, counters and checkpoint."""
+    return f"{source['id']}/{file_name}" if source else file_name
+
+
+def row_hashes_key(source, table, bucket):
+    """Returns the key the row hashes of one checksum bucket of a table are stored under
+    in the code bucket, see save_row_hashes."""
+    return source_key(source, f"{row_hashes_prefix}/{table}/{bucket}.json")
+
+
+def get_select_list(table, primary_key, source=None):
+    """Returns the SELECT list extracting a table: the columns the transforms read (see
+    get_extract_columns), and for a source from EXTRACT_SOURCES its id as SOURCE_COLUMN,
+    as the primary keys of several ToteSys databases overlap."""
+    columns = get_extract_columns(table, primary_key)
+    select_list = ", ".join(columns) if columns else "*"
+    if source:
+        select_list += f", {literal(source_id(source))}::text AS {SOURCE_COLUMN}"
+    return select_list
+
+
+def extract_table(
+    s3_client, conn, table, query, mode=None, output_format=None, part=None, source=None
+):
     """
-    Function to run an initial extract of all data currently in the ToteSys database and stores in an S3 bucket.
-    - runs query to find all table names in db
-    - creates file name using create_file_name util function
-    - runs query to select all data from each table
-    - converts data to csv format
-    - stores csv file in S3 bucket
+    Function runs a query for a single table and stores the result in the ingested S3 bucket.
+    - creates file name using create_file_name util function, with a .csv or .parquet extension
+    - in "buffered" mode, holds all rows in memory and uploads them with store_in_s3
+    - in "stream" mode, fetches rows in batches of EXTRACT_BATCH_SIZE from a server-side
+      cursor and uploads them through an S3 multipart upload
+    - in "copy" mode, runs the query through COPY ... TO STDOUT WITH CSV HEADER and
+      uploads the server's CSV bytes through an S3 multipart upload
+    - with EXTRACT_UPLOAD_WORKERS set, the parts of "stream" and "copy" uploads are sent
+      by upload_pipeline while the next rows are read
+    - files are CSV, or Parquet with the source column types (see EXTRACT_FORMAT)
+    - nothing is stored when the query returns no rows
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            conn: a connection to the ToteSys database
+            table: name of the table being extracted
+            query: SELECT statement returning the rows to extract
+            mode: extract mode, defaults to EXTRACT_MODE
+            output_format: "csv" or "parquet", defaults to EXTRACT_FORMAT
+            part: number of the key range slice the query reads, None for a whole page
+            source: entry of EXTRACT_SOURCES the table is read from, tagging the file name
+
+        Returns: file name of the stored file, or None if there were no rows
+    """
+
+    mode = mode or EXTRACT_MODE
+    output_format = output_format or EXTRACT_FORMAT
+    if output_format not in ("csv", "parquet"):
+        raise ValueError(f"Unknown extract format: {output_format}")
+    if mode == "copy" and output_format != "csv":
+        raise ValueError("The copy extract mode can only write csv")
+
+    file_name = create_file_name(table, output_format, part, source_id(source))
+
+    if mode in ("stream", "copy"):
+        writer = S3StreamWriter(
+            s3_client, data_bucket, file_name, pipeline=upload_pipeline
+        )
+        try:
+            if mode == "copy":
+                row_count = copy_query(conn, query, writer)
+            else:
+                row_count = stream_query(
+                    conn,
+                    query,
+                    writer,
+                    EXTRACT_BATCH_SIZE,
+                    own_transaction=False,
+                    output_format=output_format,
+                )
+        except Exception:
+            writer.abort()
+            raise
+        if not row_count:
+            writer.abort()
+            return None
+        writer.close()
+        return file_name
+
+    if mode != "buffered":
+        raise ValueError(f"Unknown extract mode: {mode}")
+
+    rows = conn.run(query)
+
+    if rows:
+        if output_format == "parquet":
+            buffer = format_to_parquet(rows, conn.columns)
+        else:
+            buffer = format_to_csv(rows, [col["name"] for col in conn.columns])
+        store_in_s3(s3_client, buffer, data_bucket, file_name)
+        return file_name
+    return None
+
+
+def extract_table_changes(
+    s3_client,
+    conn,
+    table,
+    primary_key,
+    watermark=None,
+    checkpoint=None,
+    source=None,
+    pool=None,
+):
+    """
+    Function extracts the rows of a table that changed after its watermark, one keyset page at a time.
+    - finds the table's high-water mark, the newest (last_updated, primary key) after the watermark
+    - nothing is extracted when there is no row after the watermark
+    - splits the rows up to the high-water mark into pages of at most EXTRACT_PAGE_SIZE rows,
+      in (last_updated, primary key) order
+    - selects only the columns the transforms read, and the source id of a source from
+      EXTRACT_SOURCES (see get_select_list)
+    - stores every page as its own file with extract_table
+    - when the table's policy sets partitions, splits every page into primary key ranges
+      stored as one part file each; the ranges are read at once by run_table_tasks on
+      conn and the connections of pool that are idle when the table starts, borrowed
+      for the whole table, or one after another on conn when none are
+    - with a checkpoint, records every stored page in it and starts no new page once
+      the checkpoint's deadline has passed
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            conn: a connection to the ToteSys database
+            table: name of the table being extracted
+            primary_key: primary key column of the table
+            watermark: {"last_updated", "id"} of the last extracted row, None to extract everything
+            checkpoint: ExtractCheckpoint of a resumable initial extract, or None
+            source: entry of EXTRACT_SOURCES the table is read from, or None
+            pool: connection_pool of the extract (see snapshot_pool) to borrow the
+                connections reading key range slices from, or None
+
+        Returns: (list of stored file names, new watermark of the table)
+    """
+
+    high_water_mark = get_high_water_mark(conn, table, primary_key, watermark)
+    if high_water_mark is None:
+        return [], watermark
+
+    select_list = get_select_list(table, primary_key, source)
+    partitions = get_table_policy(table)["partitions"]
+    key_slices = (
+        get_key_slices(conn, table, primary_key, partitions) if partitions > 1 else []
+    )
+
+    file_names = []
+    with borrowed_connections(conn, pool, len(key_slices) - 1) as slice_pool:
+        slice_workers = slice_pool.qsize()
+        while watermark != high_water_mark:
+            if checkpoint is not None and checkpoint.should_stop():
+                break
+            page_end = get_page_end(
+                conn, table, primary_key, watermark, high_water_mark, EXTRACT_PAGE_SIZE
+            )
+            window = keyset_window(primary_key, watermark, page_end)
+            if key_slices:
+                slice_tasks = [
+                    partial(
+                        extract_table,
+                        s3_client,
+                        table=table,
+                        query=(
+                            f"SELECT {select_list} FROM {table} "
+                            f"WHERE {window} AND {key_slice} "
+                            f"ORDER BY last_updated, {primary_key}"
+                        ),
+                        part=part,
+                        source=source,
+                    )
+                    for part, key_slice in enumerate(key_slices)
+                ]
+                page_files = run_table_tasks(
+                    conn, slice_tasks, slice_workers, source=source, pool=slice_pool
+                )
+            else:
+                query = (
+                    f"SELECT {select_list} FROM {table} "
+                    f"WHERE {window} "
+                    f"ORDER BY last_updated, {primary_key}"
+                )
+                page_files = [
+                    extract_table(s3_client, conn, table, query, source=source)
+                ]
+            page_files = [file_name for file_name in page_files if file_name]
+            file_names.extend(page_files)
+            watermark = page_end
+            if checkpoint is not None:
+                checkpoint.record_page(table, page_files, watermark)
+
+    return file_names, watermark
+
+
+def extract_table_scan(s3_client, conn, table, primary_key, watermark=None, source=None):
+    """
+    Function extracts the rows of a table that changed after its watermark in one full scan.
+    - finds the table's high-water mark like extract_table_changes, nothing is extracted
+      when there is no row after the watermark
+    - reads the rows between the watermark and the high-water mark with a single query,
+      without ordering them, so the database scans the table once instead of paging
+      through the keyset index; cheaper when a large part of the table changed
+    - extracts the same rows as extract_table_changes, stored as one file with extract_table
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            conn: a connection to the ToteSys database
+            table: name of the table being extracted
+            primary_key: primary key column of the table
+            watermark: {"last_updated", "id"} of the last extracted row, None to extract everything
+            source: entry of EXTRACT_SOURCES the table is read from, or None
+
+        Returns: (list of stored file names, new watermark of the table)
+    """
+
+    high_water_mark = get_high_water_mark(conn, table, primary_key, watermark)
+    if high_water_mark is None:
+        return [], watermark
+
+    query = (
+        f"SELECT {get_select_list(table, primary_key, source)} FROM {table} "
+        f"WHERE {keyset_window(primary_key, watermark, high_water_mark)}"
+    )
+    file_name = extract_table(s3_client, conn, table, query, source=source)
+    return [file_name] if file_name else [], high_water_mark
+
+
+def extract_changed_buckets(
+    s3_client, conn, table, primary_key, checksums=None, source=None
+):
+    """
+    Function extracts the rows of a table whose hash changed since the last extract.
+    - hashes the table in buckets of the policy's bucket_size keys inside PostgreSQL
+      (see get_bucket_checksums), over the columns the transforms read
+    - compares the checksums with the ones of the last extract; all buckets count as changed
+      when there are none, or when they were taken with another bucket size
+    - hashes the rows of the changed buckets only (see get_row_hashes) and compares them
+      with the row hashes the last extract stored for those buckets, so rows that did not
+      change are not extracted again; every row of a changed bucket counts as changed
+      when there are no row hashes for it yet
+    - reads the changed rows in pages of at most EXTRACT_PAGE_SIZE rows, stored as one
+      file each with extract_table
+    - then stores the row hashes of the changed buckets, one object per bucket in the code
+      bucket, and deletes the ones of buckets that are gone, so the S3 work follows the
+      number of changed buckets rather than the size of the table
+    - does not depend on last_updated, so changes that did not move it are extracted too
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            conn: a connection to the ToteSys database
+            table: name of the table being extracted
+            primary_key: integer primary key column of the table
+            checksums: {"bucket_size", "buckets"} stored after the table's last extract
+                (see get_table_checksums), or None
+            source: entry of EXTRACT_SOURCES the table is read from, or None
+
+        Returns: (list of stored file names, new {"bucket_size", "buckets"} of the table)
+    """
+
+    bucket_size = get_table_policy(table)["bucket_size"]
+    columns = get_extract_columns(table, primary_key)
+    select_list = get_select_list(table, primary_key, source)
+
+    bucket_checksums = get_bucket_checksums(
+        conn, table, primary_key, bucket_size, columns
+    )
+    previous_buckets = {}
+    if checksums and checksums.get("bucket_size") == bucket_size:
+        previous_buckets = checksums["buckets"]
+    changed_buckets = get_changed_buckets(bucket_checksums, previous_buckets)
+
+    changed_hashes = get_row_hashes(
+        conn, table, primary_key, bucket_size, changed_buckets, columns
+    )
+    previous_rows = {
+        bucket: load_row_hashes(
+            s3_client,
+            code_bucket,
+            row_hashes_key(source, table, bucket),
+            previous_buckets[bucket],
+        )
+        for bucket in changed_hashes
+        if bucket in previous_buckets
+    }
+    changed_rows = get_changed_rows(changed_hashes, previous_rows)
+
+    file_names = []
+    for start in range(0, len(changed_rows), EXTRACT_PAGE_SIZE):
+        keys = ", ".join(
+            str(key) for key in changed_rows[start : start + EXTRACT_PAGE_SIZE]
+        )
+        query = (
+            f"SELECT {select_list} FROM {table} "
+            f"WHERE {primary_key} IN ({keys}) ORDER BY {primary_key}"
+        )
+        file_name = extract_table(s3_client, conn, table, query, source=source)
+        if file_name:
+            file_names.append(file_name)
+
+    for bucket, hashes in changed_hashes.items():
+        save_row_hashes(
+            s3_client,
+            hashes,
+            bucket_checksums[bucket],
+            code_bucket,
+            row_hashes_key(source, table, bucket),
+        )
+    # buckets gone since the last extract only held deleted rows
+    for bucket in set((checksums or {}).get("buckets", {})) - set(bucket_checksums):
+        s3_client.delete_object(
+            Bucket=code_bucket, Key=row_hashes_key(source, table, bucket)
+        )
+
+    return file_names, {"bucket_size": bucket_size, "buckets": bucket_checksums}
+
+
+def get_table_checksums(s3_client, conn, table, primary_key, source=None):
+    """
+    Function hashes every row and bucket of a table the way extract_changed_buckets does,
+    so an initial extract can store them and the first continuous extract of a "checksum"
+    table only reads the rows changed since. The row hashes are stored right away, one
+    object per bucket.
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            conn: a connection to the ToteSys database, inside the extract snapshot
+            table: name of the table
+            primary_key: integer primary key column of the table
+            source: entry of EXTRACT_SOURCES the table is read from, or None
+
+        Returns: {"bucket_size", "buckets"} of the table
+    """
+
+    bucket_size = get_table_policy(table)["bucket_size"]
+    columns = get_extract_columns(table, primary_key)
+    buckets = get_bucket_checksums(conn, table, primary_key, bucket_size, columns)
+    row_hashes = get_row_hashes(conn, table, primary_key, bucket_size, None, columns)
+    for bucket, hashes in row_hashes.items():
+        save_row_hashes(
+            s3_client,
+            hashes,
+            buckets[bucket],
+            code_bucket,
+            row_hashes_key(source, table, bucket),
+        )
+    return {"bucket_size": bucket_size, "buckets": buckets}
+
+
+def connect_to_snapshot(snapshot_id, secret_name=DATABASE_SECRET):
+    """
+    Opens a new connection to the ToteSys database that reads from an exported snapshot.
+
+        Parameters:
+            snapshot_id: id of the snapshot exported by the handler's connection
+            secret_name: secret holding the credentials of the database
+
+        Returns: a connection inside a transaction sharing the snapshot
+    """
+
+    worker_conn = connect(secret_name)
+    try:
+        join_snapshot(worker_conn, snapshot_id)
+    except Exception:
+        worker_conn.close()
+        raise
+    return worker_conn
+
+
+def timed_task(task, conn):
+    """Runs a table task on conn and returns (its result, the seconds it took)."""
+    started = time.monotonic()
+    result = task(conn)
+    return result, time.monotonic() - started
+
+
+@contextmanager
+def snapshot_pool(conn, size, source=None):
+    """
+    Context manager providing the connection_pool an extract's tasks take connections from.
+    - the pool holds conn plus size - 1 connections opened with connect_to_snapshot, so
+      every connection reads the snapshot exported from conn at one point in time
+    - yields None, opening no connection, when size is 1 or less
+
+        Parameters:
+            conn: a connection to the ToteSys database inside the extract snapshot
+            size: maximum number of connections open at once
+            source: entry of EXTRACT_SOURCES conn reads from, the other connections are
+                opened to the same database
+
+        Yields: queue.Queue of connections (see connection_pool), or None
+    """
+
+    if size <= 1:
+        yield None
+        return
+
+    snapshot_id = export_snapshot(conn)
+    connect_fn = partial(connect_to_snapshot, snapshot_id, source_secret(source))
+    with connection_pool(conn, size, connect_fn) as pool:
+        yield pool
+
+
+def run_table_tasks(conn, tasks, workers=None, source=None, pool=None):
+    """
+    Function runs per-table extract tasks, concurrently when more than one worker is allowed.
+    - every task is called with a connection and returns its result
+    - with a single worker the tasks run one after another on conn
+    - otherwise a thread pool runs them, each worker taking its own connection from
+      pool, or from a snapshot_pool of `workers` connections opened for these tasks, so
+      no more than `workers` connections are open at once
+    - conn is expected to be inside the extract snapshot (see start_snapshot), worker
+      connections join the same snapshot so all tables are read at one point in time
+
+        Parameters:
+            conn: a connection to the ToteSys database
+            tasks: list of callables taking a connection
+            workers: maximum number of concurrent tasks, defaults to EXTRACT_WORKERS
+            source: entry of EXTRACT_SOURCES conn reads from, worker connections are
+                opened to the same database
+            pool: connections already open for the tasks (see connection_pool), or None
+
+        Returns: list of task results, in the same order as tasks
+    """
+
+    workers = min(workers or EXTRACT_WORKERS, len(tasks))
+    if workers <= 1:
+        return [task(conn) for task in tasks]
+
+    if pool is None:
+        with snapshot_pool(conn, workers, source) as pool:
+            return run_table_tasks(conn, tasks, workers, source, pool)
+
+    def run_task(task):
+        worker_conn = pool.get()
+        try:
+            return task(worker_conn)
+        finally:
+            pool.put(worker_conn)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_task, tasks))
+
+
+def extract_tables(
+    s3_client,
+    conn,
+    tables,
+    watermarks,
+    checkpoint=None,
+    checksums=None,
+    source=None,
+    full_tables=(),
+    costs=None,
+):
+    """
+    Function runs extract_table_changes for every table and collects the results.
+    - tables are extracted by run_table_tasks, on a snapshot_pool of up to EXTRACT_WORKERS
+      connections that the key range slices of partitioned tables are read on as well
+    - tables with a "full" policy are extracted from the start, whatever their watermark,
+      except in a resumable extract, where their watermark is the checkpoint's last page
+    - tables in full_tables are extracted after their watermark in one full scan, with
+      extract_table_scan
+    - when checksums are given, tables with a "checksum" policy are extracted with
+      extract_changed_buckets, and their new checksums updated in place in checksums
+    - the watermark of every table that had changes is updated in place in watermarks
 
         Parameters:
             s3_client: a low-level interface for interacting with S3 buckets
             conn: a connection to the ToteSys database
+            tables: list of (table name, primary key) tuples
+            watermarks: dict of table name -> watermark, tables without one are extracted in full
+            checkpoint: ExtractCheckpoint passed on to extract_table_changes, or None
+            checksums: dict of table name -> bucket checksums, None to extract
+                "checksum" tables by watermark like the others
+            source: entry of EXTRACT_SOURCES the tables are read from, or None
+            full_tables: names of the tables the planner chose to read in a full scan
+            costs: dict filled in place with the seconds each table's extract took
 
-        Returns: string declaring success or failure of upload to S3
+        Returns: list of all stored file names
     """
 
-    query = conn.run(
-        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name != '_prisma_migrations'"
+    policies = {table: get_table_policy(table) for table, _ in tables}
+    # the extract holds no more than EXTRACT_WORKERS connections, shared by the tables
+    # and the key range slices of the partitioned ones
+    pool_size = min(
+        EXTRACT_WORKERS, sum(policy["partitions"] for policy in policies.values())
     )
+    with snapshot_pool(conn, pool_size, source) as pool:
+        tasks = []
+        for table, primary_key in tables:
+            mode = policies[table]["mode"]
+            watermark = watermarks.get(table)
+            if mode == "full" and checkpoint is None:
+                watermark = None
+            if mode == "checksum" and checksums is not None:
+                task = partial(
+                    extract_changed_buckets,
+                    s3_client,
+                    table=table,
+                    primary_key=primary_key,
+                    checksums=checksums.get(table),
+                    source=source,
+                )
+            elif mode != "full" and table in full_tables:
+                task = partial(
+                    extract_table_scan,
+                    s3_client,
+                    table=table,
+                    primary_key=primary_key,
+                    watermark=watermarks.get(table),
+                    source=source,
+                )
+            else:
+                task = partial(
+                    extract_table_changes,
+                    s3_client,
+                    table=table,
+                    primary_key=primary_key,
+                    watermark=watermark,
+                    checkpoint=checkpoint,
+                    source=source,
+                    pool=pool,
+                )
+            tasks.append(task)
+
+        timed_tasks = [partial(timed_task, task) for task in tasks]
+        results = run_table_tasks(conn, timed_tasks, pool_size, source, pool)
+
     extracted_tables = []
-    """Query each table to extract all information it contains"""
-    for table in query:
+    for (table, _), task, ((file_names, result), seconds) in zip(
+        tables, tasks, results
+    ):
+        extracted_tables.extend(file_names)
+        if costs is not None:
+            costs[table] = seconds
+        if task.func is extract_changed_buckets:
+            checksums[table] = result
+        elif result:
+            watermarks[table] = result
 
-        file_name = create_file_name(table[0])
-        rows = conn.run(f"SELECT * FROM {table[0]}")
-        columns = [col["name"] for col in conn.columns]
+    return extracted_tables
 
-        if rows:
-            csv_buffer = format_to_csv(rows, columns)
-            store_in_s3(s3_client, csv_buffer, data_bucket, file_name)
-            extracted_tables.append(file_name)
+
+def initial_extract(s3_client, conn, checkpoint=None, source=None):
+    """
+    Function to run an initial extract of all data currently in the ToteSys database and stores in an S3 bucket.
+    - runs query to find all table names and primary keys in db
+    - leaves out the tables whose policy skips them because no transform reads them
+    - extracts every table in full with extract_tables, using up to EXTRACT_WORKERS
+      tables (and connections) at once
+    - with a checkpoint, resumes every table after the last page stored by earlier
+      invocations and stops at the checkpoint's deadline
+    - stores csv files in S3 bucket (buffered, streamed or copied, see EXTRACT_MODE)
+    - once every table is extracted, stores the (last_updated, primary key) high-water mark
+      of every table in watermarks.json and the time it was extracted at in refresh_times.json
+    - hashes the tables with a "checksum" policy in the same snapshot and stores their
+      bucket checksums in checksums.json and their row hashes per bucket (see
+      get_table_checksums), so continuous extracts only read their rows changed since
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            conn: a connection to the ToteSys database
+            checkpoint: ExtractCheckpoint of a resumable extract, or None
+            source: entry of EXTRACT_SOURCES to extract, or None for the single database
+
+        Returns: list of stored file names, including those stored by earlier invocations
+    """
+
+    now = time.time()
+    tables = [
+        (table, primary_key)
+        for table, primary_key in get_tables(conn)
+        if is_table_due(table, {}, now)
+    ]
+    watermarks = checkpoint.watermarks if checkpoint is not None else {}
+    extracted_tables = extract_tables(
+        s3_client, conn, tables, watermarks, checkpoint, source=source
+    )
+    if checkpoint is not None:
+        extracted_tables = list(checkpoint.files)
+        if not checkpoint.finished:
+            return extracted_tables
+    save_manifest(
+        s3_client, watermarks, code_bucket, source_key(source, watermarks_file)
+    )
+    checksums = {
+        table: get_table_checksums(s3_client, conn, table, primary_key, source)
+        for table, primary_key in tables
+        if get_table_policy(table)["mode"] == "checksum"
+    }
+    if checksums:
+        save_manifest(
+            s3_client, checksums, code_bucket, source_key(source, checksums_file)
+        )
+    refreshed_at = {table: now for table, _ in tables}
+    save_manifest(
+        s3_client, refreshed_at, code_bucket, source_key(source, refresh_times_file)
+    )
 
     return extracted_tables
 
 
-def continuous_extract(s3_client, conn):
+def continuous_extract(
+    s3_client,
+    conn,
+    skipped_tables=(),
+    refreshed_at=None,
+    only_tables=None,
+    source=None,
+    full_tables=(),
+    costs=None,
+):
     """
-    Function to run an extract of recently added data in the ToteSys db and stores in an S3 bucket.
-    - reads timestamp stored in last_extracted.txt
-    - runs db query to get all table names from db
-    - runs a db query to select all new data added since timestamp
-    - creates file name with create_file_name util function
-    - converts data into csv format
-    - stores csv file in S3 bucket
+    Function to run an extract of recently changed data in the ToteSys db and stores in an S3 bucket.
+    - reads the per-table watermarks stored in watermarks.json
+    - falls back to the timestamp stored in last_extracted.txt when there are no watermarks yet
+    - runs db query to get all table names and primary keys from db
+    - skips the tables the change probe found unchanged, the tables left out of only_tables,
+      and the tables whose policy (see table_policies) says they are not due yet or not
+      read by any transform
+    - extracts the rows of each table after its watermark with extract_tables, using up
+      to EXTRACT_WORKERS tables (and connections) at once, in one full scan when the
+      planner put it in full_tables
+    - stores csv files in S3 bucket (buffered, streamed or copied, see EXTRACT_MODE)
+    - extracts the tables with a "checksum" policy by the buckets whose checksums differ
+      from the ones stored in checksums.json (see extract_changed_buckets)
+    - stores the new watermarks in watermarks.json, the new checksums in checksums.json and
+      the time every extracted table was refreshed at in refresh_times.json
 
         Parameters:
             s3_client: a low-level interface for interacting with S3 buckets
             conn: a connection to the ToteSys database
+            skipped_tables: names of tables to leave out of this extract
+            refreshed_at: table name -> time.time() of its last extract, read from
+                refresh_times.json when not given
+            only_tables: names of the only tables to extract, None for all of them
+            source: entry of EXTRACT_SOURCES to extract, or None for the single database
+            full_tables: names of the tables the planner chose to read in a full scan
+            costs: dict filled in place with the seconds each table's extract took
 
-        Returns: string declaring success or failure of upload to S3
+        Returns: list of stored file names
     """
 
-    response = s3_client.get_object(Bucket=code_bucket, Key="last_extracted.txt")
-    readable_content = response["Body"].read().decode("utf-8")
-    last_extracted_datetime = datetime.fromisoformat(readable_content)
-    query = conn.run(
-        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name != '_prisma_migrations'"
+    now = time.time()
+    watermarks = load_manifest(
+        s3_client, code_bucket, source_key(source, watermarks_file)
     )
-    updated_tables = []
-    for table in query:
-        file_name = create_file_name(table[0])
-        rows = conn.run(
-            f"SELECT * FROM {table[0]} WHERE created_at > '{last_extracted_datetime}'"
+    if refreshed_at is None:
+        refreshed_at = load_manifest(
+            s3_client, code_bucket, source_key(source, refresh_times_file)
         )
-        columns = [col["name"] for col in conn.columns]
+    tables = get_tables(conn)
 
-        if rows:
-            csv_buffer = format_to_csv(rows, columns)
-            store_in_s3(s3_client, csv_buffer, data_bucket, file_name)
-            updated_tables.append(file_name)
+    if not watermarks:
+        response = s3_client.get_object(
+            Bucket=code_bucket, Key=source_key(source, "last_extracted.txt")
+        )
+        readable_content = response["Body"].read().decode("utf-8")
+        last_extracted_datetime = datetime.fromisoformat(readable_content)
+        watermarks = {
+            table: {"last_updated": last_extracted_datetime.isoformat(), "id": None}
+            for table, _ in tables
+        }
+
+    due_tables = [
+        (table, primary_key)
+        for table, primary_key in tables
+        if table not in skipped_tables
+        and (only_tables is None or table in only_tables)
+        and is_table_due(table, refreshed_at, now)
+    ]
+    checksums = None
+    if any(get_table_policy(table)["mode"] == "checksum" for table, _ in due_tables):
+        checksums = load_manifest(
+            s3_client, code_bucket, source_key(source, checksums_file)
+        )
+    updated_tables = extract_tables(
+        s3_client,
+        conn,
+        due_tables,
+        watermarks,
+        checksums=checksums,
+        source=source,
+        full_tables=full_tables,
+        costs=costs,
+    )
+    save_manifest(
+        s3_client, watermarks, code_bucket, source_key(source, watermarks_file)
+    )
+    if checksums is not None:
+        save_manifest(
+            s3_client, checksums, code_bucket, source_key(source, checksums_file)
+        )
+    refreshed_at = {**refreshed_at, **{table: now for table, _ in due_tables}}
+    save_manifest(
+        s3_client, refreshed_at, code_bucket, source_key(source, refresh_times_file)
+    )
 
     return updated_tables
 
 
-def lambda_handler(event, context):
+def plan_extract(
+    s3_client, conn, counters, previous_counters, skipped_tables, source=None
+):
     """
-    Function contains logic to extract data from ToteSys database based on whether an initial extract has taken place or not.
-    - creates an S3 client to interact with S3 bucket.
-    - creates a connection to the ToteSys database
-    - checks whether a 'last_extracted.txt' exists in AWS and invokes either 'initial_extract' or 'continuous_extract' accordingly
-    - creates (after initial_extract) OR updates (after continuous_extract)a file called 'last_extracted.txt' and uploads to S3
-    - closes connection
+    Function plans how a continuous extract reads every changed table.
+    - estimates the rows changed in each table since the last extract from its change
+      counters, and the rows in it from the catalog statistics (see get_live_rows)
+    - picks "full", "incremental" or "skip" with plan_table_strategy, from the cost of
+      earlier runs stored in extract_history.json
+    - only tables with an "incremental" policy are planned, the others follow their policy
 
         Parameters:
             s3_client: a low-level interface for interacting with S3 buckets
             conn: a connection to the ToteSys database
+            counters: change counters read for this extract
+            previous_counters: change counters stored after the last extract
+            skipped_tables: names of the tables left out of this extract
+            source: entry of EXTRACT_SOURCES being extracted, or None
 
-        Returns: string declaring success or failure
+        Returns: (dict of table name -> plan, dict of table name -> cost history)
+    """
+
+    live_rows = get_live_rows(conn)
+    history = load_manifest(
+        s3_client, code_bucket, source_key(source, history_file)
+    )
+
+    plan = {}
+    for table, count in counters.items():
+        if get_table_policy(table)["mode"] != "incremental":
+            continue
+        previous = previous_counters.get(table)
+        if table in skipped_tables:
+            changed_rows = 0
+        elif previous is None or count < previous:
+            # no counter stored, or statistics reset since: count is all that is known
+            changed_rows = count
+        else:
+            changed_rows = count - previous
+        plan[table] = plan_table_strategy(
+            changed_rows,
+            live_rows.get(table, 0),
+            history.get(table, {}),
+            EXTRACT_FULL_ROW_SECONDS,
+            EXTRACT_INCREMENTAL_COST_RATIO,
+        )
+
+    return plan, history
+
+
+def get_sources(event):
+    """
+    Function picks the ToteSys databases an invocation extracts from EXTRACT_SOURCES.
+
+        Parameters:
+            event: the Lambda event, {"source": id} limits the invocation to one source
+
+        Returns: list of EXTRACT_SOURCES entries, or [None] for the single database setup
+    """
+
+    if not EXTRACT_SOURCES:
+        return [None]
+    if "source" not in event:
+        return EXTRACT_SOURCES
+    sources = [source for source in EXTRACT_SOURCES if source["id"] == event["source"]]
+    if not sources:
+        raise ValueError(f"Unknown extract source: {event['source']}")
+    return sources
+
+
+def install_notification_triggers(sources):
+    """
+    Function installs the change triggers (see install_change_triggers) on every table of every source,
+    notifying EXTRACT_NOTIFY_CHANNEL. Run once, by invoking the Lambda with
+    {"install_change_triggers": true}, before scheduling listening invocations.
+
+        Parameters:
+            sources: EXTRACT_SOURCES entries to install the triggers in, see get_sources
+
+        Returns: dict declaring success or failure
     """
 
+    installed = 0
+    for source in sources:
+        conn = get_connection(source_secret(source))
+        try:
+            tables = [table for table, _ in get_tables(conn)]
+            install_change_triggers(conn, tables, EXTRACT_NOTIFY_CHANNEL)
+        except Exception as e:
+            discard_connection(source_secret(source))
+            logging.error(f"Error installing change triggers: {e}")
+            return {"result": "Failure", "error": "Error installing change triggers"}
+        installed += len(tables)
+
+    return {
+        "result": "Success",
+        "message": f"Change triggers installed on {installed} tables",
+    }
+
+
+def listen_and_extract(event, context, source=None):
+    """
+    Function listens for the notifications of the change triggers and extracts the tables notified,
+    so changes reach S3 seconds after they are made instead of at the next scheduled run.
+    - listens for event["listen"] seconds, or until EXTRACT_DEADLINE_MARGIN seconds before
+      the Lambda times out
+    - batches the notifications for EXTRACT_NOTIFY_WINDOW seconds after the first one
+    - runs lambda_handler with {"tables": [...]} for every batch, i.e. a continuous extract
+      of the tables notified only
+    - notifications sent while no invocation listens are lost, the scheduled extract still
+      picks those changes up through the change counters and watermarks
+
+        Parameters:
+            event: {"listen": seconds to listen for}, with {"source": id} when
+                EXTRACT_SOURCES lists several databases (one listener runs per source)
+            context: the Lambda context, used for the remaining time
+            source: entry of EXTRACT_SOURCES to listen to, or None for the single database
+
+        Returns: dict declaring success or failure, with the result of every extract run
+    """
+
+    listen_until = time.monotonic() + event["listen"]
+    deadline = get_deadline(context, EXTRACT_DEADLINE_MARGIN)
+    if deadline is not None:
+        listen_until = min(listen_until, deadline)
+
+    secret_name = source_secret(source)
+    extracts = []
     try:
-        s3_client = create_s3_client()
-    except NoCredentialsError:
-        logging.error("AWS credentials not found. Unable to create S3 client")
+        conn = get_connection(secret_name)
+        listen_for_changes(conn, EXTRACT_NOTIFY_CHANNEL)
+        while True:
+            remaining = listen_until - time.monotonic()
+            if remaining <= 0:
+                break
+            changed_tables = wait_for_changes(
+                conn, EXTRACT_NOTIFY_CHANNEL, EXTRACT_NOTIFY_WINDOW, remaining
+            )
+            if not changed_tables:
+                break
+            batch_event = {"tables": sorted(changed_tables)}
+            if source:
+                batch_event["source"] = source_id(source)
+            extracts.append(lambda_handler(batch_event, context))
+            # a failed extract discards the connection, so listen on the current one
+            conn = get_connection(secret_name)
+            listen_for_changes(conn, EXTRACT_NOTIFY_CHANNEL)
+        stop_listening_for_changes(conn, EXTRACT_NOTIFY_CHANNEL)
+    except Exception as e:
+        discard_connection(secret_name)
+        logging.error(f"Error listening for changes: {e}")
         return {
             "result": "Failure",
-            "error": "AWS credentials not found. Unable to create S3 client",
+            "error": "Error listening for changes",
+            "extracts": extracts,
         }
-    except ClientError as e:
-        logging.error(f"Error creating S3 client: {e}")
-        return {"result": "Failure", "error": "Error creating S3 client"}
 
-    conn = connect()
+    return {
+        "result": "Success",
+        "message": f"Ran {len(extracts)} extracts of notified changes",
+        "extracts": extracts,
+    }
 
-    response = s3_client.list_objects(Bucket=code_bucket)
-    if "Contents" in response and any(
-        obj["Key"] == "last_extracted.txt" for obj in response["Contents"]
-    ):
-        result = continuous_extract(s3_client, conn)
-        extraction_type = "Continuous"
 
-    else:
-        result = initial_extract(s3_client, conn)
-        extraction_type = "Initial"
+def extract_source(s3_client, event, context, source=None):
+    """
+    Function extracts one ToteSys database, based on whether its initial extract has taken place or not.
+    - gets the connection to the database kept for this Lambda container
+    - takes the source's advisory lock (see try_extract_lock), so only one invocation
+      extracts a source at a time; an invocation that does not get it returns straight
+      away, leaving the changes to the next run
+    - checks whether the source's 'last_extracted.txt' exists in AWS
+    - reads the per-table change counters; when a continuous extract finds none of them
+      moved since the last run, or only in tables whose policy says they are not due,
+      returns straight away without writing anything to S3
+    - with EXTRACT_PLANNER on, plans whether a continuous extract reads the changes of each
+      table in one full scan or page by page (see plan_extract), and stores how long each table took in
+      extract_history.json for the next plan
+    - opens a REPEATABLE READ snapshot, so every table is read at the same point in time
+    - invokes either 'initial_extract' or 'continuous_extract' (of the changed tables only)
+    - an initial extract is checkpointed after every page; when the invocation is about to
+      time out it stops and saves the checkpoint for a new invocation to carry on from.
+      Scheduled invocations leave a recently saved checkpoint alone.
+    - stores the change counters in change_counters.json for the next run's probe
+    - creates (after initial_extract) OR updates (after continuous_extract)a file called 'last_extracted.txt'
+      holding the database time the snapshot was taken at, and uploads to S3
+    - keeps the connection open for the next warm invocation, or closes it after a failure
+    - every manifest of a source from EXTRACT_SOURCES is stored under its id (see source_key)
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            event: the Lambda event, see lambda_handler
+            context: the Lambda context, used for the remaining time
+            source: entry of EXTRACT_SOURCES to extract, or None for the single database
+
+        Returns: {"result", "extraction_type", "timestamp", "updated_tables"} after an extract,
+            with the "plan" of every table and the "seconds" it took after a planned one,
+            {"result", "continues": True} when an initial extract has to carry on in a new
+            invocation, otherwise {"result", "message"} or {"result", "error"}
+    """
+
+    secret_name = source_secret(source)
+    conn = get_connection(secret_name)
+    lock_name = source_key(source, "extract")
+    locked = False
 
     try:
-        last_extracted = datetime.now().isoformat().replace("T", " ")
-        s3_client.put_object(
-            Body=last_extracted, Bucket=code_bucket, Key="last_extracted.txt"
+        # a scheduled and a listening invocation must not both read and rewrite the
+        # source's manifests, or the one finishing last moves the watermarks back
+        locked = try_extract_lock(conn, lock_name)
+        if not locked:
+            logging.info("Extract is running in another invocation, skipping this run")
+            return {"result": "Success", "message": "Extract in progress"}
+
+        response = s3_client.list_objects(Bucket=code_bucket)
+        last_extracted_key = source_key(source, "last_extracted.txt")
+        is_continuous = "Contents" in response and any(
+            obj["Key"] == last_extracted_key for obj in response["Contents"]
         )
 
-        report = {
-            "status": "Success",
-            "extraction_type": extraction_type,
-            "timestamp": last_extracted,
-            "updated_tables": result,
-        }
+        # read before the snapshot starts, so every change counted is in the snapshot
+        counters = get_change_counters(conn)
+        skipped_tables = set()
+        refreshed_at = None
+        checkpoint = None
+        plan = {}
+        costs = {}
+        only_tables = event.get("tables")
+        if only_tables is not None and not is_continuous:
+            logging.info("No initial extract yet, leaving notified changes to it")
+            return {"result": "Success", "message": "Initial extract has not run yet"}
+        if is_continuous:
+            previous_counters = load_manifest(
+                s3_client, code_bucket, source_key(source, change_counters_file)
+            )
+            refreshed_at = load_manifest(
+                s3_client, code_bucket, source_key(source, refresh_times_file)
+            )
+            now = time.time()
+            unchanged_tables = get_unchanged_tables(counters, previous_counters)
+            deferred_tables = {
+                table
+                for table in counters
+                if table not in unchanged_tables
+                and (
+                    (only_tables is not None and table not in only_tables)
+                    or not is_table_due(table, refreshed_at, now)
+                )
+            }
+            skipped_tables = unchanged_tables | deferred_tables
+            if counters and len(skipped_tables) == len(counters):
+                logging.info("No changes to extract, skipping this run")
+                return {"result": "Success", "message": "No changes to extract"}
+            if EXTRACT_PLANNER:
+                plan, history = plan_extract(
+                    s3_client,
+                    conn,
+                    counters,
+                    previous_counters,
+                    skipped_tables,
+                    source,
+                )
+            # deferred tables keep their old counter, so their changes are picked up
+            # once they are due (or by the next run not limited to notified tables)
+            counters = {
+                table: previous_counters.get(table) if table in deferred_tables else count
+                for table, count in counters.items()
+                if table not in deferred_tables or table in previous_counters
+            }
+        else:
+            checkpoint = ExtractCheckpoint.load(
+                s3_client,
+                code_bucket,
+                source_key(source, checkpoint_file),
+                get_deadline(context, EXTRACT_DEADLINE_MARGIN),
+            )
+            if (
+                "continuation" not in event
+                and checkpoint.saved_at is not None
+                and time.time() - checkpoint.saved_at < EXTRACT_CHECKPOINT_LEASE
+            ):
+                logging.info("Initial extract is running in another invocation")
+                return {"result": "Success", "message": "Initial extract in progress"}
+
+        snapshot_taken_at = start_snapshot(conn)
+
+        if is_continuous:
+            full_tables = {
+                table for table, entry in plan.items() if entry["strategy"] == "full"
+            }
+            result = continuous_extract(
+                s3_client,
+                conn,
+                skipped_tables,
+                refreshed_at,
+                only_tables,
+                source,
+                full_tables,
+                costs,
+            )
+            extraction_type = "Continuous"
+
+        else:
+            result = initial_extract(s3_client, conn, checkpoint, source)
+            extraction_type = "Initial"
+
+        conn.run("COMMIT")
 
-        report_file_name = (
-            f"reports/{extraction_type}_extract_{last_extracted}_success.json"
+        if checkpoint is not None and not checkpoint.finished:
+            checkpoint.save()
+            return {"result": "Success", "continues": True}
+
+        if plan:
+            for table, seconds in costs.items():
+                if table in plan:
+                    plan[table]["seconds"] = round(seconds, 3)
+                    history[table] = update_extract_history(
+                        history.get(table, {}), plan[table], seconds
+                    )
+            save_manifest(
+                s3_client, history, code_bucket, source_key(source, history_file)
+            )
+
+        save_manifest(
+            s3_client, counters, code_bucket, source_key(source, change_counters_file)
         )
+
+        last_extracted = snapshot_taken_at.isoformat(sep=" ")
         s3_client.put_object(
-            Body=json.dumps(report, indent=4),
-            Bucket=data_bucket,
-            Key=report_file_name,
+            Body=last_extracted, Bucket=code_bucket, Key=last_extracted_key
         )
+        if checkpoint is not None:
+            checkpoint.delete()
 
-        return {
+        extract_result = {
             "result": "Success",
-            "report_file": f"s3://{code_bucket}/{report_file_name}",
+            "extraction_type": extraction_type,
+            "timestamp": last_extracted,
+            "updated_tables": result,
         }
+        if plan:
+            extract_result["plan"] = plan
+        return extract_result
     except ClientError as e:
+        discard_connection(secret_name)
         logging.error(f"Error updating last_extracted.txt: {e}")
         return {"result": "Failure", "error": "Error updating last_extracted.txt"}
 
     except Exception as e:
+        discard_connection(secret_name)
         logging.error(f"Unexpected error: {e}")
         return {"result": "Failure", "error": "Unexpected error"}
 
-    finally:    
-        conn.close()
\ No newline at end of file
+    finally:
+        if locked:
+            try:
+                release_extract_lock(conn, lock_name)
+            except Exception:
+                # closing the session releases the lock too, and is all that is left
+                # once a failure discarded the connection
+                discard_connection(secret_name)
+
+
+def lambda_handler(event, context):
+    """
+    Function contains logic to extract data from the ToteSys database(s).
+    - creates an S3 client to interact with S3 bucket.
+    - runs extract_source for the single ToteSys database, or for every database listed in
+      EXTRACT_SOURCES, up to EXTRACT_SOURCE_WORKERS at once; each source keeps its own
+      watermarks, counters and checkpoint, and tags its files with its id
+    - when an initial extract is about to time out, invokes this function again to carry
+      on from its checkpoint
+    - writes one report listing the files of every source extracted, per source under
+      "sources" when there are several, which triggers the transform
+    - with {"tables": [...]} in the event, a continuous extract is limited to those tables;
+      {"listen": seconds} runs listen_and_extract and {"install_change_triggers": true}
+      install_notification_triggers instead
+
+        Parameters:
+            event: {"continuation": n} for the n-th continuation of an initial extract,
+                {"tables": [...]}, {"listen": seconds} or {"install_change_triggers": true},
+                with {"source": id} to limit the invocation to one of EXTRACT_SOURCES
+            context: the Lambda context, used for the remaining time and function name
+
+        Returns: string declaring success or failure
+    """
+
+    try:
+        sources = get_sources(event)
+    except ValueError as e:
+        logging.error(str(e))
+        return {"result": "Failure", "error": str(e)}
+
+    if event.get("install_change_triggers"):
+        return install_notification_triggers(sources)
+    if event.get("listen"):
+        # an invocation listens on one connection, so to one database only
+        if len(sources) > 1:
+            error = "Listening needs a source when EXTRACT_SOURCES lists several"
+            logging.error(error)
+            return {"result": "Failure", "error": error}
+        return listen_and_extract(event, context, sources[0])
+
+    try:
+        s3_client = get_client(create_s3_client)
+    except NoCredentialsError:
+        logging.error("AWS credentials not found. Unable to create S3 client")
+        return {
+            "result": "Failure",
+            "error": "AWS credentials not found. Unable to create S3 client",
+        }
+    except ClientError as e:
+        logging.error(f"Error creating S3 client: {e}")
+        return {"result": "Failure", "error": "Error creating S3 client"}
+
+    if len(sources) == 1:
+        results = [extract_source(s3_client, event, context, sources[0])]
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(EXTRACT_SOURCE_WORKERS, len(sources))
+        ) as executor:
+            results = list(
+                executor.map(
+                    partial(extract_source, s3_client, event, context), sources
+                )
+            )
+
+    try:
+        message = None
+        if any(result.get("continues") for result in results):
+            continuation = event.get("continuation", 0) + 1
+            invoke_continuation(context.function_name, continuation)
+            message = f"Initial extract continues in invocation {continuation}"
+            logging.info(message)
+            for result in results:
+                if result.pop("continues", False):
+                    result["message"] = message
+
+        extracted = [
+            (source, result)
+            for source, result in zip(sources, results)
+            if "updated_tables" in result
+        ]
+        report_file = write_report(s3_client, extracted) if extracted else None
+    except Exception as e:
+        logging.error(f"Error writing extract report: {e}")
+        return {"result": "Failure", "error": "Error writing extract report"}
+
+    if sources == [None]:
+        if report_file:
+            return {"result": "Success", "report_file": report_file}
+        return results[0]
+
+    summary = {
+        "result": (
+            "Success"
+            if all(result["result"] == "Success" for result in results)
+            else "Failure"
+        ),
+        "sources": {
+            source_id(source): {
+                key: value for key, value in result.items() if key != "updated_tables"
+            }
+            for source, result in zip(sources, results)
+        },
+    }
+    if report_file:
+        summary["report_file"] = report_file
+    return summary
+
+
+def write_report(s3_client, extracted):
+    """
+    Function stores the report of an extract in the ingested data bucket, triggering the transform.
+    - lists every stored file under "updated_tables"
+    - with several sources, also lists each source's files, extraction type and timestamp
+      under "sources", so the transform can union the shards of every table
+    - records the planner's decision, estimate and measured seconds for every table
+      under "plan", per source when there are several
+
+        Parameters:
+            s3_client: a low-level interface for interacting with S3 buckets
+            extracted: list of (source, extract_source result) of the sources that extracted
+
+        Returns: S3 url of the report
+    """
+
+    if len(extracted) == 1 and extracted[0][0] is None:
+        result = extracted[0][1]
+        extraction_type = result["extraction_type"]
+        report = {
+            "status": "Success",
+            "extraction_type": extraction_type,
+            "timestamp": result["timestamp"],
+            "updated_tables": result["updated_tables"],
+        }
+        if "plan" in result:
+            report["plan"] = result["plan"]
+    else:
+        extraction_type = (
+            "Initial"
+            if any(result["extraction_type"] == "Initial" for _, result in extracted)
+            else "Continuous"
+        )
+        report = {
+            "status": "Success",
+            "extraction_type": extraction_type,
+            "timestamp": max(result["timestamp"] for _, result in extracted),
+            "updated_tables": [
+                file_name
+                for _, result in extracted
+                for file_name in result["updated_tables"]
+            ],
+            "sources": {
+                source_id(source): {
+                    key: result[key]
+                    for key in ("extraction_type", "timestamp", "updated_tables", "plan")
+                    if key in result
+                }
+                for source, result in extracted
+            },
+        }
+
+    report_file_name = (
+        f"reports/{extraction_type}_extract_{report['timestamp']}_success.json"
+    )
+    s3_client.put_object(
+        Body=json.dumps(report, indent=4),
+        Bucket=data_bucket,
+        Key=report_file_name,
+    )
+
+    return f"s3://{code_bucket}/{report_file_name}"
@@ -1,43 +1,32 @@
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 import boto3
 import csv
 import io
-from pg8000.native import Connection
+import queue
+import threading
+import time
+from pg8000.native import Connection, literal
+from botocore.exceptions import ClientError
+from cached_resources import get_secret, get_client, ConnectionHolder
 import json
 
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
 
-def get_secret(secret_name, region_name=None):
-    """
-    Retrieves a secret from AWS Secrets Manager
 
-    Args:
-        secret_name (str): The name of the secret in Secrets Manager
-    Returns:
-        dict: A dictionary of the secret values.
-    """
-    region_name = "eu-west-2"
+DATABASE_SECRET = "database_credentials"
 
-    client = boto3.client("secretsmanager", region_name=region_name)
 
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        if "SecretString" in get_secret_value_response:
-            secret = get_secret_value_response["SecretString"]
-            return json.loads(secret)
-        else:
-            raise ValueError("Secret is stored as binary; function expects JSON.")
-    except Exception as e:
-        raise RuntimeError("Failed to retrieve secret: {e}")
-
-
-def connect():
+def connect(secret_name=DATABASE_SECRET):
     """Gets a Connection to the data warehouse.
     Credentials are retrieved from AWS Secrets Manager by invoking get_secrets().
+    Args:
+        secret_name (str): secret holding the credentials of the ToteSys database,
+            one per source when several ToteSys databases are extracted
     Returns:
         a connection to ToteSys db
     """
-    secret_name = "database_credentials"
     secret = get_secret(secret_name)
 
     user = secret["user"]
@@ -51,6 +40,94 @@ def connect():
     )
 
 
+# One kept connection per secret, i.e. per ToteSys database extracted
+database_connections = {}
+database_connections_lock = threading.Lock()
+
+
+def get_connection_holder(secret_name):
+    """Returns the ConnectionHolder of the database behind secret_name, creating it on
+    first use."""
+    with database_connections_lock:
+        if secret_name not in database_connections:
+            database_connections[secret_name] = ConnectionHolder(
+                lambda: connect(secret_name), secret_name
+            )
+        return database_connections[secret_name]
+
+
+def get_connection(secret_name=DATABASE_SECRET):
+    """Returns the connection to the ToteSys database kept for this Lambda container,
+    opening a new one when there is none or it is no longer usable."""
+    return get_connection_holder(secret_name).get()
+
+
+def discard_connection(secret_name=DATABASE_SECRET):
+    """Closes the kept connection to the ToteSys database, e.g. after a failed run."""
+    get_connection_holder(secret_name).discard()
+
+
+@contextmanager
+def connection_pool(conn, size, connect_fn=connect):
+    """
+    Context manager providing a bounded pool of connections to the ToteSys database.
+    The pool holds conn plus size - 1 new connections opened with connect_fn, so no more
+    than size connections are ever open at once. The extra connections are closed on
+    exit, conn is left open for the caller to close.
+
+    Args:
+        conn: an open connection to the ToteSys database
+        size (int): maximum number of connections in the pool
+        connect_fn: function opening a new connection
+    Yields:
+        queue.Queue: connections available to workers; take one with get() and
+        return it with put() when done
+    """
+
+    pool = queue.Queue()
+    pool.put(conn)
+    extra_connections = []
+    try:
+        for _ in range(size - 1):
+            extra_connections.append(connect_fn())
+            pool.put(extra_connections[-1])
+        yield pool
+    finally:
+        for extra_connection in extra_connections:
+            extra_connection.close()
+
+
+@contextmanager
+def borrowed_connections(conn, pool, count):
+    """
+    Context manager lending a task up to count idle connections of a connection_pool on
+    top of the one it already holds. Connections are only taken when idle, so a task
+    never waits for another one to finish, and all are returned to the pool on exit.
+
+    Args:
+        conn: the connection the task already holds
+        pool (queue.Queue): connections yielded by connection_pool, or None
+        count (int): number of connections wanted on top of conn
+    Yields:
+        queue.Queue: conn and the borrowed connections, see connection_pool
+    """
+
+    borrowed = queue.Queue()
+    borrowed.put(conn)
+    lent = []
+    try:
+        while pool is not None and len(lent) < count:
+            try:
+                lent.append(pool.get_nowait())
+            except queue.Empty:
+                break
+            borrowed.put(lent[-1])
+        yield borrowed
+    finally:
+        for lent_connection in lent:
+            pool.put(lent_connection)
+
+
 def create_s3_client():
     """
     Creates an S3 client using boto3
@@ -59,10 +136,21 @@ def create_s3_client():
     return boto3.client("s3")
 
 
-def create_file_name(table):
+def create_lambda_client():
+    """
+    Creates a Lambda client using boto3
+    """
+
+    return boto3.client("lambda")
+
+
+def create_file_name(table, extension="csv", part=None, source_id=None):
     """Function takes a table name provided by either initial or continuous
     extract functions, creates a file system with the parent folder named after the table
     and subsequent folders named after time periods respectively.
+    The extension ("csv" or "parquet") matches the format of the extracted file.
+    Files of a page extracted in key range slices are told apart by their part number,
+    and files extracted from one of several ToteSys databases by their source id.
     Returns a full file name with a path to it. Path will be created in S3 busket by store_in_s3_bucket util function
     """
 
@@ -74,7 +162,12 @@ def create_file_name(table):
     day = datetime.now().strftime("%d")
     time_now = datetime.now().isoformat()
 
-    file_name = f"{table}/{year}/{month}/{day}/{time_now}.csv"
+    if source_id is not None:
+        time_now = f"{time_now}-{source_id}"
+    if part is not None:
+        time_now = f"{time_now}-part{part}"
+
+    file_name = f"{table}/{year}/{month}/{day}/{time_now}.{extension}"
 
     return file_name
 
@@ -111,3 +204,1130 @@ def store_in_s3(s3_client, csv_buffer, bucket_name, file_name):
         file_name (str): The name to assign to the file in the S3 bucket.
     """
     s3_client.put_object(Body=csv_buffer.getvalue(), Bucket=bucket_name, Key=file_name)
+
+
+def format_to_csv_bytes(rows, columns=None):
+    """Function encodes a batch of rows as utf-8 CSV bytes, ready to be written to an
+    S3StreamWriter. The header row is only written when columns are provided, so
+    the first batch of a table can carry the header and the following batches can not.
+    """
+
+    csv_buffer = io.StringIO()
+    writer = csv.writer(csv_buffer)
+    if columns:
+        writer.writerow(columns)
+    writer.writerows(rows)
+
+    return csv_buffer.getvalue().encode("utf-8")
+
+
+def parquet_schema(columns):
+    """
+    Function builds the Arrow schema of a Parquet file from the column descriptions pg8000
+    gives for a query (conn.columns), so the source column types are kept: integers,
+    floats, booleans, numeric(p, s) as decimals and dates, times and timestamps as such.
+    Any other type is stored as a string.
+    """
+
+    import pyarrow as pa
+
+    arrow_types = {
+        16: pa.bool_(),
+        20: pa.int64(),
+        21: pa.int16(),
+        23: pa.int32(),
+        700: pa.float32(),
+        701: pa.float64(),
+        1082: pa.date32(),
+        1083: pa.time64("us"),
+        1114: pa.timestamp("us"),
+        1184: pa.timestamp("us", tz="UTC"),
+    }
+
+    fields = []
+    for col in columns:
+        type_modifier = col.get("type_modifier", -1) - 4
+        if col["type_oid"] == 1700 and type_modifier >= 0:
+            arrow_type = pa.decimal128(type_modifier >> 16, type_modifier & 0xFFFF)
+        else:
+            arrow_type = arrow_types.get(col["type_oid"], pa.string())
+        fields.append(pa.field(col["name"], arrow_type))
+
+    return pa.schema(fields)
+
+
+def format_to_arrow_table(rows, columns):
+    """Function converts rows and their pg8000 column descriptions into an Arrow table
+    typed with parquet_schema. Values of string columns that pg8000 returns as other
+    Python objects (json, uuid, interval, ...) are converted with str()."""
+
+    import pyarrow as pa
+
+    schema = parquet_schema(columns)
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pa.types.is_string(field.type):
+            values = [
+                value if value is None or isinstance(value, str) else str(value)
+                for value in values
+            ]
+        arrays.append(pa.array(values, type=field.type))
+
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def format_to_parquet(rows, columns):
+    """Function receives rows and the pg8000 column descriptions (conn.columns) from either
+    initial or continuous extract functions and creates a file like object holding a
+    snappy compressed Parquet file with the source column types.
+    The pointer in the buffer is reset to the beginning of the file, so it can be put into
+    the S3 bucket with store_in_s3 function.
+    """
+
+    import pyarrow.parquet as pq
+
+    if not columns:
+        raise ValueError("Column headers cannot be empty!")
+
+    parquet_buffer = io.BytesIO()
+    pq.write_table(
+        format_to_arrow_table(rows, columns), parquet_buffer, compression="snappy"
+    )
+    parquet_buffer.seek(0)
+
+    return parquet_buffer
+
+
+class CsvBatchWriter:
+    """
+    Writes batches of rows to a file-like object as CSV, with the header row in front
+    of the first batch.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._header_written = False
+
+    def write_batch(self, rows, columns):
+        header = None
+        if not self._header_written:
+            header = [col["name"] for col in columns]
+            self._header_written = True
+        self.writer.write(format_to_csv_bytes(rows, header))
+
+    def close(self):
+        pass
+
+
+class ParquetBatchWriter:
+    """
+    Writes batches of rows to a file-like object as one snappy compressed Parquet file,
+    every batch becoming a row group. The schema is taken from the first batch's pg8000
+    column descriptions. close() writes the Parquet footer.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._parquet_writer = None
+
+    def write_batch(self, rows, columns):
+        import pyarrow.parquet as pq
+
+        table = format_to_arrow_table(rows, columns)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(
+                self.writer, table.schema, compression="snappy"
+            )
+        self._parquet_writer.write_table(table)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+class UploadPipeline:
+    """
+    Runs S3 uploads on a pool of uploader threads, so the thread reading from the
+    ToteSys database keeps fetching and encoding rows while earlier data is uploaded.
+
+    At most queue_size uploads are queued or running at once. submit blocks while the
+    queue is full, which holds the reader back when S3 is slower than the database and
+    bounds the memory taken by data waiting to be uploaded.
+
+    Args:
+        workers (int): number of uploader threads
+        queue_size (int): maximum number of uploads queued or in progress
+    """
+
+    def __init__(self, workers, queue_size):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="s3-upload"
+        )
+        self._slots = threading.BoundedSemaphore(queue_size)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) for an uploader thread and returns its Future,
+        waiting for a free slot first when the queue is full."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+class S3StreamWriter:
+    """
+    File-like object that uploads everything written to it to an AWS S3 bucket.
+
+    Data is buffered until there is enough of it for one part of an S3 multipart
+    upload, so memory use is bounded by part_size instead of the size of the file.
+    Files smaller than one part are uploaded with a single put_object call.
+
+    Args:
+        s3_client: A boto3 S3 client.
+        bucket_name (str): The name of the S3 bucket to store the file in.
+        file_name (str): The name to assign to the file in the S3 bucket.
+        part_size (int): Number of bytes buffered before a part is uploaded
+            (S3 requires at least 5MiB for every part except the last one).
+        pipeline (UploadPipeline): uploads the parts on uploader threads while more
+            data is written, None to upload every part before write returns.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket_name,
+        file_name,
+        part_size=MULTIPART_PART_SIZE,
+        pipeline=None,
+    ):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self.part_size = part_size
+        self.pipeline = pipeline
+        self.bytes_written = 0
+        self.closed = False
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self._pending_parts = []
+        self._part_count = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.file_name
+            )
+            self._upload_id = response["UploadId"]
+
+        self._part_count += 1
+        body = bytes(self._buffer)
+        self._buffer = bytearray()
+
+        if self.pipeline is None:
+            self._parts.append(self._send_part(body, self._part_count))
+            return
+
+        # stop reading as soon as an earlier part has failed
+        for future in self._pending_parts:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._pending_parts.append(
+            self.pipeline.submit(self._send_part, body, self._part_count)
+        )
+
+    def _send_part(self, body, part_number):
+        response = self.s3_client.upload_part(
+            Body=body,
+            Bucket=self.bucket_name,
+            Key=self.file_name,
+            PartNumber=part_number,
+            UploadId=self._upload_id,
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def close(self):
+        """Uploads whatever is left in the buffer and completes the upload.
+        When any part fails to upload, the upload is aborted and the error raised."""
+        if self.closed:
+            return
+        if self._upload_id is None:
+            self.s3_client.put_object(
+                Body=bytes(self._buffer), Bucket=self.bucket_name, Key=self.file_name
+            )
+        else:
+            try:
+                if self._buffer:
+                    self._upload_part()
+                self._parts.extend(future.result() for future in self._pending_parts)
+                self._pending_parts = []
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=self.file_name,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts},
+                )
+            except Exception:
+                self.abort()
+                raise
+        self._buffer = bytearray()
+        self.closed = True
+
+    def abort(self):
+        """Discards the file, so nothing is left behind in the S3 bucket."""
+        if self.closed:
+            return
+        # parts still uploading would otherwise be stored after the abort
+        wait(self._pending_parts)
+        self._pending_parts = []
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.file_name, UploadId=self._upload_id
+            )
+        self._buffer = bytearray()
+        self.closed = True
+
+
+def stream_query(
+    conn,
+    query,
+    writer,
+    batch_size,
+    cursor_name="extract_cursor",
+    own_transaction=True,
+    output_format="csv",
+):
+    """
+    Runs a query through a server-side cursor and writes the result to writer as CSV
+    or Parquet. Rows are fetched batch_size at a time, so only one batch is ever held
+    in memory. Nothing is written when the query returns no rows.
+
+    Args:
+        conn: a connection to the ToteSys database
+        query (str): the SELECT statement to run
+        writer: file-like object the file is written to (e.g. S3StreamWriter)
+        batch_size (int): number of rows fetched from the cursor at a time
+        cursor_name (str): name of the cursor declared on the server
+        own_transaction (bool): open and commit a transaction for the cursor, set to
+            False when conn is already inside one (e.g. an extract snapshot)
+        output_format (str): "csv" or "parquet"
+    Returns:
+        int: the number of rows written
+    """
+
+    if output_format == "parquet":
+        batch_writer = ParquetBatchWriter(writer)
+    else:
+        batch_writer = CsvBatchWriter(writer)
+
+    if own_transaction:
+        conn.run("START TRANSACTION READ ONLY")
+    try:
+        row_count = fetch_from_cursor(
+            conn, query, batch_writer, batch_size, cursor_name
+        )
+        if own_transaction:
+            conn.run("COMMIT")
+    except Exception:
+        if own_transaction:
+            conn.run("ROLLBACK")
+        raise
+
+    if row_count:
+        batch_writer.close()
+
+    return row_count
+
+
+def fetch_from_cursor(conn, query, batch_writer, batch_size, cursor_name):
+    """Declares a cursor for query inside the current transaction and passes its rows to
+    batch_writer, batch_size rows at a time. Returns the number of rows written."""
+
+    conn.run(f"DECLARE {cursor_name} NO SCROLL CURSOR FOR {query}")
+    row_count = 0
+    while True:
+        rows = conn.run(f"FETCH FORWARD {int(batch_size)} FROM {cursor_name}")
+        if not rows:
+            break
+        batch_writer.write_batch(rows, conn.columns)
+        row_count += len(rows)
+    conn.run(f"CLOSE {cursor_name}")
+
+    return row_count
+
+
+def copy_query(conn, query, writer):
+    """
+    Runs a query through PostgreSQL COPY ... TO STDOUT and writes the CSV produced by
+    the server straight to writer, header row included. Rows are never turned into
+    Python objects, which makes this the fastest way to move a table out of the database.
+
+    Args:
+        conn: a connection to the ToteSys database
+        query (str): the SELECT statement to run
+        writer: file-like object the CSV bytes are written to (e.g. S3StreamWriter)
+    Returns:
+        int: the number of rows written
+    """
+
+    conn.run(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", stream=writer)
+
+    return conn.row_count
+
+
+def get_tables(conn):
+    """
+    Lists the tables to extract from the ToteSys database with their primary key column.
+    Watermarks and keyset pages are built on (last_updated, primary key), so every
+    table is expected to have a single-column primary key.
+
+    Args:
+        conn: a connection to the ToteSys database
+    Returns:
+        list: (table_name, primary_key) tuples, ordered by table name
+    """
+
+    rows = conn.run(
+        "SELECT t.table_name, k.column_name FROM information_schema.tables t "
+        "LEFT JOIN information_schema.table_constraints c "
+        "ON c.table_schema = t.table_schema AND c.table_name = t.table_name "
+        "AND c.constraint_type = 'PRIMARY KEY' "
+        "LEFT JOIN information_schema.key_column_usage k "
+        "ON k.constraint_schema = c.constraint_schema AND k.constraint_name = c.constraint_name "
+        "WHERE t.table_schema = 'public' AND t.table_name != '_prisma_migrations' "
+        "ORDER BY t.table_name"
+    )
+
+    tables = {}
+    for table, primary_key in rows:
+        if primary_key is None or table in tables:
+            raise ValueError(f"Table {table} needs a single-column primary key")
+        tables[table] = primary_key
+
+    return list(tables.items())
+
+
+def get_key_slices(conn, table, primary_key, partitions):
+    """
+    Splits the primary key range of a table into slices of equal width, so a page can
+    be read by several connections at once.
+
+    Args:
+        conn: a connection to the ToteSys database
+        table (str): table name
+        primary_key (str): primary key column of the table
+        partitions (int): number of slices wanted
+    Returns:
+        list: SQL conditions on the primary key, one per slice, together covering every
+            key value; empty when the table is empty, its key is not an integer or the
+            range is too small to split
+    """
+
+    query = f"SELECT min({primary_key}), max({primary_key}) FROM {table}"
+    low, high = conn.run(query)[0]
+    if not isinstance(low, int) or not isinstance(high, int):
+        return []
+
+    partitions = min(partitions, high - low + 1)
+    if partitions <= 1:
+        return []
+
+    width = -(-(high - low + 1) // partitions)
+    bounds = [low + width * i for i in range(1, partitions)]
+
+    conditions = [f"{primary_key} < {bounds[0]}"]
+    conditions.extend(
+        f"{primary_key} >= {start} AND {primary_key} < {end}"
+        for start, end in zip(bounds, bounds[1:])
+    )
+    conditions.append(f"{primary_key} >= {bounds[-1]}")
+    return conditions
+
+
+def get_bucket_checksums(conn, table, primary_key, bucket_size, columns=None):
+    """
+    Hashes a table in buckets of bucket_size primary key values inside PostgreSQL, so
+    only one row per bucket is sent back. Each row is hashed with md5, and the row
+    hashes of a bucket, in primary key order, are hashed again into the bucket checksum.
+    Any insert, update or delete in a bucket changes its checksum, whatever the rows'
+    last_updated says.
+
+    Args:
+        conn: a connection to the ToteSys database
+        table (str): table name
+        primary_key (str): integer primary key column of the table
+        bucket_size (int): primary key values per bucket
+        columns (list): columns to hash, None for the whole row
+    Returns:
+        dict: bucket number (as a string, like the stored manifest) -> [row count, checksum],
+            bucket n holding the keys from n * bucket_size up to (n + 1) * bucket_size
+    """
+
+    row = f"ROW({', '.join(columns)})" if columns else "t"
+    rows = conn.run(
+        f"SELECT floor({primary_key}::numeric / {int(bucket_size)})::bigint AS bucket, "
+        f"count(*), md5(string_agg(md5({row}::text), '' ORDER BY {primary_key})) "
+        f"FROM {table} t GROUP BY bucket"
+    )
+
+    return {str(bucket): [count, checksum] for bucket, count, checksum in rows}
+
+
+def get_changed_buckets(checksums, previous_checksums):
+    """
+    Compares bucket checksums with the ones stored after the last extract.
+
+    Returns:
+        list: numbers of the buckets that are new or whose checksum differs, in key order.
+            Buckets gone since the last extract only held deleted rows and are left out.
+    """
+
+    return sorted(
+        int(bucket)
+        for bucket, (_, checksum) in checksums.items()
+        if previous_checksums.get(bucket, [None, None])[1] != checksum
+    )
+
+
+def bucket_ranges(primary_key, buckets, bucket_size):
+    """
+    Builds the SQL condition selecting the rows of some buckets, merging neighbouring
+    buckets into one key range.
+
+    Args:
+        primary_key (str): primary key column of the table
+        buckets (list): bucket numbers in key order, see get_changed_buckets
+        bucket_size (int): primary key values per bucket
+    Returns:
+        str: SQL condition on primary_key
+    """
+
+    ranges = []
+    for bucket in buckets:
+        if ranges and ranges[-1][1] == bucket:
+            ranges[-1][1] = bucket + 1
+        else:
+            ranges.append([bucket, bucket + 1])
+
+    return " OR ".join(
+        f"({primary_key} >= {start * bucket_size} "
+        f"AND {primary_key} < {end * bucket_size})"
+        for start, end in ranges
+    )
+
+
+def get_row_hashes(conn, table, primary_key, bucket_size, buckets=None, columns=None):
+    """
+    Hashes every row of some buckets inside PostgreSQL, the same way get_bucket_checksums
+    does, so the rows that changed in a changed bucket can be told from the ones that
+    did not.
+
+    Args:
+        conn: a connection to the ToteSys database
+        table (str): table name
+        primary_key (str): integer primary key column of the table
+        bucket_size (int): primary key values per bucket
+        buckets (list): bucket numbers to hash, None for the whole table
+        columns (list): columns to hash, None for the whole row
+    Returns:
+        dict: bucket number -> {primary key value -> md5 of the row}, keys as strings
+            like the stored manifest
+    """
+
+    if buckets is not None and not buckets:
+        return {}
+
+    row = f"ROW({', '.join(columns)})" if columns else "t"
+    where = ""
+    if buckets is not None:
+        where = f" WHERE {bucket_ranges(primary_key, buckets, bucket_size)}"
+    rows = conn.run(
+        f"SELECT floor({primary_key}::numeric / {int(bucket_size)})::bigint, "
+        f"{primary_key}, md5({row}::text) FROM {table} t{where}"
+    )
+
+    row_hashes = {}
+    for bucket, key, row_hash in rows:
+        row_hashes.setdefault(str(bucket), {})[str(key)] = row_hash
+    return row_hashes
+
+
+def get_changed_rows(row_hashes, previous_row_hashes):
+    """
+    Compares row hashes with the ones stored after the last extract.
+
+    Returns:
+        list: primary key values of the rows that are new or whose hash differs, in key
+            order. Rows gone since the last extract were deleted and are left out.
+    """
+
+    return sorted(
+        int(key)
+        for bucket, hashes in row_hashes.items()
+        for key, row_hash in hashes.items()
+        if previous_row_hashes.get(bucket, {}).get(key) != row_hash
+    )
+
+
+def keyset_predicate(primary_key, watermark, operator=">"):
+    """
+    Builds the SQL condition comparing a row's (last_updated, primary key) with a watermark.
+    A watermark without an id (carried over from last_extracted.txt) only compares
+    last_updated.
+
+    Args:
+        primary_key (str): primary key column of the table
+        watermark (dict): {"last_updated": iso timestamp, "id": primary key value}
+        operator (str): SQL comparison operator
+    Returns:
+        str: SQL condition
+    """
+
+    last_updated = f"{literal(watermark['last_updated'])}::timestamp"
+    if watermark.get("id") is None:
+        return f"last_updated {operator} {last_updated}"
+    return (
+        f"(last_updated, {primary_key}) {operator} "
+        f"({last_updated}, {literal(watermark['id'])})"
+    )
+
+
+def keyset_window(primary_key, after, upto):
+    """
+    Builds the SQL condition selecting rows after the watermark `after` and up to and
+    including the watermark `upto`. Either bound can be None to leave that side open.
+    """
+
+    conditions = []
+    if after:
+        conditions.append(keyset_predicate(primary_key, after, ">"))
+    if upto:
+        conditions.append(keyset_predicate(primary_key, upto, "<="))
+    return " AND ".join(conditions) or "TRUE"
+
+
+def get_high_water_mark(conn, table, primary_key, after=None):
+    """
+    Finds the newest row of a table in (last_updated, primary key) order.
+
+    Args:
+        conn: a connection to the ToteSys database
+        table (str): table name
+        primary_key (str): primary key column of the table
+        after (dict): only rows after this watermark are considered
+    Returns:
+        dict: {"last_updated": iso timestamp, "id": primary key value} or None
+            when there are no rows after the watermark
+    """
+
+    rows = conn.run(
+        f"SELECT last_updated, {primary_key} FROM {table} "
+        f"WHERE {keyset_window(primary_key, after, None)} "
+        f"ORDER BY last_updated DESC, {primary_key} DESC LIMIT 1"
+    )
+
+    return watermark_from_rows(rows)
+
+
+def get_page_end(conn, table, primary_key, after, upto, page_size):
+    """
+    Finds the last row of the next keyset page, i.e. the page_size-th row after the
+    watermark `after` in (last_updated, primary key) order. When fewer rows are left
+    before `upto`, the page ends at `upto`.
+
+    Args:
+        conn: a connection to the ToteSys database
+        table (str): table name
+        primary_key (str): primary key column of the table
+        after (dict): watermark the page starts after, None for the start of the table
+        upto (dict): high-water mark of the extract
+        page_size (int): maximum number of rows in the page
+    Returns:
+        dict: {"last_updated": iso timestamp, "id": primary key value}
+    """
+
+    rows = conn.run(
+        f"SELECT last_updated, {primary_key} FROM {table} "
+        f"WHERE {keyset_window(primary_key, after, upto)} "
+        f"ORDER BY last_updated, {primary_key} LIMIT 1 OFFSET {int(page_size) - 1}"
+    )
+
+    return watermark_from_rows(rows) or upto
+
+
+def watermark_from_rows(rows):
+    """Turns a [(last_updated, id)] query result into a watermark dict, None if empty."""
+    if not rows:
+        return None
+    last_updated, row_id = rows[0]
+    return {"last_updated": last_updated.isoformat(), "id": row_id}
+
+
+def load_manifest(s3_client, bucket_name, file_name):
+    """
+    Reads a JSON manifest from an AWS S3 bucket. The extract keeps its state between
+    runs in manifests: per-table watermarks, change counters, refresh times, bucket
+    checksums and extract history, and the checkpoint of an initial extract.
+
+    Returns:
+        dict: the stored manifest, empty when none has been stored yet
+    """
+
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=file_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return {}
+        raise
+    return json.loads(response["Body"].read().decode("utf-8"))
+
+
+def save_manifest(s3_client, manifest, bucket_name, file_name):
+    """Stores a JSON manifest (see load_manifest) in an AWS S3 bucket."""
+    s3_client.put_object(
+        Body=json.dumps(manifest, indent=4, sort_keys=True),
+        Bucket=bucket_name,
+        Key=file_name,
+    )
+
+
+def load_row_hashes(s3_client, bucket_name, file_name, bucket_checksum):
+    """
+    Reads the row hashes stored for one checksum bucket by save_row_hashes.
+
+    Returns:
+        dict: primary key value -> md5 of the row, empty when none are stored or they
+            were taken for another bucket checksum than bucket_checksum, e.g. by a run
+            that failed before storing its checksums
+    """
+    stored = load_manifest(s3_client, bucket_name, file_name)
+    if stored.get("checksum") != bucket_checksum:
+        return {}
+    return stored["rows"]
+
+
+def save_row_hashes(s3_client, row_hashes, bucket_checksum, bucket_name, file_name):
+    """Stores the row hashes of one checksum bucket, with the bucket checksum they were
+    taken for, in an AWS S3 bucket. Every bucket has its own object, so a run reads and
+    writes the hashes of the buckets that changed only."""
+    s3_client.put_object(
+        Body=json.dumps({"checksum": bucket_checksum, "rows": row_hashes}),
+        Bucket=bucket_name,
+        Key=file_name,
+    )
+
+
+def get_change_counters(conn):
+    """
+    Reads PostgreSQL's statistics counters of rows inserted, updated and deleted in each
+    table. A counter only moves after the transaction making the change has ended, so
+    when the counters are read before start_snapshot every change they include is
+    visible to the extract.
+
+    Args:
+        conn: a connection to the ToteSys database
+    Returns:
+        dict: table name -> number of row changes, empty when the server does not
+            track counts (track_counts = off)
+    """
+
+    rows = conn.run(
+        "SELECT relname, n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables "
+        "WHERE schemaname = 'public' AND current_setting('track_counts')::boolean"
+    )
+
+    return {table: count for table, count in rows}
+
+
+def get_live_rows(conn):
+    """
+    Reads PostgreSQL's estimate of the number of live rows in each table, kept up to
+    date by the same statistics collector as the change counters.
+
+    Args:
+        conn: a connection to the ToteSys database
+    Returns:
+        dict: table name -> estimated number of rows
+    """
+
+    rows = conn.run(
+        "SELECT relname, n_live_tup FROM pg_stat_user_tables WHERE schemaname = 'public'"
+    )
+
+    return {table: count for table, count in rows}
+
+
+def get_unchanged_tables(counters, previous_counters):
+    """
+    Compares the change counters with the ones stored after the last extract.
+    Any difference, including a counter going down after a statistics reset, counts
+    as a change.
+
+    Returns:
+        set: names of the tables whose counter has not moved
+    """
+
+    return {
+        table
+        for table, count in counters.items()
+        if previous_counters.get(table) == count
+    }
+
+
+def plan_table_strategy(
+    changed_rows, live_rows, history, full_row_seconds, incremental_cost_ratio
+):
+    """
+    Picks the cheapest way to extract a table's changes.
+
+    Both strategies extract the rows changed after the table's watermark: "full" in one
+    scan of the table (see extract_table_scan), "incremental" page by page through the
+    keyset index. The cost of a strategy is its seconds per row, times the rows it reads:
+    every live row for "full", the changed rows for "incremental". Seconds per row come from the table's
+    history (see update_extract_history). A strategy not measured yet is estimated from the
+    other one, or from full_row_seconds, as reading a row through the keyset index costs
+    about incremental_cost_ratio times reading it in a full scan.
+
+    Args:
+        changed_rows (int): rows inserted, updated or deleted since the last extract
+        live_rows (int): estimated rows in the table
+        history (dict): {"full", "incremental"} seconds per row measured for the table
+        full_row_seconds (float): seconds per row of a full extract without history
+        incremental_cost_ratio (float): cost of an incremental row over a full one
+    Returns:
+        dict: {"strategy", "changed_rows", "live_rows", "estimated_seconds"}, the strategy
+            being "skip" when nothing changed
+    """
+
+    if not changed_rows:
+        return {
+            "strategy": "skip",
+            "changed_rows": 0,
+            "live_rows": live_rows,
+            "estimated_seconds": 0,
+        }
+
+    full_rate = history.get("full")
+    incremental_rate = history.get("incremental")
+    if full_rate is None and incremental_rate is None:
+        full_rate = full_row_seconds
+    if full_rate is None:
+        full_rate = incremental_rate / incremental_cost_ratio
+    if incremental_rate is None:
+        incremental_rate = full_rate * incremental_cost_ratio
+
+    # the row estimate is missing for a table new to the statistics, and may lag behind
+    # the changes, but a scan reads at least the changed rows
+    full_cost = full_rate * max(live_rows, changed_rows)
+    incremental_cost = incremental_rate * changed_rows
+    strategy = "full" if full_cost < incremental_cost else "incremental"
+
+    return {
+        "strategy": strategy,
+        "changed_rows": changed_rows,
+        "live_rows": live_rows,
+        "estimated_seconds": min(full_cost, incremental_cost),
+    }
+
+
+def update_extract_history(history, plan, seconds, weight=0.3):
+    """
+    Folds the measured cost of a table's extract into its history, as an exponential
+    moving average of the seconds per row of the strategy used, so the next plan is
+    based on recent runs.
+
+    Args:
+        history (dict): {"full", "incremental"} seconds per row of the table, or empty
+        plan (dict): plan returned by plan_table_strategy for the run
+        seconds (float): time the table's extract took
+        weight (float): weight of this run against the history
+    Returns:
+        dict: the updated history of the table
+    """
+
+    strategy = plan["strategy"]
+    if strategy == "skip":
+        return history
+    rows = plan["changed_rows"]
+    if strategy == "full":
+        rows = plan["live_rows"] or rows
+    row_seconds = seconds / max(rows, 1)
+    previous = history.get(strategy)
+    if previous is not None:
+        row_seconds = weight * row_seconds + (1 - weight) * previous
+
+    return {**history, strategy: row_seconds}
+
+
+def install_change_triggers(conn, tables, channel):
+    """
+    Adds a trigger to every table that sends a NOTIFY on channel, with the table name as
+    payload, after each INSERT, UPDATE, DELETE or TRUNCATE statement. The triggers fire
+    once per statement and PostgreSQL folds identical notifications of a transaction
+    into one, so a bulk load sends a single notification per table. Running it again
+    replaces the triggers.
+
+    Args:
+        conn: a connection to the ToteSys database, allowed to create triggers
+        tables (list): table names
+        channel (str): notification channel
+    """
+
+    conn.run(
+        "CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$ "
+        "BEGIN PERFORM pg_notify(TG_ARGV[0], TG_TABLE_NAME); RETURN NULL; END; "
+        "$$ LANGUAGE plpgsql"
+    )
+    for table in tables:
+        conn.run(f"DROP TRIGGER IF EXISTS notify_table_change ON {table}")
+        conn.run(
+            f"CREATE TRIGGER notify_table_change "
+            f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change({literal(channel)})"
+        )
+
+
+def listen_for_changes(conn, channel):
+    """Subscribes conn to the notifications sent on channel. The subscription lasts
+    until the connection is closed, notifications sent before it are not received."""
+    conn.run(f"LISTEN {channel}")
+
+
+def stop_listening_for_changes(conn, channel):
+    """Ends the subscription made by listen_for_changes and drops the notifications
+    already received, so a connection kept for later invocations does not collect them.
+    """
+    conn.run(f"UNLISTEN {channel}")
+    conn.notifications.clear()
+
+
+def wait_for_changes(conn, channel, window, timeout, poll_interval=0.2):
+    """
+    Collects the tables notified on channel by the change triggers. Waits up to timeout
+    seconds for the first notification, then keeps collecting for window seconds, so a
+    burst of changes to several tables ends up in one batch.
+
+    pg8000 only reads notifications off the socket while it runs a query, so the
+    connection is pinged with SELECT 1 every poll_interval seconds; this reads no table.
+
+    Args:
+        conn: a connection subscribed with listen_for_changes, outside any transaction
+        channel (str): notification channel
+        window (float): seconds to batch notifications for after the first one
+        timeout (float): seconds to wait for the first notification
+        poll_interval (float): seconds between two reads of the connection
+    Returns:
+        set: names of the tables notified, empty when none was within timeout
+    """
+
+    deadline = time.monotonic() + timeout
+    changed_tables = set()
+    while True:
+        conn.run("SELECT 1")
+        while conn.notifications:
+            _, notified_channel, table = conn.notifications.popleft()
+            if notified_channel == channel:
+                if not changed_tables:
+                    deadline = min(deadline, time.monotonic() + window)
+                changed_tables.add(table)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return changed_tables
+        time.sleep(min(poll_interval, remaining))
+
+
+class ExtractCheckpoint:
+    """
+    Progress of an initial extract that may take more than one Lambda invocation.
+
+    Every stored page is recorded with the (last_updated, primary key) watermark it
+    ended at and the checkpoint is saved to S3 straight away, so an invocation that
+    runs out of time or fails part way through can be resumed from the last page
+    instead of from the start.
+
+    Args:
+        s3_client: A boto3 S3 client.
+        bucket_name (str): The name of the S3 bucket the checkpoint is stored in.
+        file_name (str): The name of the checkpoint file.
+        deadline (float): time.monotonic() value after which no new page is started,
+            None to run until every table is extracted.
+        watermarks (dict): table name -> watermark of the last stored page.
+        files (list): names of the files stored so far.
+        saved_at (float): time.time() the checkpoint was last saved at, None when it
+            has never been saved.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket_name,
+        file_name,
+        deadline=None,
+        watermarks=None,
+        files=None,
+        saved_at=None,
+    ):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self.deadline = deadline
+        self.watermarks = watermarks if watermarks is not None else {}
+        self.files = files if files is not None else []
+        self.saved_at = saved_at
+        self.finished = True
+        self._pages_recorded = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, s3_client, bucket_name, file_name, deadline=None):
+        """Reads a stored checkpoint, or starts an empty one when there is none."""
+        stored = load_manifest(s3_client, bucket_name, file_name)
+        return cls(
+            s3_client,
+            bucket_name,
+            file_name,
+            deadline,
+            stored.get("watermarks"),
+            stored.get("files"),
+            stored.get("saved_at"),
+        )
+
+    def should_stop(self):
+        """True once the deadline has passed and at least one page has been stored, so
+        every invocation makes progress. The extract is then marked unfinished, as the
+        caller leaves the rest of its table for the next invocation."""
+        if (
+            self.deadline is not None
+            and self._pages_recorded
+            and time.monotonic() >= self.deadline
+        ):
+            self.finished = False
+            return True
+        return False
+
+    def record_page(self, table, file_names, watermark):
+        """Records the files of a stored page (none when the page had no rows) and
+        saves the checkpoint."""
+        with self._lock:
+            self.files.extend(file_names)
+            self.watermarks[table] = watermark
+            self._pages_recorded += 1
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        self.saved_at = time.time()
+        save_manifest(
+            self.s3_client,
+            {
+                "watermarks": self.watermarks,
+                "files": self.files,
+                "saved_at": self.saved_at,
+            },
+            self.bucket_name,
+            self.file_name,
+        )
+
+    def delete(self):
+        """Removes the stored checkpoint once the extract is complete."""
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=self.file_name)
+
+
+def get_deadline(context, margin):
+    """
+    Returns the time.monotonic() value margin seconds before the Lambda invocation
+    times out, or None when context is not a Lambda context (e.g. in a local run).
+    """
+
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time is None:
+        return None
+    return time.monotonic() + get_remaining_time() / 1000 - margin
+
+
+def invoke_continuation(function_name, continuation):
+    """Invokes a Lambda function asynchronously with {"continuation": continuation}
+    as its event, so it carries on where this invocation stopped."""
+    lambda_client = get_client(create_lambda_client)
+    lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType="Event",
+        Payload=json.dumps({"continuation": continuation}),
+    )
+
+
+def start_snapshot(conn):
+    """
+    Opens a REPEATABLE READ, READ ONLY transaction on conn, so every query of the
+    extract sees the database as it was when the transaction started.
+
+    Args:
+        conn: a connection to the ToteSys database
+    Returns:
+        datetime: the database's own time at the start of the transaction
+    """
+
+    conn.run("START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    rows = conn.run("SELECT transaction_timestamp()::timestamp")
+
+    return rows[0][0]
+
+
+def export_snapshot(conn):
+    """Exports the snapshot of the transaction open on conn so other connections can
+    share it with join_snapshot. Returns the snapshot id."""
+    return conn.run("SELECT pg_export_snapshot()")[0][0]
+
+
+def join_snapshot(conn, snapshot_id):
+    """
+    Opens a REPEATABLE READ, READ ONLY transaction on conn that uses a snapshot exported
+    by another connection, so parallel workers read exactly the same data.
+
+    Args:
+        conn: a connection to the ToteSys database
+        snapshot_id (str): id returned by export_snapshot
+    """
+
+    conn.run("START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    conn.run(f"SET TRANSACTION SNAPSHOT {literal(snapshot_id)}")
+
+
+def try_extract_lock(conn, lock_name):
+    """
+    Takes the session-level advisory lock named lock_name on the ToteSys database without
+    waiting for it. Invocations extracting the same database from other Lambda containers
+    hold their own sessions, so only one of them gets the lock at a time; the lock is
+    released by release_extract_lock, or by the database when the connection closes.
+
+    Args:
+        conn: a connection to the ToteSys database
+        lock_name (str): name of the lock, hashed into the advisory lock key
+    Returns:
+        bool: True when the lock was taken, False when another session holds it
+    """
+
+    rows = conn.run(f"SELECT pg_try_advisory_lock(hashtext({literal(lock_name)}))")
+    return rows[0][0]
+
+
+def release_extract_lock(conn, lock_name):
+    """Releases the advisory lock taken by try_extract_lock."""
+    conn.run(f"SELECT pg_advisory_unlock(hashtext({literal(lock_name)}))")
@@ -1,15 +1,19 @@
 import os
 import logging
 from load_utils import (
-    connect,
+    get_connection,
+    discard_connection,
     create_s3_client,
     load_parquet_from_s3,
     insert_data_to_table
 )
+from cached_resources import get_client
 from botocore.exceptions import ClientError
 from urllib.parse import unquote
 
 S3_BUCKET = "banana-squad-processed-data"
+# reference snapshots the transform keeps in the processed bucket, not warehouse tables
+REFERENCE_PREFIX = "reference"
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -30,12 +34,15 @@ def lambda_handler(event, context):
         decoded_key = unquote(s3_key)
         logger.info(f"Processing S3 key: {decoded_key}")
         table_name = decoded_key.split("/")[0]
+        if table_name == REFERENCE_PREFIX:
+            logger.info(f"Skipping reference snapshot {decoded_key}")
+            return
 
-        s3_client = create_s3_client()
-        conn = connect()
+        s3_client = get_client(create_s3_client)
+        conn = get_connection()
 
         try:
-            df = load_parquet_from_s3(s3_client, S3_BUCKET, decoded_key)
+            table = load_parquet_from_s3(s3_client, S3_BUCKET, decoded_key)
             valid_tables = [
                 "fact_sales_order",
                 "dim_staff",
@@ -49,11 +56,12 @@ def lambda_handler(event, context):
                 logger.error(f"Unexpected table name: {table_name}")
                 raise ValueError(f"Unexpected table name: {table_name}")
 
-            insert_data_to_table(conn, table_name, df)
+            insert_data_to_table(conn, table_name, table)
 
-        finally:
-            conn.close()
+        except Exception:
+            discard_connection()
             logger.info("Database connection closed.")
+            raise
 
     except ClientError as e:
         if e.response['Error']['Code'] == 'NoSuchKey':
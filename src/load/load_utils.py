@@ -1,40 +1,14 @@
 import boto3
 import pg8000
-import pandas as pd
 import logging
-import json
 import io
+from cached_resources import get_secret, ConnectionHolder
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 PROCESSED_BUCKET = "banana-squad-processed-data"
 
-def get_secret(secret_name, region_name="eu-west-2"):
-    """
-    Retrieves a secret from AWS Secrets Manager.
-
-    Args:
-        secret_name (str): The name of the secret in Secrets Manager
-        region_name (str): The AWS region where the Secrets Manager is hosted
-    Returns:
-        dict: A dictionary of the secret values.
-    """
-    logger.info("Fetching database secrets...")
-    try:
-        client = boto3.client("secretsmanager", region_name=region_name)
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        if "SecretString" in get_secret_value_response:
-            secret = get_secret_value_response["SecretString"]
-            return json.loads(secret)
-        else:
-            raise ValueError("Secret is stored as binary; function expects JSON.")
-    except Exception as e:
-        logger.error(f"Failed to retrieve secret: {e}")
-        raise RuntimeError(f"Failed to retrieve secret: {e}")
-
-
 def connect():
     """
     Establish a connection to the ToteSys database.
@@ -60,6 +34,20 @@ def connect():
         raise RuntimeError(f"Error connecting to database: {e}")
 
 
+warehouse_connection = ConnectionHolder(lambda: connect(), "datawarehouse_credentials")
+
+
+def get_connection():
+    """Returns the connection to the data warehouse kept for this Lambda container,
+    opening a new one when there is none or it is no longer usable."""
+    return warehouse_connection.get()
+
+
+def discard_connection():
+    """Closes the kept connection to the data warehouse, e.g. after a failed load."""
+    warehouse_connection.discard()
+
+
 def create_s3_client():
     """Initialize and return an S3 client."""
     logger.info("Creating S3 client...")
@@ -67,12 +55,16 @@ def create_s3_client():
 
 
 def load_parquet_from_s3(s3_client, bucket, key):
-    """Download and read a Parquet file from S3 into a Pandas DataFrame."""
+    """Download and read a Parquet file from S3 into a pyarrow Table.
+    pyarrow is imported on the first load rather than with the module, and pandas is
+    not needed at all, which keeps the Lambda's cold start short."""
+    import pyarrow.parquet as pq
+
     logger.info(f"Loading Parquet file from S3: bucket={bucket}, key={key}")
     try:
         obj = s3_client.get_object(Bucket=bucket, Key=key)
         body = io.BytesIO(obj["Body"].read())
-        return pd.read_parquet(body)
+        return pq.read_table(body)
     except s3_client.exceptions.NoSuchKey:
         logger.error(f"Key {key} not found in bucket {bucket}.")
         raise
@@ -80,17 +72,19 @@ def load_parquet_from_s3(s3_client, bucket, key):
         logger.error(f"Error loading parquet file from S3: {e}")
         raise
 
-def insert_data_to_table(conn, table_name, df):
+def insert_data_to_table(conn, table_name, table):
     """
-    Insert DataFrame data into the specified database table.
+    Insert the rows of a pyarrow Table into the specified database table.
+    Column values are converted to Python objects (int, Decimal, datetime, ...),
+    which pg8000 sends with their own types.
     Handles duplicates using ON CONFLICT.
     """
     logger.info(f"Inserting data into table {table_name} with conflict handling...")
     try:
         with conn.cursor() as cur:
-            rows = df.to_records(index=False)
-            columns = ", ".join(df.columns)
-            placeholders = ", ".join(["%s"] * len(df.columns))
+            rows = zip(*(column.to_pylist() for column in table.columns))
+            columns = ", ".join(table.column_names)
+            placeholders = ", ".join(["%s"] * len(table.column_names))
 
             query = f"""
                 INSERT INTO {table_name} ({columns})
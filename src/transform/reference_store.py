@@ -0,0 +1,198 @@
+import io
+import logging
+import pandas as pd
+from botocore.exceptions import ClientError
+from table_policies import TRANSFORM_SOURCES, SOURCE_COLUMN
+from table_schemas import apply_table_schema
+
+logger = logging.getLogger()
+
+PROCESSED_BUCKET = "banana-squad-processed-data"
+
+# Prefix of the reference snapshots in the processed bucket. The load Lambda, triggered
+# by every object created in the bucket, ignores the keys under it.
+REFERENCE_PREFIX = "reference"
+
+# Primary key of every table kept in the reference store. Rows of several ToteSys
+# databases are keyed on their SOURCE_COLUMN as well, see get_source_columns.
+REFERENCE_KEYS = {
+    "counterparty": "counterparty_id",
+    "address": "address_id",
+    "staff": "staff_id",
+    "department": "department_id",
+}
+
+# Dimensions joining a main table to lookup tables:
+# dimension -> (main table, {lookup table: column of the main table holding its key})
+# Every reference table belongs to one dimension only, so the dimensions of a run can
+# update their snapshots at the same time.
+DIMENSION_JOINS = {
+    "dim_counterparty": ("counterparty", {"address": "legal_address_id"}),
+    "dim_staff": ("staff", {"department": "department_id"}),
+}
+
+
+def get_snapshot_key(table):
+    """Returns the key of a table's reference snapshot in the processed bucket."""
+    return f"{REFERENCE_PREFIX}/{table}.parquet"
+
+
+def load_snapshot(s3_client, table, bucket=PROCESSED_BUCKET):
+    """
+    Reads the reference snapshot of a table.
+
+    Returns:
+        pd.DataFrame: the current row of every key seen so far, with the table's
+            dtypes, or None when the table has no snapshot yet
+    """
+    try:
+        obj = s3_client.get_object(Bucket=bucket, Key=get_snapshot_key(table))
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise
+    return apply_table_schema(pd.read_parquet(io.BytesIO(obj["Body"].read())), table)
+
+
+def save_snapshot(s3_client, table, snapshot, bucket=PROCESSED_BUCKET):
+    """Stores the reference snapshot of a table as Parquet."""
+    parquet_buffer = io.BytesIO()
+    snapshot.to_parquet(parquet_buffer, index=False)
+    s3_client.put_object(
+        Body=parquet_buffer.getvalue(), Bucket=bucket, Key=get_snapshot_key(table)
+    )
+
+
+def get_source_columns(*frames):
+    """Returns [SOURCE_COLUMN] when the rows of every DataFrame given are tagged with the
+    ToteSys database they come from, so they are keyed and joined on it as well as on
+    their ids, which overlap between databases, otherwise []."""
+    frames = [frame for frame in frames if frame is not None]
+    if frames and all(SOURCE_COLUMN in frame.columns for frame in frames):
+        return [SOURCE_COLUMN]
+    return []
+
+
+def rows_in(frame, columns, other, other_columns):
+    """Returns a boolean Series telling which rows of frame have values in columns
+    matching the values of a row of other in other_columns."""
+    values = pd.MultiIndex.from_frame(frame[columns].astype(object))
+    other_values = pd.MultiIndex.from_frame(
+        other[other_columns].astype(object), names=columns
+    )
+    return pd.Series(values.isin(other_values), index=frame.index)
+
+
+def upsert_rows(snapshot, delta, key):
+    """
+    Returns a snapshot with the rows of delta in place of the rows with the same key,
+    and the rows of new keys added. When delta holds a key more than once, its last
+    row is kept.
+
+    Args:
+        snapshot (pd.DataFrame): current snapshot, or None when there is none yet
+        delta (pd.DataFrame): rows ingested in this run
+        key (str or list): primary key column, or the columns of a composite key
+    Returns:
+        pd.DataFrame: the updated snapshot, sorted by key
+    """
+    key = [key] if isinstance(key, str) else list(key)
+    delta = delta.drop_duplicates(subset=key, keep="last")
+    if snapshot is not None:
+        kept = snapshot[~rows_in(snapshot, key, delta, key)]
+        if not kept.empty:
+            delta = pd.concat([kept, delta], ignore_index=True)
+    return delta.sort_values(key).reset_index(drop=True)
+
+
+def get_dimension_inputs(s3_client, dimension, data_frames, read_table=None):
+    """
+    Upserts the rows ingested in this run into the reference snapshots of a joined
+    dimension's tables, and returns the rows the dimension has to be recomputed from:
+    the main table rows that changed or reference a lookup row that changed, and the
+    lookup rows they reference. The work done grows with the rows ingested, not with
+    the size of the tables.
+
+    A table without a snapshot is seeded with read_table, and every row of a seeded
+    table counts as changed. When a table has neither a snapshot nor rows, the
+    dimension is skipped and no snapshot is saved, so the rows ingested in this run
+    are upserted by a later run seeding the table again.
+
+    Args:
+        s3_client: a boto3 S3 client
+        dimension (str): a dimension in DIMENSION_JOINS
+        data_frames (dict): table name -> DataFrame of the rows ingested in this run
+        read_table (callable): table name -> DataFrame of every row ingested so far,
+            oldest first, or None when it has none or can not be read
+    Returns:
+        list: DataFrames in the order of the dimension's TRANSFORM_SOURCES, or None
+            when nothing in the dimension changed or a table has no rows yet
+    """
+    main, lookups = DIMENSION_JOINS[dimension]
+    tables = [main, *lookups]
+    if not any(table in data_frames for table in tables):
+        return None
+
+    snapshots = {table: load_snapshot(s3_client, table) for table in tables}
+    seeded = []
+    for table in tables:
+        rows = read_table(table) if snapshots[table] is None and read_table else None
+        if rows is not None:
+            # rows are read oldest first, so the last row of a key is its current one
+            key = get_source_columns(rows) + [REFERENCE_KEYS[table]]
+            snapshots[table] = upsert_rows(None, rows, key)
+            seeded.append(table)
+
+    missing = [
+        table
+        for table in tables
+        if snapshots[table] is None and table not in data_frames
+    ]
+    if missing:
+        logger.warning(f"Skipping {dimension}, no reference rows yet for {missing}")
+        return None
+
+    # rows that changed in this run, every row of a seeded table
+    changes = {}
+    for table in tables:
+        if table in data_frames:
+            delta = data_frames[table]
+            key = get_source_columns(snapshots[table], delta) + [REFERENCE_KEYS[table]]
+            snapshot = upsert_rows(snapshots[table], delta, key)
+            # categories that differ between snapshot and delta are concatenated as strings
+            snapshots[table] = apply_table_schema(snapshot, table)
+            changes[table] = delta
+        if table in seeded:
+            changes[table] = snapshots[table]
+        if table in changes:
+            save_snapshot(s3_client, table, snapshots[table])
+
+    # rows of several ToteSys databases only match rows of their own database
+    source = get_source_columns(*snapshots.values(), *changes.values())
+    main_rows = snapshots[main]
+    affected = pd.Series(False, index=main_rows.index)
+    if main in changes:
+        main_key = source + [REFERENCE_KEYS[main]]
+        affected |= rows_in(main_rows, main_key, changes[main], main_key)
+    for lookup, column in lookups.items():
+        if lookup in changes:
+            lookup_key = source + [REFERENCE_KEYS[lookup]]
+            affected |= rows_in(
+                main_rows, source + [column], changes[lookup], lookup_key
+            )
+    if not affected.any():
+        return None
+
+    rows = {main: main_rows[affected].reset_index(drop=True)}
+    for lookup, column in lookups.items():
+        lookup_rows = snapshots[lookup]
+        referenced = rows_in(
+            lookup_rows,
+            source + [REFERENCE_KEYS[lookup]],
+            rows[main],
+            source + [column],
+        )
+        rows[lookup] = lookup_rows[referenced].reset_index(drop=True)
+
+    logger.info(f"Recomputing {len(rows[main])} rows of {dimension}")
+    return [rows[table] for table in TRANSFORM_SOURCES[dimension]]
@@ -0,0 +1,191 @@
+import logging
+import pandas as pd
+from timestamps import parse_timestamps
+from table_policies import SOURCE_COLUMN
+
+logger = logging.getLogger()
+
+# Column types the ingested CSV files are read with, as pyarrow type names. Columns that
+# are left out are inferred, which suits ids, quantities, prices and timestamps. Text
+# columns are listed so values that look like numbers or dates (postal codes, phone
+# numbers, payment dates) are kept exactly as they are in ToteSys.
+CSV_COLUMN_TYPES = {
+    "sales_order": {
+        "agreed_delivery_date": "string",
+        "agreed_payment_date": "string",
+    },
+    "staff": {
+        "first_name": "string",
+        "last_name": "string",
+        "email_address": "string",
+    },
+    "department": {
+        "department_name": "string",
+        "location": "string",
+        "manager": "string",
+    },
+    "counterparty": {
+        "counterparty_legal_name": "string",
+        "commercial_contact": "string",
+        "delivery_contact": "string",
+    },
+    "address": {
+        "address_line_1": "string",
+        "address_line_2": "string",
+        "district": "string",
+        "city": "string",
+        "postal_code": "string",
+        "country": "string",
+        "phone": "string",
+    },
+    "currency": {"currency_code": "string"},
+    "design": {
+        "design_name": "string",
+        "file_location": "string",
+        "file_name": "string",
+    },
+}
+
+
+def get_csv_column_types(table):
+    """Returns the column name -> pyarrow type name of the columns of a table that are
+    not left to type inference when its CSV files are read. The source id the extract
+    adds to the rows of several ToteSys databases is always text."""
+    return {**CSV_COLUMN_TYPES.get(table, {}), SOURCE_COLUMN: "string"}
+
+
+# dtypes the DataFrames of the ingested tables are converted to once they are read, so
+# they take less memory through the transforms' merges than pandas' inferred types:
+#   "Int16"/"Int32": nullable integers narrowed to the range of ToteSys' keys and counts
+#   "category": strings with few distinct values, stored once with integer codes
+#   "decimal(p, s)": prices as fixed-precision decimals, as in ToteSys' numeric(p, s)
+#   "datetime": timestamps parsed to datetime64, whether they were read as such or text
+# Columns left out, or missing from a file because the extract did not select them,
+# keep the type they were read with.
+TABLE_DTYPES = {
+    "sales_order": {
+        "sales_order_id": "Int32",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+        "design_id": "Int32",
+        "staff_id": "Int32",
+        "counterparty_id": "Int32",
+        "units_sold": "Int32",
+        "unit_price": "decimal(10, 2)",
+        "currency_id": "Int16",
+        "agreed_delivery_date": "category",
+        "agreed_payment_date": "category",
+        "agreed_delivery_location_id": "Int32",
+    },
+    "staff": {
+        "staff_id": "Int32",
+        "department_id": "Int16",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+    },
+    "department": {
+        "department_id": "Int16",
+        "department_name": "category",
+        "location": "category",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+    },
+    "counterparty": {
+        "counterparty_id": "Int32",
+        "legal_address_id": "Int32",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+    },
+    "address": {
+        "address_id": "Int32",
+        "district": "category",
+        "city": "category",
+        "country": "category",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+    },
+    "currency": {
+        "currency_id": "Int16",
+        "currency_code": "category",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+    },
+    "design": {
+        "design_id": "Int32",
+        "design_name": "category",
+        "file_location": "category",
+        "created_at": "datetime",
+        "last_updated": "datetime",
+    },
+}
+
+
+def get_table_dtypes(table):
+    """Returns the column name -> dtype of the columns of a table converted by
+    apply_table_schema, the source id of rows from several ToteSys databases included.
+    """
+    return {**TABLE_DTYPES.get(table, {}), SOURCE_COLUMN: "category"}
+
+
+def convert_column(series, dtype):
+    """Converts a column to one of the dtypes used in TABLE_DTYPES."""
+    if dtype == "datetime":
+        return parse_timestamps(series)
+
+    if dtype.startswith("decimal("):
+        import pyarrow as pa
+
+        precision, scale = (int(n) for n in dtype[len("decimal(") : -1].split(","))
+        if pd.api.types.is_float_dtype(series):
+            series = series.round(scale)
+        return series.astype(pd.ArrowDtype(pa.decimal128(precision, scale)))
+
+    return series.astype(dtype)
+
+
+def get_memory_usage(df):
+    """Returns the bytes taken by the columns of a DataFrame, strings included."""
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def apply_table_schema(df, table, report=None):
+    """
+    Converts the columns of an ingested table's DataFrame to their TABLE_DTYPES.
+    A column whose values do not fit its dtype keeps the type it was read with.
+
+    Args:
+        df (pd.DataFrame): DataFrame read from one of the table's files
+        table (str): table name
+        report (dict): when given, the bytes the DataFrame took before and after the
+            conversion are added to report[table], see add_to_memory_report
+    Returns:
+        pd.DataFrame: df, with its columns converted
+    """
+    dtypes = get_table_dtypes(table)
+    before = get_memory_usage(df) if report is not None else None
+
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+        try:
+            df[column] = convert_column(df[column], dtype)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Keeping {table}.{column} as {df[column].dtype}: {e}")
+
+    if report is not None:
+        add_to_memory_report(report, table, before, get_memory_usage(df))
+    return df
+
+
+def add_to_memory_report(report, table, inferred_bytes, schema_bytes):
+    """Adds the bytes a table's DataFrame took with inferred types and with its
+    TABLE_DTYPES to report[table], along with the bytes and percentage saved."""
+    entry = report.setdefault(table, {"inferred_bytes": 0, "schema_bytes": 0})
+    entry["inferred_bytes"] += inferred_bytes
+    entry["schema_bytes"] += schema_bytes
+    entry["saved_bytes"] = entry["inferred_bytes"] - entry["schema_bytes"]
+    entry["saved_percent"] = (
+        round(100 * entry["saved_bytes"] / entry["inferred_bytes"], 1)
+        if entry["inferred_bytes"]
+        else 0.0
+    )
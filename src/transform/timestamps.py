@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 1_000_000_000
+
+
+def parse_timestamps(series):
+    """
+    Parses a column of ISO 8601 timestamps, with or without fractional seconds, in one
+    vectorised pass. Each distinct value is parsed once and the result is spread back
+    over the rows, so the repeated timestamps of a bulk insert cost nothing extra.
+    Columns that already hold datetimes (e.g. read from Parquet) are returned as they
+    are.
+
+    Args:
+        series (pd.Series): timestamps as text, e.g. "2022-11-03 14:20:52.186000" or
+            "2022-11-03 14:20:52"
+    Returns:
+        pd.Series: datetime64 column, NaT where a value is missing or not a timestamp
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        # every value is missing, there is nothing to spread back over the rows
+        return pd.Series(
+            pd.NaT, index=series.index, name=series.name, dtype="datetime64[ns]"
+        )
+    parsed = pd.to_datetime(
+        pd.Series(uniques, dtype=object), format="ISO8601", errors="coerce"
+    )
+    values = parsed.to_numpy().take(codes)
+    values[codes == -1] = np.datetime64("NaT")
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def get_date_ids(dates):
+    """
+    Returns the YYYYMMDD integer key of dim_date for every date, computed from the year,
+    month and day numbers instead of formatting each date as a string.
+
+    Args:
+        dates: datetime64 pd.Series or pd.DatetimeIndex
+    Returns:
+        pd.Series: Int32 keys, missing where a date is NaT
+    """
+    dates = pd.Series(dates)
+    date_ids = dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day
+    return date_ids.astype("Int32")
+
+
+def split_timestamps(series):
+    """
+    Splits a column of timestamps into the date and time columns of the star schema.
+
+    The date and time columns are stored as Arrow date32 and time64 arrays, 4 and 8
+    bytes a row, rather than as Python date and time objects, and are written to Parquet
+    as DATE and TIME.
+
+    Args:
+        series (pd.Series): timestamps, as text or datetimes, see parse_timestamps
+    Returns:
+        pd.DataFrame: "date", "time" and the dim_date key "date_id" of every timestamp
+    """
+    import pyarrow as pa
+
+    timestamps = parse_timestamps(series)
+    missing = timestamps.isna().to_numpy()
+    nanoseconds = timestamps.to_numpy(dtype="datetime64[ns]").view("int64")
+    days, nanoseconds_of_day = np.divmod(nanoseconds, NANOSECONDS_PER_DAY)
+
+    dates = pa.array(days.astype("int32"), type=pa.date32(), mask=missing)
+    times = pa.array(nanoseconds_of_day // 1000, type=pa.time64("us"), mask=missing)
+    return pd.DataFrame(
+        {
+            "date": pd.Series(
+                dates, index=series.index, dtype=pd.ArrowDtype(pa.date32())
+            ),
+            "time": pd.Series(
+                times, index=series.index, dtype=pd.ArrowDtype(pa.time64("us"))
+            ),
+            "date_id": get_date_ids(timestamps),
+        }
+    )
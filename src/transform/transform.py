@@ -1,25 +1,345 @@
 import pandas as pd
 import boto3
 import io
+import os
+import time
 import urllib.parse
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from botocore.config import Config
 from transform_utils import fact_sales_order, dim_staff, dim_counterparty, dim_location, dim_currency, dim_date, dim_design
+from table_policies import TRANSFORM_SOURCES
+from table_schemas import get_csv_column_types, apply_table_schema, add_to_memory_report
+from reference_store import DIMENSION_JOINS, get_dimension_inputs
+from cached_resources import get_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_data_frame(s3_client, bucket, key):
-    """Fetches and returns a DataFrame from an S3 bucket."""
-    try:
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
+# "pyarrow" parses ingested CSV files straight from their bytes with pyarrow's
+# multi-threaded reader, "pandas" decodes them and reads them with pandas.read_csv
+TRANSFORM_CSV_ENGINE = os.environ.get("TRANSFORM_CSV_ENGINE", "pyarrow")
+
+# files of a report fetched and parsed at the same time, and the seconds one file may
+# take before it is reported as failed
+TRANSFORM_FETCH_WORKERS = int(os.environ.get("TRANSFORM_FETCH_WORKERS", "8"))
+TRANSFORM_FETCH_TIMEOUT = float(os.environ.get("TRANSFORM_FETCH_TIMEOUT", "60"))
+
+# transform and upload nodes of the transform graph run at the same time
+TRANSFORM_WORKERS = int(os.environ.get("TRANSFORM_WORKERS", "4"))
+
+PROCESSED_BUCKET = "banana-squad-processed-data"
+
+# "1" keeps reference snapshots of the tables joined into dimensions (see
+# reference_store), so a change to a lookup table recomputes the dimension rows using
+# it, "0" transforms only the rows ingested in the run
+TRANSFORM_REFERENCE_STORE = os.environ.get("TRANSFORM_REFERENCE_STORE", "1") == "1"
+
+def create_s3_client():
+    """Creates the S3 client of the transform Lambda, with a connection for every
+    fetch worker."""
+    return boto3.client(
+        "s3",
+        region_name='eu-west-2',
+        config=Config(max_pool_connections=max(10, TRANSFORM_FETCH_WORKERS)),
+    )
+
+
+def read_csv_bytes(body, table):
+    """Parses the bytes of an ingested CSV file into a DataFrame without decoding them
+    to a str first. The file is parsed on several threads with the column types in
+    table_schemas; an unquoted empty value is read as null and a quoted one as an empty
+    string, the way PostgreSQL's COPY writes them."""
+    import pyarrow as pa
+    from pyarrow import csv
+
+    arrow_table = csv.read_csv(
+        pa.BufferReader(body),
+        read_options=csv.ReadOptions(use_threads=True),
+        convert_options=csv.ConvertOptions(
+            column_types=get_csv_column_types(table),
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    # frees the Arrow buffers column by column as the DataFrame is built
+    return arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_data_frame(s3_client, bucket, key, memory_report=None):
+    """Fetches and returns a DataFrame from an S3 bucket.
+    Keys ending in .parquet are read as Parquet, keeping the column types of the
+    source table, anything else is read as CSV. The columns are then converted to the
+    table's dtypes in table_schemas, and the memory this saves is added to
+    memory_report when one is given."""
+    table = key.split("/")[0]
+    obj = s3_client.get_object(Bucket=bucket, Key=key)
+    if key.endswith(".parquet"):
+        df = pd.read_parquet(io.BytesIO(obj['Body'].read()))
+    elif TRANSFORM_CSV_ENGINE == "pyarrow":
+        df = read_csv_bytes(obj['Body'].read(), table)
+    else:
         file_stream = io.StringIO(obj['Body'].read().decode('utf-8'))
-        return pd.read_csv(file_stream)
+        df = pd.read_csv(file_stream)
+    return apply_table_schema(df, table, memory_report)
+
+
+def get_data_frame(s3_client, bucket, key, memory_report=None):
+    """Same as read_data_frame, but returns None when the file can not be read."""
+    try:
+        return read_data_frame(s3_client, bucket, key, memory_report)
     except Exception as e:
         print(f"Error loading DataFrame for key '{key}': {e}")
         return None
 
 
+def fetch_data_frames(
+    s3_client, bucket, keys, memory_report=None, workers=None, timeout=None
+):
+    """
+    Fetches and parses the files of a report on a bounded thread pool, so the S3 round
+    trips of the files overlap instead of adding up.
+
+    A file still being read timeout seconds after its worker picked it up is reported
+    as failed and left behind; its thread finishes in the background but its result is
+    not used.
+
+    Args:
+        s3_client: a boto3 S3 client
+        bucket (str): bucket the files are in
+        keys (list): keys of the files
+        memory_report (dict): when given, the memory saved by the table schemas of the
+            files read is added to it, see apply_table_schema
+        workers (int): files read at the same time, defaults to TRANSFORM_FETCH_WORKERS
+        timeout (float): seconds one file may take, defaults to TRANSFORM_FETCH_TIMEOUT
+    Returns:
+        tuple: (dict key -> DataFrame of every file read, in the order of keys,
+            dict key -> error message of every file that failed or timed out)
+    """
+    workers = TRANSFORM_FETCH_WORKERS if workers is None else workers
+    timeout = TRANSFORM_FETCH_TIMEOUT if timeout is None else timeout
+    frames, errors = {}, {}
+    if not keys:
+        return frames, errors
+
+    started = {}
+
+    def fetch(key):
+        started[key] = time.monotonic()
+        report = {}
+        return read_data_frame(s3_client, bucket, key, report), report
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(keys))))
+    futures = {executor.submit(fetch, key): key for key in keys}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(
+                pending, timeout=min(timeout, 0.1), return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                key = futures[future]
+                try:
+                    frames[key], report = future.result()
+                except Exception as e:
+                    errors[key] = f"{type(e).__name__}: {e}"
+                    continue
+                if memory_report is not None:
+                    for table, entry in report.items():
+                        add_to_memory_report(
+                            memory_report,
+                            table,
+                            entry["inferred_bytes"],
+                            entry["schema_bytes"],
+                        )
+
+            now = time.monotonic()
+            for future in list(pending):
+                key = futures[future]
+                if key in started and now - started[key] > timeout:
+                    errors[key] = f"timed out after {timeout} seconds"
+                    pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return {key: frames[key] for key in keys if key in frames}, errors
+
+
+def run_graph(nodes, values, workers=None):
+    """
+    Runs a graph of nodes on a bounded thread pool, each node as soon as the nodes it
+    reads from have finished, so independent nodes run at the same time.
+
+    Args:
+        nodes (dict): node name -> (function, list of input names). An input is a key of
+            values or the name of another node. A node is called with the inputs that
+            are available, in the order listed, and is skipped when it has inputs and
+            none of them is available. A node returning None produces no output.
+        values (dict): inputs available from the start, e.g. the ingested tables
+        workers (int): nodes run at the same time, defaults to TRANSFORM_WORKERS
+    Returns:
+        tuple: (dict node name -> output of every node that produced one,
+            dict node name -> seconds every node that ran took)
+    Raises:
+        The first exception raised by a node, once the nodes already running have
+        finished. Nodes that had not started by then are not run.
+        ValueError: when the nodes read from each other in a cycle
+    """
+    workers = TRANSFORM_WORKERS if workers is None else workers
+    outputs = dict(values)
+    timings = {}
+    waiting = dict(nodes)
+    running = {}
+    first_error = None
+
+    def timed(function, args):
+        start = time.perf_counter()
+        result = function(*args)
+        return result, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while waiting or running:
+            if first_error is not None:
+                waiting.clear()
+            unfinished = set(waiting) | set(running.values())
+            for name, (function, inputs) in list(waiting.items()):
+                if any(input_name in unfinished for input_name in inputs):
+                    continue
+                del waiting[name]
+                args = [outputs[i] for i in inputs if i in outputs]
+                if inputs and not args:
+                    continue
+                running[executor.submit(timed, function, args)] = name
+
+            if not running:
+                if waiting:
+                    raise ValueError(f"Transform graph has a cycle: {sorted(waiting)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    logger.error(f"Transform node {name} failed: {e}")
+                    first_error = first_error or e
+                    continue
+                timings[name] = round(seconds, 3)
+                if result is not None:
+                    outputs[name] = result
+
+    if first_error is not None:
+        raise first_error
+    return {name: outputs[name] for name in nodes if name in outputs}, timings
+
+
+def read_ingested_table(s3_client, bucket, table):
+    """
+    Reads every file ever ingested for a table, oldest first, to seed its reference
+    snapshot, see get_dimension_inputs.
+
+    Returns:
+        pd.DataFrame: the rows of every file with the table's dtypes, or None when the
+            table has no files or one of them can not be read
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = sorted(
+        obj["Key"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{table}/")
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith((".csv", ".parquet"))
+    )
+    if not keys:
+        return None
+    frames, errors = fetch_data_frames(s3_client, bucket, keys)
+    if errors:
+        logger.error(f"Can not seed reference rows of '{table}': {errors}")
+        return None
+    df = pd.concat(list(frames.values()), ignore_index=True)
+    # categories that differ between files are concatenated as strings
+    return apply_table_schema(df, table)
+
+
+def get_output_path(table, key):
+    """Returns the key a transformed table is stored under in the processed bucket,
+    dated like the ingested file key it was transformed from."""
+    year, month, day, file_name = key.split('/')[1:5]
+    file_name = file_name.rsplit(".", 1)[0]
+    return f"{table}/{year}/{month}/{day}/{file_name}.parquet"
+
+
+def get_transform_nodes(s3_client, key, data_frames=None, bucket=None):
+    """
+    Returns the nodes of the transform graph, see run_graph. Every transform reads
+    the ingested tables in TRANSFORM_SOURCES and writes a table of the same name,
+    which an upload node (named "<table>.parquet") serialises and stores in the
+    processed bucket while the other transforms carry on.
+
+    With TRANSFORM_REFERENCE_STORE on, the dimensions in DIMENSION_JOINS read their
+    tables from a "<table>.inputs" node instead, which updates the reference snapshots
+    with data_frames and returns the rows to recompute, see get_dimension_inputs. A
+    table without a snapshot is seeded from its files in bucket, see
+    read_ingested_table.
+
+    Tables read by several transforms are passed to each as a shallow copy, so one
+    transform's column changes are not seen by another.
+
+    Args:
+        s3_client: a boto3 S3 client
+        key (str): an ingested file key of the run, which dates the output keys
+        data_frames (dict): table name -> DataFrame of the rows ingested in the run
+        bucket (str): the ingested bucket, when given reference snapshots are seeded
+            from it
+    """
+    # looked up when called, so the transform functions can be patched in tests
+    transform_functions = {
+        "fact_sales_order": fact_sales_order,
+        "dim_counterparty": dim_counterparty,
+        "dim_currency": dim_currency,
+        "dim_location": dim_location,
+        "dim_design": dim_design,
+        "dim_staff": dim_staff,
+    }
+
+    def transform(function):
+        return lambda *frames: function(*[df.copy(deep=False) for df in frames])
+
+    def dimension_inputs(table):
+        def read_table(name):
+            return read_ingested_table(s3_client, bucket, name)
+
+        return lambda: get_dimension_inputs(
+            s3_client, table, data_frames or {}, read_table if bucket else None
+        )
+
+    def transform_inputs(function):
+        return lambda inputs: function(*inputs)
+
+    def upload(table):
+        def store(result_table):
+            output_path = get_output_path(table, key)
+            parquet_buffer = io.BytesIO()
+            result_table.to_parquet(parquet_buffer, index=False)
+            s3_client.put_object(Body=parquet_buffer.getvalue(), Bucket=PROCESSED_BUCKET, Key=output_path)
+            print(f"Processed and uploaded file: {output_path}")
+            return output_path
+
+        return store
+
+    nodes = {}
+    for table, function in transform_functions.items():
+        if TRANSFORM_REFERENCE_STORE and table in DIMENSION_JOINS:
+            nodes[f"{table}.inputs"] = (dimension_inputs(table), [])
+            nodes[table] = (transform_inputs(function), [f"{table}.inputs"])
+        else:
+            # the sources are shared with the extract, which only extracts tables read here
+            nodes[table] = (transform(function), TRANSFORM_SOURCES[table])
+        nodes[f"{table}.parquet"] = (upload(table), [table])
+    return nodes
+
+
 def lambda_handler(event, context):
 
     """
@@ -29,11 +349,16 @@ def lambda_handler(event, context):
         Parameters:
             triggered upon addition of a report to the Ingested Bucket
             event contains information about all recently updated tables
+            a report of a sharded extract lists the files of every source, and the files
+            of a table are unioned into one DataFrame whatever source they come from
+
+            the transforms run as a graph (see get_transform_nodes), each as soon as its
+            tables are read, and the seconds every transform and upload took are logged
 
         Returns: string declaring success or failure
     """
 
-    s3_client = boto3.client("s3", region_name='eu-west-2')
+    s3_client = get_client(create_s3_client)
 
     bucket = event['Records'][0]['s3']['bucket']['name']
     key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']
@@ -45,45 +370,34 @@ def lambda_handler(event, context):
     success_data = json.loads(obj['Body'].read().decode('utf-8'))
 
     updated_tables = success_data.get("updated_tables", [])
-    transformations = {
-        fact_sales_order: ["sales_order"],
-        dim_counterparty: ["counterparty", "address"],
-        dim_currency: ["currency"],
-        dim_location: ["address"],
-        dim_design: ["design"],
-        dim_staff: ["staff", "department"]
-    }
-
-    data_frames = {}
-    for table in updated_tables:
-        df = get_data_frame(s3_client, bucket, table)
-        if df is not None:
-            df.name = table.split("/")[0]
-            data_frames[df.name] = df
-        else:
-            print(f"Skipping table '{table}' due to load error.")
 
-    processed_files = set()
-    for transform_function, sources in transformations.items():
-        relevant_data_frames = [
-            data_frames[source] for source in sources if source in data_frames
-        ]
-        if relevant_data_frames:
-            result_table = transform_function(*relevant_data_frames)
+    memory_report = {}
+    frames, errors = fetch_data_frames(s3_client, bucket, updated_tables, memory_report)
+    for table, error in errors.items():
+        logger.error(f"Skipping table '{table}' due to load error: {error}")
 
-            year, month, day, file_name = table.split('/')[1:5]
-            output_path = f"{transform_function.__name__}/{year}/{month}/{day}/{file_name[:-4]}.parquet"
+    table_frames = {}
+    for table, df in frames.items():
+        table_frames.setdefault(table.split("/")[0], []).append(df)
 
-            if output_path not in processed_files:
-                processed_files.add(output_path)
-
-                parquet_buffer = io.BytesIO()
-                result_table.to_parquet(parquet_buffer, index=False)
+    data_frames = {}
+    for table_name, dfs in table_frames.items():
+        df = dfs[0]
+        if len(dfs) > 1:
+            df = pd.concat(dfs, ignore_index=True)
+            # categories that differ between files are concatenated as strings
+            df = apply_table_schema(df, table_name)
+        df.name = table_name
+        data_frames[table_name] = df
+    logger.info(f"Memory saved by table schemas: {json.dumps(memory_report)}")
 
-                s3_client.put_object(Body=parquet_buffer.getvalue(), Bucket="banana-squad-processed-data", Key=output_path)
-                print(f"Processed and uploaded file: {output_path}")
+    if data_frames:
+        _, timings = run_graph(
+            get_transform_nodes(s3_client, table, data_frames, bucket), data_frames
+        )
+        logger.info(f"Transform node seconds: {json.dumps(timings)}")
 
-    response = s3_client.list_objects(Bucket="banana-squad-processed-data")
+    response = s3_client.list_objects(Bucket=PROCESSED_BUCKET)
     if "Contents" in response and not any(
         obj["Key"] == "dim_date/2024/11/25/15:00:00.00000.parquet" for obj in response["Contents"]
     ):
@@ -91,7 +405,7 @@ def lambda_handler(event, context):
         parquet_buffer = io.BytesIO()
         date_table.to_parquet(parquet_buffer, index=False)
         output_path = "dim_date/2024/11/25/15:00:00.00000.parquet"
-        s3_client.put_object(Body=parquet_buffer.getvalue(), Bucket="banana-squad-processed-data", Key=output_path)
+        s3_client.put_object(Body=parquet_buffer.getvalue(), Bucket=PROCESSED_BUCKET, Key=output_path)
         print(f"Processed and uploaded dim_date table: {output_path}")
 
     return "Transformation completed"
\ No newline at end of file
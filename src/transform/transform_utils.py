@@ -1,38 +1,12 @@
-import boto3
-import pg8000
 import pandas as pd
 import logging
-import json
-import io
-import pg8000.native
+from cached_resources import get_secret, ConnectionHolder
+from timestamps import split_timestamps, get_date_ids
+from table_policies import SOURCE_COLUMN
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_secret(secret_name, region_name="eu-west-2"):
-    """
-    Retrieves a secret from AWS Secrets Manager.
-
-    Args:
-        secret_name (str): The name of the secret in Secrets Manager
-        region_name (str): The AWS region where the Secrets Manager is hosted
-    Returns:
-        dict: A dictionary of the secret values.
-    """
-    logger.info("Fetching database secrets...")
-    try:
-        client = boto3.client("secretsmanager", region_name=region_name)
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-
-        if "SecretString" in get_secret_value_response:
-            secret = get_secret_value_response["SecretString"]
-            return json.loads(secret)
-        else:
-            raise ValueError("Secret is stored as binary; function expects JSON.")
-    except Exception as e:
-        logger.error(f"Failed to retrieve secret: {e}")
-        raise RuntimeError(f"Failed to retrieve secret: {e}")
-
 def connect():
     """
     Establish a connection to the ToteSys database.
@@ -40,6 +14,9 @@ def connect():
     Returns:
         pg8000.Connection: A connection to the data warehouse
     """
+    # only fact_sales_order reads the warehouse, so pg8000 is imported when it connects
+    import pg8000
+
     logger.info("Establishing database connection...")
     secret_name = "datawarehouse_credentials"
     secret = get_secret(secret_name)
@@ -52,11 +29,27 @@ def connect():
             host=secret["host"],
             port=secret["port"]
         )
+        # the connection only reads and is kept across invocations, so every query is
+        # committed at once rather than leaving it idle in a transaction holding locks
+        conn.autocommit = True
         return conn
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         raise RuntimeError(f"Error connecting to database: {e}")    
 
+warehouse_connection = ConnectionHolder(lambda: connect(), "datawarehouse_credentials")
+
+def get_connection():
+    """Returns the connection to the data warehouse kept for this Lambda container,
+    opening a new one when there is none or it is no longer usable."""
+    return warehouse_connection.get()
+
+def source_columns(*dfs):
+    """Returns [SOURCE_COLUMN] when the rows of every DataFrame are tagged with the ToteSys
+    database they come from (see EXTRACT_SOURCES in the extract), as the ids of several
+    databases overlap and the dimensions are keyed and joined on both, otherwise []."""
+    return [SOURCE_COLUMN] if all(SOURCE_COLUMN in df.columns for df in dfs) else []
+
 def table_has_data(conn):
     query = "SELECT EXISTS (SELECT 1 FROM fact_sales_order LIMIT 1)"
     result = conn.run(query)
@@ -76,7 +69,7 @@ def fact_sales_order(df):
     Should return transformed dataframe to be used by Lambda Handler.
     """
 
-    conn = connect()
+    conn = get_connection()
 
     if table_has_data(conn):
         current_max_id = get_current_max_id(conn)
@@ -84,29 +77,17 @@ def fact_sales_order(df):
     
     else:
         df["sales_record_id"] = range(1, len(df) + 1)
-    
-    conn.close()
 
     df.fillna(value=pd.NA, inplace=True)
 
     df.rename(columns={"staff_id": "sales_staff_id"}, inplace=True)
 
-    df["created_at"] = df["created_at"].apply(
-        lambda x: x if "." in x else x + ".000000"
-    )
-    df["created_at"] = pd.to_datetime(
-        df["created_at"], format="%Y-%m-%d %H:%M:%S.%f", errors="coerce"
-    )
-    df["created_date"] = df["created_at"].dt.date
-    df["created_time"] = df["created_at"].dt.time   
-    df["last_updated"] = df["last_updated"].apply(
-        lambda x: x if "." in x else x + ".000000"
-    )
-    df["last_updated"] = pd.to_datetime(
-        df["last_updated"], format="%Y-%m-%d %H:%M:%S.%f", errors="coerce"
-    )
-    df["last_updated_date"] = df["last_updated"].dt.date
-    df["last_updated_time"] = df["last_updated"].dt.time
+    created = split_timestamps(df["created_at"])
+    df["created_date"] = created["date"]
+    df["created_time"] = created["time"]
+    last_updated = split_timestamps(df["last_updated"])
+    df["last_updated_date"] = last_updated["date"]
+    df["last_updated_time"] = last_updated["time"]
     df.drop(columns=["created_at", "last_updated"], inplace=True)
     return df
 
@@ -141,6 +122,7 @@ def dim_counterparty(df1, df2):
         # last_updated
 
     Returns dim_counterparty dataframe with:
+        # source_id, when the rows come from several ToteSys databases
         # counterparty_id
         # counterparty_legal_name
         # counterparty_legal_address_line_1
@@ -152,12 +134,17 @@ def dim_counterparty(df1, df2):
         # counterparty_legal_phone_number
     """
 
+    source = source_columns(df1, df2)
     merged_df = pd.merge(
-        df1, df2, left_on="legal_address_id", right_on="address_id", how="inner"
+        df1,
+        df2,
+        left_on=source + ["legal_address_id"],
+        right_on=source + ["address_id"],
+        how="inner",
     )
 
     dim_counterparty = merged_df[
-        [
+        source + [
             "counterparty_id",
             "counterparty_legal_name",
             "address_line_1",
@@ -206,7 +193,8 @@ def dim_currency(df):
 
     df["currency_name"] = df["currency_code"].map(currency_map)
 
-    df.drop(columns=["created_at", "last_updated"], inplace=True)
+    # the extract may only have selected the columns used here, see TRANSFORM_COLUMNS
+    df.drop(columns=["created_at", "last_updated"], inplace=True, errors="ignore")
 
     return df
 
@@ -232,7 +220,7 @@ def dim_date(start="2022-01-01", end="2024-12-31"):
     dates = pd.date_range(start=start, end=end)
     df = pd.DataFrame(
         {
-            "date_id": dates.strftime("%Y%m%d").astype(int),
+            "date_id": get_date_ids(dates),
             "year": dates.year,
             "month": dates.month,
             "day": dates.day,
@@ -248,6 +236,7 @@ def dim_date(start="2022-01-01", end="2024-12-31"):
 def dim_design(df):
     """
     Transforms the design table into the dim_design table for the star schema.
+    Designs of several ToteSys databases are told apart by their source_id.
 
     Args:
         df (pd.DataFrame): Raw design table DataFrame.
@@ -255,11 +244,12 @@ def dim_design(df):
     Returns:
         dim_design (pd.DataFrame): Transformed dim_design DataFrame.
     """
-    dim_design = df[["design_id", "design_name", "file_location", "file_name"]]
+    key = source_columns(df) + ["design_id"]
+    dim_design = df[key + ["design_name", "file_location", "file_name"]]
 
-    dim_design = dim_design.drop_duplicates(subset=["design_id"])
+    dim_design = dim_design.drop_duplicates(subset=key)
 
-    dim_design = dim_design.sort_values(by="design_id").reset_index(drop=True)
+    dim_design = dim_design.sort_values(by=key).reset_index(drop=True)
 
     return dim_design
 
@@ -282,13 +272,17 @@ def dim_location(df):
 
     dim_location = dim_location.fillna(value=pd.NA)
 
-    dim_location = dim_location.drop(columns=["created_at", "last_updated"])
+    dim_location = dim_location.drop(
+        columns=["created_at", "last_updated"], errors="ignore"
+    )
 
     return dim_location
 
 def dim_staff(df1, df2):
     """
     Transforms the staff and department DataFrames to create dim_staff.
+    Rows of several ToteSys databases keep their source_id and only join the
+    departments of their own database.
 
     Args:
         staff_df (pd.DataFrame): DataFrame containing staff table data.
@@ -300,14 +294,15 @@ def dim_staff(df1, df2):
     staff_df = df1
     department_df = df2
 
+    source = source_columns(staff_df, department_df)
     dim_staff = staff_df.merge(
-        department_df[["department_id", "department_name", "location"]],
+        department_df[source + ["department_id", "department_name", "location"]],
         how="left",
-        on="department_id",
+        on=source + ["department_id"],
     )
 
     dim_staff = dim_staff[
-        [
+        source + [
             "staff_id",
             "first_name",
             "last_name",
@@ -319,6 +314,6 @@ def dim_staff(df1, df2):
 
     dim_staff = dim_staff.drop_duplicates()
 
-    dim_staff = dim_staff.sort_values(by="staff_id").reset_index(drop=True)
+    dim_staff = dim_staff.sort_values(by=source + ["staff_id"]).reset_index(drop=True)
 
     return dim_staff
\ No newline at end of file
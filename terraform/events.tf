@@ -18,3 +18,42 @@ resource "aws_lambda_permission" "allow_cloudwatch_to_call_extract" {
     source_arn = aws_cloudwatch_event_rule.scheduler.arn
 }
 
+
+# Optional low-latency extract: every minute an invocation listens for the notifications
+# of the change triggers for extract_listen_seconds and extracts the tables notified.
+# Install the triggers first by invoking the extract with {"install_change_triggers": true}.
+# An invocation listens to one database, so every source in extract_sources gets its own.
+locals {
+  listener_sources = var.extract_listen_seconds > 0 ? (
+    length(jsondecode(var.extract_sources)) > 0
+    ? [for source in jsondecode(var.extract_sources) : source.id]
+    : [""]
+  ) : []
+}
+
+resource "aws_cloudwatch_event_rule" "listener" {
+  count               = var.extract_listen_seconds > 0 ? 1 : 0
+  name                = "extract-change-listener"
+  description         = "listens-for-changes-every-minute"
+  schedule_expression = "rate(1 minute)"
+}
+
+resource "aws_cloudwatch_event_target" "lambda-target-listener" {
+    for_each = toset(local.listener_sources)
+    rule = aws_cloudwatch_event_rule.listener[0].name
+    target_id = each.key == "" ? "listen-for-changes" : "listen-for-changes-${each.key}"
+    arn = aws_lambda_function.extract.arn
+    input = jsonencode(merge(
+      { listen = var.extract_listen_seconds },
+      { for id in [each.key] : "source" => id if id != "" }
+    ))
+}
+
+resource "aws_lambda_permission" "allow_cloudwatch_to_call_listener" {
+    count = var.extract_listen_seconds > 0 ? 1 : 0
+    statement_id = "AllowExecutionFromCloudWatchListener"
+    action = "lambda:InvokeFunction"
+    function_name = aws_lambda_function.extract.function_name
+    principal = "events.amazonaws.com"
+    source_arn = aws_cloudwatch_event_rule.listener[0].arn
+}
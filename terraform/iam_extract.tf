@@ -27,7 +27,7 @@ resource "aws_iam_policy" "extract_lambda_policy" {
     Version = "2012-10-17"
     Statement = [
       {
-        Action = ["s3:GetObject", "s3:PutObject"],
+        Action = ["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
         Effect = "Allow",
         Resource = "arn:aws:s3:::banana-squad-code/*"
       },
@@ -37,7 +37,7 @@ resource "aws_iam_policy" "extract_lambda_policy" {
         Resource = "arn:aws:s3:::banana-squad-code"
       },
       {
-        Action = ["s3:PutObject"],
+        Action = ["s3:PutObject", "s3:AbortMultipartUpload"],
         Effect = "Allow",
         Resource = "arn:aws:s3:::banana-squad-ingested-data/*"
       },
@@ -54,7 +54,15 @@ resource "aws_iam_policy" "extract_lambda_policy" {
       {
         Action = ["secretsmanager:GetSecretValue"],
         Effect = "Allow",
-        Resource = "arn:aws:secretsmanager:eu-west-2:${data.aws_caller_identity.current.account_id}:secret:database_credentials*"
+        Resource = concat(
+          ["arn:aws:secretsmanager:eu-west-2:${data.aws_caller_identity.current.account_id}:secret:database_credentials*"],
+          [for source in jsondecode(var.extract_sources) : "arn:aws:secretsmanager:eu-west-2:${data.aws_caller_identity.current.account_id}:secret:${source.secret}*"]
+        )
+      },
+      {
+        Action = ["lambda:InvokeFunction"],
+        Effect = "Allow",
+        Resource = "arn:aws:lambda:eu-west-2:${data.aws_caller_identity.current.account_id}:function:${var.lambda_name}"
       },
       {
         Action = ["sns:Publish"],
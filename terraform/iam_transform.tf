@@ -37,6 +37,11 @@ resource "aws_iam_policy" "transform_lambda_policy" {
         Effect = "Allow",
         Resource = "arn:aws:s3:::banana-squad-processed-data/*"
       },
+      {
+        Action = ["s3:GetObject"],
+        Effect = "Allow",
+        Resource = "arn:aws:s3:::banana-squad-processed-data/reference/*"
+      },
       {
         Action = [
           "logs:CreateLogGroup",
@@ -18,6 +18,16 @@ data "archive_file" "extract_lambda" {
     filename = "util_functions.py"
   }
 
+  source {
+    content  = file("${path.module}/../src/common/cached_resources.py")
+    filename = "cached_resources.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/common/table_policies.py")
+    filename = "table_policies.py"
+  }
+
   output_path      = "${path.module}/../extract_function.zip"
 }
 
@@ -30,9 +40,28 @@ resource "aws_lambda_function" "extract" {
   handler          = "extract.lambda_handler"
   source_code_hash = data.archive_file.extract_lambda.output_base64sha256
   runtime          = var.python_runtime
-  layers           = [aws_lambda_layer_version.dependency_layer.arn]
+  layers           = [
+    aws_lambda_layer_version.dependency_layer.arn,
+    "arn:aws:lambda:eu-west-2:336392948345:layer:AWSSDKPandas-Python312:14" # provides pyarrow for Parquet output
+  ]
   timeout          = 120
   depends_on       = [aws_lambda_layer_version.dependency_layer]
+
+  environment {
+    variables = {
+      EXTRACT_MODE            = var.extract_mode
+      EXTRACT_FORMAT          = var.extract_format
+      EXTRACT_BATCH_SIZE      = var.extract_batch_size
+      EXTRACT_PAGE_SIZE       = var.extract_page_size
+      EXTRACT_WORKERS         = var.extract_workers
+      EXTRACT_DEADLINE_MARGIN = var.extract_deadline_margin
+      EXTRACT_TABLE_POLICIES  = var.extract_table_policies
+      EXTRACT_UPLOAD_WORKERS  = var.extract_upload_workers
+      EXTRACT_UPLOAD_QUEUE    = var.extract_upload_queue
+      EXTRACT_SOURCES         = var.extract_sources
+      EXTRACT_SOURCE_WORKERS  = var.extract_source_workers
+    }
+  }
 }
 
 data "archive_file" "transform_lambda" {
@@ -47,6 +76,27 @@ data "archive_file" "transform_lambda" {
     content  = file("${path.module}/../src/transform/transform_utils.py")
     filename = "transform_utils.py"
   } 
+  source {
+    content  = file("${path.module}/../src/transform/table_schemas.py")
+    filename = "table_schemas.py"
+  }
+  source {
+    content  = file("${path.module}/../src/transform/timestamps.py")
+    filename = "timestamps.py"
+  }
+  source {
+    content  = file("${path.module}/../src/transform/reference_store.py")
+    filename = "reference_store.py"
+  }
+  source {
+    content  = file("${path.module}/../src/common/cached_resources.py")
+    filename = "cached_resources.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/common/table_policies.py")
+    filename = "table_policies.py"
+  }
 
   output_path = "${path.module}/../transform_function.zip"
 }
@@ -77,6 +127,10 @@ data "archive_file" "load_lambda" {
     content  = file("${path.module}/../src/load/load_utils.py")
     filename = "load_utils.py"
   } 
+  source {
+    content  = file("${path.module}/../src/common/cached_resources.py")
+    filename = "cached_resources.py"
+  }
 
   output_path = "${path.module}/../load_function.zip"
 }
@@ -22,4 +22,72 @@ variable "processed_data_bucket_prefix" {
 variable "code_bucket_prefix" {
   type    = string
   default = "banana-squad-code"
-}
\ No newline at end of file
+}
+
+variable "extract_mode" {
+  type    = string
+  default = "copy"
+}
+
+variable "extract_format" {
+  type    = string
+  default = "csv"
+}
+
+variable "extract_batch_size" {
+  type    = number
+  default = 10000
+}
+
+variable "extract_page_size" {
+  type    = number
+  default = 500000
+}
+
+variable "extract_workers" {
+  type    = number
+  default = 4
+}
+
+variable "extract_upload_workers" {
+  type    = number
+  default = 2
+}
+
+variable "extract_upload_queue" {
+  type    = number
+  default = 4
+}
+
+variable "extract_deadline_margin" {
+  type    = number
+  default = 30
+}
+
+# JSON object of table name -> policy fields overriding src/common/table_policies.py,
+# e.g. {"payment": {"skip_if_unconsumed": false}}
+variable "extract_table_policies" {
+  type    = string
+  default = "{}"
+}
+
+# Seconds every listening invocation waits for change notifications, 0 turns the
+# change listener off. Keep it under a minute so listeners do not overlap.
+variable "extract_listen_seconds" {
+  type    = number
+  default = 0
+}
+
+# JSON list of the ToteSys databases to extract, each with an id tagging its files and
+# the name of the Secrets Manager secret holding its credentials, e.g.
+# [{"id": "eu", "secret": "totesys_eu"}, {"id": "us", "secret": "totesys_us"}]
+# Empty for the single database in the database_credentials secret
+variable "extract_sources" {
+  type    = string
+  default = "[]"
+}
+
+variable "extract_source_workers" {
+  type    = number
+  default = 4
+}
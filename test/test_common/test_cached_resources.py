@@ -0,0 +1,146 @@
+import json
+import boto3
+import pytest
+from moto import mock_aws
+from unittest.mock import MagicMock, patch
+from cached_resources import (
+    get_secret,
+    invalidate_secret,
+    get_client,
+    clear_clients,
+    ConnectionHolder,
+    secret_cache,
+)
+
+SECRET_VALUES = {"user": "test-user", "password": "test-password"}
+
+
+@pytest.fixture(autouse=True)
+def empty_secret_cache():
+    invalidate_secret()
+    yield
+    invalidate_secret()
+
+
+@pytest.fixture
+def secrets_client():
+    with mock_aws():
+        client = boto3.client("secretsmanager", region_name="eu-west-2")
+        client.create_secret(Name="test-secret", SecretString=json.dumps(SECRET_VALUES))
+        yield client
+
+
+class TestGetSecret:
+    def test_returns_secret_values(self, secrets_client):
+        assert get_secret("test-secret") == SECRET_VALUES
+
+    def test_second_call_is_served_from_cache(self, secrets_client):
+        get_secret("test-secret")
+
+        with patch("boto3.client") as mock_boto_client:
+            result = get_secret("test-secret")
+
+        assert result == SECRET_VALUES
+        mock_boto_client.assert_not_called()
+
+    def test_expired_secret_is_fetched_again(self, secrets_client):
+        get_secret("test-secret", ttl=0)
+        secrets_client.put_secret_value(
+            SecretId="test-secret", SecretString=json.dumps({"user": "rotated"})
+        )
+
+        assert get_secret("test-secret") == {"user": "rotated"}
+
+    def test_invalidated_secret_is_fetched_again(self, secrets_client):
+        get_secret("test-secret")
+        invalidate_secret("test-secret")
+
+        assert "test-secret" not in secret_cache
+
+    def test_failure_raises_runtime_error_and_is_not_cached(self):
+        with patch("boto3.client") as mock_boto_client:
+            mock_boto_client.return_value.get_secret_value.side_effect = Exception(
+                "Secret not found"
+            )
+            with pytest.raises(RuntimeError, match="Failed to retrieve secret:"):
+                get_secret("missing-secret")
+
+        assert "missing-secret" not in secret_cache
+
+
+class TestConnectionHolder:
+    def test_reuses_live_connection(self):
+        conn = MagicMock()
+        connect_fn = MagicMock(return_value=conn)
+        holder = ConnectionHolder(connect_fn)
+
+        assert holder.get() is conn
+        assert holder.get() is conn
+        connect_fn.assert_called_once()
+        conn.run.assert_called_once_with("SELECT 1")
+
+    def test_reconnects_when_connection_is_dead(self):
+        dead_conn = MagicMock()
+        dead_conn.run.side_effect = Exception("connection closed")
+        new_conn = MagicMock()
+        holder = ConnectionHolder(MagicMock(side_effect=[dead_conn, new_conn]))
+
+        holder.get()
+
+        assert holder.get() is new_conn
+        dead_conn.close.assert_called_once()
+
+    def test_discard_closes_connection(self):
+        conn = MagicMock()
+        holder = ConnectionHolder(MagicMock(return_value=conn))
+        holder.get()
+
+        holder.discard()
+
+        conn.close.assert_called_once()
+        assert holder.conn is None
+
+    def test_retries_with_fresh_secret_when_connect_fails(self):
+        conn = MagicMock()
+        connect_fn = MagicMock(side_effect=[Exception("password rejected"), conn])
+        secret_cache["db-secret"] = (float("inf"), {"password": "old"})
+        holder = ConnectionHolder(connect_fn, "db-secret")
+
+        assert holder.get() is conn
+        assert "db-secret" not in secret_cache
+
+    def test_connect_error_is_raised_without_secret_name(self):
+        holder = ConnectionHolder(MagicMock(side_effect=Exception("refused")))
+
+        with pytest.raises(Exception, match="refused"):
+            holder.get()
+
+
+class TestGetClient:
+    @pytest.fixture(autouse=True)
+    def empty_client_cache(self):
+        clear_clients()
+        yield
+        clear_clients()
+
+    def test_creates_client_once_per_container(self):
+        create_fn = MagicMock()
+
+        assert get_client(create_fn) is get_client(create_fn)
+        create_fn.assert_called_once()
+
+    def test_keeps_one_client_per_factory(self):
+        create_s3 = MagicMock()
+        create_lambda = MagicMock()
+
+        assert get_client(create_s3) is create_s3.return_value
+        assert get_client(create_lambda) is create_lambda.return_value
+
+    def test_failed_creation_is_not_cached(self):
+        client = MagicMock()
+        create_fn = MagicMock(side_effect=[Exception("no credentials"), client])
+
+        with pytest.raises(Exception, match="no credentials"):
+            get_client(create_fn)
+
+        assert get_client(create_fn) is client
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+from table_policies import (
+    get_consumed_tables,
+    get_table_policy,
+    is_table_due,
+    get_extract_columns,
+    DEFAULT_TABLE_POLICY,
+)
+
+
+def test_consumed_tables_are_the_transform_sources():
+    assert get_consumed_tables() == {
+        "sales_order",
+        "counterparty",
+        "address",
+        "currency",
+        "design",
+        "staff",
+        "department",
+    }
+
+
+def test_tables_without_policy_get_the_default():
+    assert get_table_policy("design") == DEFAULT_TABLE_POLICY
+
+
+def test_unconsumed_tables_are_never_due():
+    assert not is_table_due("payment", {}, 1000)
+
+
+def test_consumed_table_without_refresh_interval_is_always_due():
+    assert is_table_due("sales_order", {"sales_order": 999}, 1000)
+
+
+def test_reference_table_is_due_once_refresh_interval_has_passed():
+    refreshed_at = {"currency": 0}
+
+    assert not is_table_due("currency", refreshed_at, 60 * 60)
+    assert is_table_due("currency", refreshed_at, 24 * 60 * 60)
+
+
+def test_table_never_extracted_is_due():
+    assert is_table_due("currency", {}, 1000)
+
+
+@patch(
+    "table_policies.EXTRACT_TABLE_POLICIES",
+    {"payment": {"skip_if_unconsumed": False}, "currency": {"refresh_seconds": 0}},
+)
+def test_environment_policies_override_the_declared_ones():
+    assert is_table_due("payment", {}, 1000)
+    assert is_table_due("currency", {"currency": 999}, 1000)
+
+
+def test_extract_columns_are_the_union_of_transform_columns():
+    assert get_extract_columns("address", "address_id") == [
+        "address_id",
+        "last_updated",
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ]
+
+
+def test_extract_columns_include_watermark_columns():
+    assert get_extract_columns("currency", "currency_id") == [
+        "currency_id",
+        "last_updated",
+        "currency_code",
+    ]
+
+
+def test_all_columns_when_a_transform_reads_the_whole_table():
+    assert get_extract_columns("sales_order", "sales_order_id") is None
+
+
+def test_all_columns_of_unconsumed_tables():
+    assert get_extract_columns("payment", "payment_id") is None
+
+
+@patch("table_policies.EXTRACT_TABLE_POLICIES", {"design": {"project_columns": False}})
+def test_projection_can_be_turned_off_per_table():
+    assert get_extract_columns("design", "design_id") is None
@@ -0,0 +1,85 @@
+from util_functions import (
+    get_bucket_checksums,
+    get_changed_buckets,
+    bucket_ranges,
+    get_row_hashes,
+    get_changed_rows,
+)
+from unittest.mock import MagicMock
+
+
+def test_checksums_are_computed_per_bucket_in_the_database():
+    conn = MagicMock()
+    conn.run.return_value = [[0, 99, "aaa"], [1, 100, "bbb"]]
+
+    result = get_bucket_checksums(conn, "payment", "payment_id", 100)
+
+    assert result == {"0": [99, "aaa"], "1": [100, "bbb"]}
+    query = conn.run.call_args.args[0]
+    assert "floor(payment_id::numeric / 100)::bigint AS bucket" in query
+    assert "md5(string_agg(md5(t::text), '' ORDER BY payment_id))" in query
+    assert query.endswith("FROM payment t GROUP BY bucket")
+
+
+def test_checksums_can_cover_only_some_columns():
+    conn = MagicMock()
+    conn.run.return_value = []
+
+    assert (
+        get_bucket_checksums(conn, "staff", "staff_id", 10, ["staff_id", "email"]) == {}
+    )
+    assert "md5(ROW(staff_id, email)::text)" in conn.run.call_args.args[0]
+
+
+def test_new_and_changed_buckets_are_found_in_key_order():
+    checksums = {"10": [5, "x"], "2": [5, "b"], "1": [5, "a"], "3": [5, "c"]}
+    previous = {"1": [5, "a"], "2": [5, "old"], "3": [5, "c"], "4": [5, "gone"]}
+
+    assert get_changed_buckets(checksums, previous) == [2, 10]
+
+
+def test_every_bucket_changed_without_stored_checksums():
+    assert get_changed_buckets({"0": [1, "a"], "1": [1, "b"]}, {}) == [0, 1]
+
+
+def test_neighbouring_buckets_are_read_as_one_range():
+    assert bucket_ranges("id", [0, 1, 3], 100) == (
+        "(id >= 0 AND id < 200) OR (id >= 300 AND id < 400)"
+    )
+
+
+def test_row_hashes_are_computed_for_the_changed_buckets_only():
+    conn = MagicMock()
+    conn.run.return_value = [[1, 120, "x"], [1, 150, "y"], [3, 310, "z"]]
+
+    result = get_row_hashes(conn, "payment", "payment_id", 100, [1, 3], ["payment_id"])
+
+    assert result == {"1": {"120": "x", "150": "y"}, "3": {"310": "z"}}
+    query = conn.run.call_args.args[0]
+    assert "md5(ROW(payment_id)::text)" in query
+    assert query.endswith(
+        "FROM payment t WHERE (payment_id >= 100 AND payment_id < 200) "
+        "OR (payment_id >= 300 AND payment_id < 400)"
+    )
+
+
+def test_row_hashes_of_the_whole_table():
+    conn = MagicMock()
+    conn.run.return_value = []
+
+    assert get_row_hashes(conn, "payment", "payment_id", 100) == {}
+    assert conn.run.call_args.args[0].endswith("FROM payment t")
+
+
+def test_no_row_hashes_without_changed_buckets():
+    conn = MagicMock()
+
+    assert get_row_hashes(conn, "payment", "payment_id", 100, []) == {}
+    conn.run.assert_not_called()
+
+
+def test_only_new_and_changed_rows_are_found_in_key_order():
+    row_hashes = {"1": {"150": "y", "120": "new", "110": "a"}, "3": {"310": "z"}}
+    previous = {"1": {"110": "a", "120": "old", "150": "y", "160": "gone"}}
+
+    assert get_changed_rows(row_hashes, previous) == [120, 310]
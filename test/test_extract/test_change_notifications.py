@@ -0,0 +1,102 @@
+from util_functions import (
+    install_change_triggers,
+    listen_for_changes,
+    stop_listening_for_changes,
+    wait_for_changes,
+)
+from pg8000.native import Connection
+from collections import deque
+from unittest.mock import MagicMock
+import os
+import pytest
+import uuid
+
+
+def test_triggers_are_installed_on_every_table():
+    conn = MagicMock()
+
+    install_change_triggers(conn, ["staff", "payment"], "totesys_changes")
+
+    queries = [call.args[0] for call in conn.run.call_args_list]
+    assert "CREATE OR REPLACE FUNCTION notify_table_change()" in queries[0]
+    assert "pg_notify(TG_ARGV[0], TG_TABLE_NAME)" in queries[0]
+    assert queries[1] == "DROP TRIGGER IF EXISTS notify_table_change ON staff"
+    assert "ON staff FOR EACH STATEMENT" in queries[2]
+    assert "notify_table_change('totesys_changes')" in queries[2]
+    assert "ON payment" in queries[4]
+
+
+def test_notifications_are_batched_by_table():
+    conn = MagicMock()
+    conn.notifications = deque(
+        [
+            (1, "totesys_changes", "staff"),
+            (1, "other_channel", "design"),
+            (2, "totesys_changes", "staff"),
+            (2, "totesys_changes", "payment"),
+        ]
+    )
+
+    changed = wait_for_changes(conn, "totesys_changes", window=0, timeout=5)
+
+    assert changed == {"staff", "payment"}
+    conn.run.assert_called_with("SELECT 1")
+
+
+def test_nothing_is_returned_when_no_notification_arrives():
+    conn = MagicMock()
+    conn.notifications = deque()
+
+    assert wait_for_changes(conn, "totesys_changes", 1, 0.05, 0.01) == set()
+
+
+def test_stopping_drops_the_queued_notifications():
+    conn = MagicMock()
+    conn.notifications = deque([(1, "totesys_changes", "staff")])
+
+    stop_listening_for_changes(conn, "totesys_changes")
+
+    conn.run.assert_called_once_with("UNLISTEN totesys_changes")
+    assert not conn.notifications
+
+
+@pytest.fixture
+def local_database():
+    """Connection to a local PostgreSQL, set TOTESYS_TEST_PGHOST (and the other
+    TOTESYS_TEST_PG* variables) to run the tests using it."""
+    if "TOTESYS_TEST_PGHOST" not in os.environ:
+        pytest.skip("TOTESYS_TEST_PGHOST is not set")
+
+    def connect():
+        return Connection(
+            host=os.environ["TOTESYS_TEST_PGHOST"],
+            port=int(os.environ.get("TOTESYS_TEST_PGPORT", "5432")),
+            user=os.environ.get("TOTESYS_TEST_PGUSER", "postgres"),
+            password=os.environ.get("TOTESYS_TEST_PGPASSWORD", "postgres"),
+            database=os.environ.get("TOTESYS_TEST_PGDATABASE", "postgres"),
+        )
+
+    conn = connect()
+    table = f"notify_test_{uuid.uuid4().hex[:8]}"
+    conn.run(f"CREATE TABLE {table} (id int PRIMARY KEY, last_updated timestamp)")
+    yield connect, table
+    conn.run(f"DROP TABLE {table}")
+    conn.close()
+
+
+def test_changes_made_on_another_connection_are_notified(local_database):
+    connect, table = local_database
+    listener, writer = connect(), connect()
+    try:
+        install_change_triggers(writer, [table], "totesys_changes_test")
+        listen_for_changes(listener, "totesys_changes_test")
+
+        writer.run(f"INSERT INTO {table} VALUES (1, now()), (2, now())")
+        writer.run(f"UPDATE {table} SET last_updated = now()")
+
+        changed = wait_for_changes(listener, "totesys_changes_test", 0.5, 5)
+        assert changed == {table}
+        assert wait_for_changes(listener, "totesys_changes_test", 0.5, 0.5) == set()
+    finally:
+        listener.close()
+        writer.close()
@@ -0,0 +1,28 @@
+from util_functions import get_change_counters, get_unchanged_tables
+from unittest.mock import MagicMock
+
+
+def test_change_counters_are_read_per_table():
+    conn = MagicMock()
+    conn.run.return_value = [["staff", 12], ["payment", 0]]
+
+    assert get_change_counters(conn) == {"staff": 12, "payment": 0}
+    query = conn.run.call_args.args[0]
+    assert "pg_stat_user_tables" in query
+    assert "current_setting('track_counts')" in query
+
+
+def test_tables_with_the_same_counter_are_unchanged():
+    counters = {"staff": 12, "payment": 4}
+
+    assert get_unchanged_tables(counters, {"staff": 12, "payment": 3}) == {"staff"}
+
+
+def test_new_tables_and_reset_counters_count_as_changed():
+    counters = {"staff": 2, "payment": 4}
+
+    assert get_unchanged_tables(counters, {"staff": 12}) == set()
+
+
+def test_no_tables_are_unchanged_without_stored_counters():
+    assert get_unchanged_tables({"staff": 12}, {}) == set()
@@ -1,5 +1,5 @@
 import pytest
-from util_functions import connect
+from util_functions import connect, get_connection, database_connections
 from unittest.mock import patch, MagicMock
 
 
@@ -47,3 +47,14 @@ def test_connect_missing_key():
     with patch("util_functions.get_secret", return_value=mock_secret):
         with pytest.raises(KeyError, match="password"):
             connect()
+
+
+def test_every_secret_gets_its_own_kept_connection():
+    with patch("util_functions.connect", side_effect=lambda name: MagicMock(name=name)):
+        eu = get_connection("test_totesys_eu")
+        us = get_connection("test_totesys_us")
+
+        assert eu is not us
+        assert get_connection("test_totesys_eu") is eu
+        database_connections.pop("test_totesys_eu")
+        database_connections.pop("test_totesys_us")
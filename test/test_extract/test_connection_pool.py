@@ -0,0 +1,62 @@
+from util_functions import connection_pool, borrowed_connections
+from unittest.mock import MagicMock
+import pytest
+
+
+def test_pool_holds_conn_and_new_connections():
+    conn = MagicMock()
+    extra_connections = [MagicMock(), MagicMock()]
+    connect_fn = MagicMock(side_effect=extra_connections)
+
+    with connection_pool(conn, 3, connect_fn) as pool:
+        pooled = [pool.get() for _ in range(3)]
+        assert pool.empty()
+
+    assert pooled == [conn] + extra_connections
+    assert connect_fn.call_count == 2
+
+
+def test_only_extra_connections_are_closed():
+    conn = MagicMock()
+    extra_connection = MagicMock()
+
+    with connection_pool(conn, 2, MagicMock(return_value=extra_connection)):
+        pass
+
+    extra_connection.close.assert_called_once()
+    conn.close.assert_not_called()
+
+
+def test_opened_connections_are_closed_when_connect_fails():
+    conn = MagicMock()
+    extra_connection = MagicMock()
+    connect_fn = MagicMock(
+        side_effect=[extra_connection, Exception("Too many clients")]
+    )
+
+    with pytest.raises(Exception, match="Too many clients"):
+        with connection_pool(conn, 3, connect_fn):
+            pass
+
+    extra_connection.close.assert_called_once()
+
+
+def test_borrowed_connections_take_only_idle_ones_and_return_them():
+    conn = MagicMock()
+    idle_connection = MagicMock()
+
+    with connection_pool(conn, 2, MagicMock(return_value=idle_connection)) as pool:
+        table_conn = pool.get()
+        with borrowed_connections(table_conn, pool, 3) as borrowed:
+            assert [borrowed.get() for _ in range(2)] == [table_conn, idle_connection]
+            assert borrowed.empty() and pool.empty()
+
+        assert pool.get_nowait() is idle_connection
+
+
+def test_nothing_is_borrowed_without_a_pool():
+    conn = MagicMock()
+
+    with borrowed_connections(conn, None, 3) as borrowed:
+        assert borrowed.get() is conn
+        assert borrowed.empty()
@@ -1,21 +1,55 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from extract import continuous_extract
-from datetime import datetime
+from table_policies import DEFAULT_TABLE_POLICY
+
 
 @pytest.fixture
 def mock_data():
     return {
-        "mock_table_data": [("table1",), ("table2",)],
-        "mock_rows": [
-            {"id": 1, "name": "Test", "created_at": datetime(2024, 1, 1)},
-            {"id": 2, "name": "Test2", "created_at": datetime(2024, 1, 2)},
-        ],
-        "mock_columns": [{"name": "id"}, {"name": "name"}, {"name": "created_at"}],
-        "last_extracted_datetime": "2024-01-01T00:00:00",
+        "tables": [("table1", "table1_id"), ("table2", "table2_id")],
+        "watermarks": {
+            "table1": {"last_updated": "2024-01-01T00:00:00", "id": 10},
+        },
+        "last_extracted_datetime": "2024-01-01 00:00:00",
     }
 
 
+def manifests(stored):
+    """Returns a load_manifest replacement reading from stored, file name -> manifest."""
+    return lambda s3_client, bucket_name, file_name: stored.get(file_name, {})
+
+
+def saved(mock_save_manifest, file_name):
+    """Returns the manifest last stored under file_name, None when none was stored."""
+    manifests = [
+        call.args[1]
+        for call in mock_save_manifest.mock_calls
+        if call.args[3] == file_name
+    ]
+    return manifests[-1] if manifests else None
+
+
+@pytest.fixture(autouse=True)
+def table_policies():
+    """Lets every test table through the table policies."""
+    with patch("extract.is_table_due", return_value=True):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def mock_load_manifest():
+    """Keeps the manifests in memory, none is stored unless a test sets one."""
+    with patch("extract.load_manifest", side_effect=manifests({})) as mock_load:
+        yield mock_load
+
+
+@pytest.fixture(autouse=True)
+def mock_save_manifest():
+    with patch("extract.save_manifest") as mock_save:
+        yield mock_save
+
+
 @pytest.fixture
 def mock_s3_client(mock_data):
     mock_s3 = MagicMock()
@@ -28,125 +62,344 @@ def mock_s3_client(mock_data):
 
 
 @pytest.fixture
-def mock_db_connection(mock_data):
-    mock_conn = MagicMock()
-    mock_conn.columns = mock_data["mock_columns"]
-    return mock_conn
+def mock_db_connection():
+    return MagicMock()
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.format_to_csv", return_value="mocked_csv_data")
-@patch("extract.store_in_s3")
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
 def test_continuous_extract_successful(
-    mock_store_in_s3,
-    mock_format_to_csv,
-    mock_create_file_name,
+    mock_get_tables,
+    mock_extract_table_changes,
     mock_s3_client,
     mock_db_connection,
     mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
 ):
-    mock_db_connection.run.side_effect = [
-        [("table1",)],  
-        mock_data["mock_rows"],
-    ]
-
-    result = continuous_extract(mock_s3_client, mock_db_connection)
-
-    print("\nActual calls:")
-    for call in mock_db_connection.run.mock_calls:
-        print(f"Call: {call}")
-
-    assert mock_db_connection.run.call_count == 2
-    first_call = mock_db_connection.run.mock_calls[0]
-    second_call = mock_db_connection.run.mock_calls[1]
-
-    assert (
-        first_call.args[0]
-        == "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name != '_prisma_migrations'"
+    mock_get_tables.return_value = mock_data["tables"][:1]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
     )
+    new_watermark = {"last_updated": "2024-01-02T00:00:00", "id": 12}
+    mock_extract_table_changes.return_value = (["mocked_file_name.csv"], new_watermark)
 
-    second_call_query = second_call.args[0]
-    assert second_call_query.startswith("SELECT * FROM table1 WHERE created_at > '")
-    assert second_call_query.endswith("'")
+    result = continuous_extract(mock_s3_client, mock_db_connection)
 
-    mock_create_file_name.assert_called_with("table1")
-    mock_format_to_csv.assert_called_with(
-        mock_data["mock_rows"], ["id", "name", "created_at"]
-    )
-    mock_store_in_s3.assert_called_with(
+    assert result == ["mocked_file_name.csv"]
+    mock_extract_table_changes.assert_called_once_with(
         mock_s3_client,
-        "mocked_csv_data",
-        "banana-squad-ingested-data",
-        "mocked_file_name.csv",
+        mock_db_connection,
+        table="table1",
+        primary_key="table1_id",
+        watermark={"last_updated": "2024-01-01T00:00:00", "id": 10},
+        checkpoint=None,
+        source=None,
+        pool=None,
     )
-
-    assert result == ["mocked_file_name.csv"]
+    mock_save_manifest.assert_any_call(
+        mock_s3_client, {"table1": new_watermark}, "banana-squad-code", "watermarks.json"
+    )
+    mock_s3_client.get_object.assert_not_called()
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.store_in_s3")
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
 def test_continuous_extract_no_new_data(
-    mock_store_in_s3,
-    mock_create_file_name,
+    mock_get_tables,
+    mock_extract_table_changes,
     mock_s3_client,
     mock_db_connection,
     mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
 ):
-    mock_db_connection.run.side_effect = [
-        [("table1",)],  
-        [],
-    ]
+    mock_get_tables.return_value = mock_data["tables"][:1]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    mock_extract_table_changes.return_value = ([], mock_data["watermarks"]["table1"])
 
     result = continuous_extract(mock_s3_client, mock_db_connection)
 
-    assert mock_db_connection.run.call_count == 2
-    mock_create_file_name.assert_called_once_with("table1")
-    mock_store_in_s3.assert_not_called()
     assert result == []
+    assert saved(mock_save_manifest, "watermarks.json") == mock_data["watermarks"]
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.store_in_s3")
-def test_continuous_extract_database_error(
-    mock_store_in_s3,
-    mock_create_file_name,
+@patch("extract.extract_table_changes", return_value=([], None))
+@patch("extract.get_tables")
+def test_continuous_extract_falls_back_to_last_extracted(
+    mock_get_tables,
+    mock_extract_table_changes,
     mock_s3_client,
     mock_db_connection,
     mock_data,
 ):
-    mock_db_connection.run.side_effect = [
-        [("table1",)],  
-        Exception("Database error"),
+    mock_get_tables.return_value = mock_data["tables"]
+
+    continuous_extract(mock_s3_client, mock_db_connection)
+
+    mock_s3_client.get_object.assert_called_once_with(
+        Bucket="banana-squad-code", Key="last_extracted.txt"
+    )
+    watermarks = [
+        call.kwargs["watermark"] for call in mock_extract_table_changes.mock_calls
     ]
+    assert watermarks == [
+        {"last_updated": "2024-01-01T00:00:00", "id": None},
+        {"last_updated": "2024-01-01T00:00:00", "id": None},
+    ]
+
+
+@patch("extract.extract_table_changes", side_effect=Exception("Database error"))
+@patch("extract.get_tables")
+def test_continuous_extract_database_error(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"][:1]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
 
     with pytest.raises(Exception, match="Database error"):
         continuous_extract(mock_s3_client, mock_db_connection)
 
-    mock_create_file_name.assert_called_once_with("table1")
-    mock_store_in_s3.assert_not_called()
+    mock_save_manifest.assert_not_called()
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.format_to_csv", return_value="mocked_csv_data")
-@patch("extract.store_in_s3")
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
 def test_continuous_extract_multiple_tables(
-    mock_store_in_s3,
-    mock_format_to_csv,
-    mock_create_file_name,
+    mock_get_tables,
+    mock_extract_table_changes,
     mock_s3_client,
     mock_db_connection,
     mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
 ):
-    mock_db_connection.run.side_effect = [
-        [("table1",), ("table2",)], 
-        mock_data["mock_rows"],
-        mock_data["mock_rows"],
+    mock_get_tables.return_value = mock_data["tables"]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    table2_watermark = {"last_updated": "2024-01-03T00:00:00", "id": 1}
+    mock_extract_table_changes.side_effect = [
+        ([], mock_data["watermarks"]["table1"]),
+        (["mocked_file_name.csv"], table2_watermark),
     ]
 
     result = continuous_extract(mock_s3_client, mock_db_connection)
 
-    assert mock_db_connection.run.call_count == 3
-    assert mock_create_file_name.call_count == 2
-    assert mock_format_to_csv.call_count == 2
-    assert mock_store_in_s3.call_count == 2
-    assert result == ["mocked_file_name.csv", "mocked_file_name.csv"]
+    assert result == ["mocked_file_name.csv"]
+    table2_call = mock_extract_table_changes.mock_calls[1]
+    assert table2_call.kwargs["watermark"] is None
+    assert saved(mock_save_manifest, "watermarks.json") == {
+        "table1": mock_data["watermarks"]["table1"],
+        "table2": table2_watermark,
+    }
+
+
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
+def test_continuous_extract_skips_unchanged_tables(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    table2_watermark = {"last_updated": "2024-01-03T00:00:00", "id": 1}
+    mock_extract_table_changes.return_value = (["mocked_file_name.csv"], table2_watermark)
+
+    result = continuous_extract(mock_s3_client, mock_db_connection, {"table1"})
+
+    assert result == ["mocked_file_name.csv"]
+    mock_extract_table_changes.assert_called_once()
+    assert mock_extract_table_changes.call_args.kwargs["table"] == "table2"
+    assert saved(mock_save_manifest, "watermarks.json") == {
+        "table1": mock_data["watermarks"]["table1"],
+        "table2": table2_watermark,
+    }
+
+
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
+def test_continuous_extract_only_extracts_tables_due_by_policy(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    mock_extract_table_changes.return_value = (["table2.csv"], None)
+
+    with patch("extract.is_table_due", side_effect=lambda table, *_: table == "table2"):
+        result = continuous_extract(
+            mock_s3_client, mock_db_connection, refreshed_at={"table1": 1.0}
+        )
+
+    assert result == ["table2.csv"]
+    assert mock_extract_table_changes.call_args.kwargs["table"] == "table2"
+    saved_refresh_times = saved(mock_save_manifest, "refresh_times.json")
+    assert saved_refresh_times["table1"] == 1.0
+    assert set(saved_refresh_times) == {"table1", "table2"}
+
+
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
+def test_continuous_extract_extracts_full_policy_tables_from_the_start(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"][:1]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    mock_extract_table_changes.return_value = (["table1.csv"], None)
+
+    with patch("extract.get_table_policy", return_value={**DEFAULT_TABLE_POLICY, "mode": "full"}):
+        continuous_extract(mock_s3_client, mock_db_connection)
+
+    assert mock_extract_table_changes.call_args.kwargs["watermark"] is None
+
+
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
+def test_continuous_extract_can_be_limited_to_notified_tables(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    mock_extract_table_changes.return_value = (["table2.csv"], None)
+
+    result = continuous_extract(
+        mock_s3_client, mock_db_connection, only_tables=["table2"]
+    )
+
+    assert result == ["table2.csv"]
+    mock_extract_table_changes.assert_called_once()
+    assert mock_extract_table_changes.call_args.kwargs["table"] == "table2"
+
+
+@patch("extract.extract_changed_buckets")
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
+def test_continuous_extract_extracts_checksum_policy_tables_by_bucket(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_extract_changed_buckets,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+    mock_save_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"]
+    mock_load_manifest.side_effect = manifests(
+        {
+            "watermarks.json": mock_data["watermarks"],
+            "checksums.json": {"table2": {"bucket_size": 10}},
+        }
+    )
+    mock_extract_table_changes.return_value = (["table1.csv"], None)
+    new_checksums = {"bucket_size": 10, "buckets": {"0": [1, "a"]}}
+    mock_extract_changed_buckets.return_value = (["table2.csv"], new_checksums)
+
+    with patch(
+        "extract.get_table_policy",
+        side_effect=lambda table: {
+            **DEFAULT_TABLE_POLICY,
+            "mode": "checksum" if table == "table2" else "incremental",
+        },
+    ):
+        result = continuous_extract(mock_s3_client, mock_db_connection)
+
+    assert result == ["table1.csv", "table2.csv"]
+    assert mock_extract_changed_buckets.call_args.kwargs["checksums"] == {
+        "bucket_size": 10
+    }
+    assert saved(mock_save_manifest, "checksums.json") == {"table2": new_checksums}
+    assert "table2" not in saved(mock_save_manifest, "watermarks.json")
+
+
+@patch("extract.extract_table_changes", return_value=([], None))
+@patch("extract.get_tables")
+def test_continuous_extract_reads_no_checksums_without_checksum_tables(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+
+    continuous_extract(mock_s3_client, mock_db_connection)
+
+    loaded = [call.args[2] for call in mock_load_manifest.mock_calls]
+    assert "checksums.json" not in loaded
+
+
+@patch("extract.extract_table_scan")
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables")
+def test_continuous_extract_scans_planned_tables_after_their_watermark_and_times_them(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_extract_table_scan,
+    mock_s3_client,
+    mock_db_connection,
+    mock_data,
+    mock_load_manifest,
+):
+    mock_get_tables.return_value = mock_data["tables"][:1]
+    mock_load_manifest.side_effect = manifests(
+        {"watermarks.json": mock_data["watermarks"]}
+    )
+    mock_extract_table_scan.return_value = (["table1.csv"], None)
+    costs = {}
+
+    result = continuous_extract(
+        mock_s3_client, mock_db_connection, full_tables={"table1"}, costs=costs
+    )
+
+    assert result == ["table1.csv"]
+    mock_extract_table_changes.assert_not_called()
+    assert (
+        mock_extract_table_scan.call_args.kwargs["watermark"]
+        == mock_data["watermarks"]["table1"]
+    )
+    assert set(costs) == {"table1"}
+    assert costs["table1"] >= 0
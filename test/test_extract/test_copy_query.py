@@ -0,0 +1,41 @@
+from util_functions import copy_query
+from unittest.mock import MagicMock
+import io
+import pytest
+
+
+def test_runs_copy_into_writer():
+    mock_conn = MagicMock()
+    mock_conn.row_count = 2
+
+    def fake_copy(sql, stream):
+        stream.write(b"id,name\n1,Test\n2,Test2\n")
+
+    mock_conn.run.side_effect = fake_copy
+    writer = io.BytesIO()
+
+    row_count = copy_query(mock_conn, "SELECT * FROM table1", writer)
+
+    assert row_count == 2
+    assert writer.getvalue() == b"id,name\n1,Test\n2,Test2\n"
+    mock_conn.run.assert_called_once_with(
+        "COPY (SELECT * FROM table1) TO STDOUT WITH (FORMAT csv, HEADER)",
+        stream=writer,
+    )
+
+
+def test_returns_zero_for_empty_result():
+    mock_conn = MagicMock()
+    mock_conn.row_count = 0
+
+    row_count = copy_query(mock_conn, "SELECT * FROM table1", io.BytesIO())
+
+    assert row_count == 0
+
+
+def test_database_error_is_raised():
+    mock_conn = MagicMock()
+    mock_conn.run.side_effect = Exception("Database error")
+
+    with pytest.raises(Exception, match="Database error"):
+        copy_query(mock_conn, "SELECT * FROM table1", io.BytesIO())
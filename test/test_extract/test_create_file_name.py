@@ -29,3 +29,31 @@ class TestCreateFileName(unittest.TestCase):
                 "UnexpectedQueryErrors/2023/12/25/2023-12-25T15:30:45.456457.csv"
             )
             assert file_name == expected_file_name
+
+    def test_uses_given_extension(self):
+        fixed_datetime = datetime(2023, 12, 25, 15, 30, 45, 456457)
+        with patch("util_functions.datetime") as mock_datetime:
+            mock_datetime.now.return_value = fixed_datetime
+            file_name = create_file_name("test_table", "parquet")
+            expected_file_name = (
+                "test_table/2023/12/25/2023-12-25T15:30:45.456457.parquet"
+            )
+            assert file_name == expected_file_name
+
+    def test_part_number_is_added_to_file_name(self):
+        fixed_datetime = datetime(2023, 12, 25, 15, 30, 45, 456457)
+        with patch("util_functions.datetime") as mock_datetime:
+            mock_datetime.now.return_value = fixed_datetime
+            file_name = create_file_name("sales_order", "csv", 2)
+            assert file_name == (
+                "sales_order/2023/12/25/2023-12-25T15:30:45.456457-part2.csv"
+            )
+
+    def test_source_id_is_added_to_file_name(self):
+        fixed_datetime = datetime(2023, 12, 25, 15, 30, 45, 456457)
+        with patch("util_functions.datetime") as mock_datetime:
+            mock_datetime.now.return_value = fixed_datetime
+            file_name = create_file_name("sales_order", "csv", 2, "eu")
+            assert file_name == (
+                "sales_order/2023/12/25/2023-12-25T15:30:45.456457-eu-part2.csv"
+            )
@@ -0,0 +1,169 @@
+from unittest.mock import MagicMock, patch
+from extract import extract_changed_buckets, get_table_checksums
+
+SOURCE = {"id": "eu", "secret": "totesys_eu"}
+
+
+@patch("extract.get_table_policy", return_value={"bucket_size": 100})
+@patch("extract.get_extract_columns", return_value=None)
+@patch("extract.save_row_hashes")
+@patch("extract.load_row_hashes", return_value={"100": "same", "101": "old"})
+@patch("extract.get_row_hashes")
+@patch("extract.get_bucket_checksums")
+@patch("extract.extract_table", return_value="payment/file.csv")
+def test_only_changed_rows_of_changed_buckets_are_extracted(
+    mock_extract_table,
+    mock_checksums,
+    mock_row_hashes,
+    mock_load_row_hashes,
+    mock_save_row_hashes,
+    mock_columns,
+    mock_policy,
+):
+    mock_checksums.return_value = {"0": [100, "a"], "1": [100, "new"]}
+    mock_row_hashes.return_value = {"1": {"100": "same", "101": "new", "102": "x"}}
+    s3_client = MagicMock()
+    previous = {"bucket_size": 100, "buckets": {"0": [100, "a"], "1": [100, "b"]}}
+
+    files, checksums = extract_changed_buckets(
+        s3_client, MagicMock(), "payment", "payment_id", previous
+    )
+
+    assert files == ["payment/file.csv"]
+    assert mock_row_hashes.call_args.args[1:5] == ("payment", "payment_id", 100, [1])
+    assert checksums == {"bucket_size": 100, "buckets": mock_checksums.return_value}
+    mock_load_row_hashes.assert_called_once_with(
+        s3_client, "banana-squad-code", "row_hashes/payment/1.json", [100, "b"]
+    )
+    mock_save_row_hashes.assert_called_once_with(
+        s3_client,
+        {"100": "same", "101": "new", "102": "x"},
+        [100, "new"],
+        "banana-squad-code",
+        "row_hashes/payment/1.json",
+    )
+    query = mock_extract_table.call_args.args[3]
+    assert query == (
+        "SELECT * FROM payment WHERE payment_id IN (101, 102) ORDER BY payment_id"
+    )
+
+
+@patch("extract.get_table_policy", return_value={"bucket_size": 100})
+@patch("extract.get_extract_columns", return_value=None)
+@patch("extract.save_row_hashes")
+@patch("extract.load_row_hashes")
+@patch("extract.get_row_hashes", return_value={})
+@patch("extract.get_bucket_checksums", return_value={"0": [10, "a"]})
+@patch("extract.extract_table")
+def test_row_hashes_of_buckets_gone_are_deleted(
+    mock_extract_table,
+    mock_checksums,
+    mock_row_hashes,
+    mock_load_row_hashes,
+    mock_save_row_hashes,
+    mock_columns,
+    mock_policy,
+):
+    s3_client = MagicMock()
+    previous = {"bucket_size": 100, "buckets": {"0": [10, "a"], "2": [5, "c"]}}
+
+    extract_changed_buckets(s3_client, MagicMock(), "payment", "payment_id", previous)
+
+    s3_client.delete_object.assert_called_once_with(
+        Bucket="banana-squad-code", Key="row_hashes/payment/2.json"
+    )
+    mock_load_row_hashes.assert_not_called()
+    mock_save_row_hashes.assert_not_called()
+
+
+@patch("extract.get_table_policy", return_value={"bucket_size": 50})
+@patch("extract.get_extract_columns", return_value=["payment_id", "last_updated"])
+@patch("extract.get_row_hashes", return_value={"0": {"1": "a"}, "1": {"60": "b"}})
+@patch("extract.get_bucket_checksums", return_value={"0": [1, "a"], "1": [1, "b"]})
+@patch("extract.extract_table", return_value="payment/file.csv")
+def test_every_row_is_extracted_after_bucket_size_changes(
+    mock_extract_table, mock_checksums, mock_row_hashes, mock_columns, mock_policy
+):
+    previous = {"bucket_size": 100, "buckets": {"0": [2, "a"]}}
+
+    with patch("extract.save_row_hashes"), patch(
+        "extract.load_row_hashes"
+    ) as mock_load:
+        extract_changed_buckets(
+            MagicMock(), MagicMock(), "payment", "payment_id", previous
+        )
+
+    mock_load.assert_not_called()
+
+    mock_checksums.assert_called_once()
+    assert mock_checksums.call_args.args[2:] == (
+        "payment_id",
+        50,
+        ["payment_id", "last_updated"],
+    )
+    assert mock_row_hashes.call_args.args[4] == [0, 1]
+    query = mock_extract_table.call_args.args[3]
+    assert query.startswith("SELECT payment_id, last_updated FROM payment")
+    assert "payment_id IN (1, 60)" in query
+
+
+@patch("extract.EXTRACT_PAGE_SIZE", 2)
+@patch("extract.get_table_policy", return_value={"bucket_size": 100})
+@patch("extract.get_extract_columns", return_value=None)
+@patch("extract.get_row_hashes", return_value={"0": {"1": "a", "2": "b", "3": "c"}})
+@patch("extract.get_bucket_checksums", return_value={"0": [3, "x"]})
+@patch("extract.extract_table", side_effect=["page1.csv", "page2.csv"])
+def test_changed_rows_are_read_in_pages(
+    mock_extract_table, mock_checksums, mock_row_hashes, mock_columns, mock_policy
+):
+    with patch("extract.save_row_hashes"):
+        files, _ = extract_changed_buckets(
+            MagicMock(), MagicMock(), "payment", "payment_id"
+        )
+
+    assert files == ["page1.csv", "page2.csv"]
+    queries = [call.args[3] for call in mock_extract_table.mock_calls]
+    assert "payment_id IN (1, 2)" in queries[0]
+    assert "payment_id IN (3)" in queries[1]
+
+
+@patch("extract.get_table_policy", return_value={"bucket_size": 100})
+@patch("extract.get_extract_columns", return_value=None)
+@patch("extract.get_bucket_checksums", return_value={"0": [10, "a"]})
+@patch("extract.extract_table")
+def test_nothing_is_extracted_when_no_bucket_changed(
+    mock_extract_table, mock_checksums, mock_columns, mock_policy
+):
+    conn = MagicMock()
+    previous = {"bucket_size": 100, "buckets": {"0": [10, "a"]}, "rows": {}}
+
+    files, _ = extract_changed_buckets(
+        MagicMock(), conn, "payment", "payment_id", previous
+    )
+
+    assert files == []
+    mock_extract_table.assert_not_called()
+    conn.run.assert_not_called()
+
+
+@patch("extract.get_table_policy", return_value={"bucket_size": 100})
+@patch("extract.get_extract_columns", return_value=["payment_id"])
+@patch("extract.save_row_hashes")
+@patch("extract.get_row_hashes", return_value={"0": {"1": "a"}, "1": {"100": "b"}})
+@patch("extract.get_bucket_checksums", return_value={"0": [1, "x"], "1": [1, "y"]})
+def test_table_checksums_cover_every_bucket_and_store_its_row_hashes(
+    mock_checksums, mock_row_hashes, mock_save_row_hashes, mock_columns, mock_policy
+):
+    s3_client, conn = MagicMock(), MagicMock()
+
+    result = get_table_checksums(s3_client, conn, "payment", "payment_id", SOURCE)
+
+    assert result == {"bucket_size": 100, "buckets": {"0": [1, "x"], "1": [1, "y"]}}
+    mock_row_hashes.assert_called_once_with(
+        conn, "payment", "payment_id", 100, None, ["payment_id"]
+    )
+    saved = [call.args[1:] for call in mock_save_row_hashes.mock_calls]
+    assert saved == [
+        ({"1": "a"}, [1, "x"], "banana-squad-code", "eu/row_hashes/payment/0.json"),
+        ({"100": "b"}, [1, "y"], "banana-squad-code", "eu/row_hashes/payment/1.json"),
+    ]
@@ -0,0 +1,76 @@
+from util_functions import ExtractCheckpoint, get_deadline
+from unittest.mock import MagicMock
+from moto import mock_aws
+import boto3
+import pytest
+import time
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket="test-bucket")
+        yield s3_client
+
+
+def test_recorded_pages_can_be_resumed(s3_client):
+    checkpoint = ExtractCheckpoint(s3_client, "test-bucket", "checkpoint.json")
+    watermark = {"last_updated": "2024-01-01T00:00:00", "id": 5}
+
+    checkpoint.record_page("staff", ["staff/page1.csv"], watermark)
+    checkpoint.record_page("staff", [], watermark)
+    resumed = ExtractCheckpoint.load(s3_client, "test-bucket", "checkpoint.json")
+
+    assert resumed.watermarks == {"staff": watermark}
+    assert resumed.files == ["staff/page1.csv"]
+    assert resumed.saved_at == checkpoint.saved_at
+
+
+def test_load_starts_empty_without_stored_checkpoint(s3_client):
+    checkpoint = ExtractCheckpoint.load(s3_client, "test-bucket", "checkpoint.json")
+
+    assert checkpoint.watermarks == {}
+    assert checkpoint.files == []
+    assert checkpoint.saved_at is None
+
+
+def test_deleted_checkpoint_is_not_resumed(s3_client):
+    checkpoint = ExtractCheckpoint(s3_client, "test-bucket", "checkpoint.json")
+    checkpoint.save()
+
+    checkpoint.delete()
+
+    resumed = ExtractCheckpoint.load(s3_client, "test-bucket", "checkpoint.json")
+    assert resumed.saved_at is None
+
+
+def test_stops_once_deadline_passed_after_a_page():
+    checkpoint = ExtractCheckpoint(MagicMock(), "bucket", "key", time.monotonic() - 1)
+
+    assert not checkpoint.should_stop()
+    checkpoint.record_page("staff", ["staff/page1.csv"], {"last_updated": "a", "id": 1})
+
+    assert checkpoint.should_stop()
+    assert not checkpoint.finished
+
+
+def test_never_stops_without_deadline():
+    checkpoint = ExtractCheckpoint(MagicMock(), "bucket", "key")
+    checkpoint.record_page("staff", ["staff/page1.csv"], {"last_updated": "a", "id": 1})
+
+    assert not checkpoint.should_stop()
+    assert checkpoint.finished
+
+
+def test_deadline_leaves_margin_before_timeout():
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 100000
+
+    deadline = get_deadline(context, 30)
+
+    assert 69 < deadline - time.monotonic() <= 70
+
+
+def test_no_deadline_outside_lambda():
+    assert get_deadline({}, 30) is None
@@ -0,0 +1,84 @@
+from util_functions import get_live_rows, plan_table_strategy, update_extract_history
+from unittest.mock import MagicMock
+import pytest
+
+
+def test_live_rows_are_read_from_the_statistics():
+    conn = MagicMock()
+    conn.run.return_value = [["staff", 20], ["sales_order", 11000]]
+
+    assert get_live_rows(conn) == {"staff": 20, "sales_order": 11000}
+    assert "n_live_tup" in conn.run.call_args.args[0]
+
+
+def test_unchanged_table_is_skipped():
+    plan = plan_table_strategy(0, 1000, {}, 0.00002, 4)
+
+    assert plan["strategy"] == "skip"
+    assert plan["estimated_seconds"] == 0
+
+
+def test_few_changes_are_read_incrementally():
+    plan = plan_table_strategy(10, 1000, {}, 0.001, 4)
+
+    assert plan == {
+        "strategy": "incremental",
+        "changed_rows": 10,
+        "live_rows": 1000,
+        "estimated_seconds": pytest.approx(0.04),
+    }
+
+
+def test_most_of_the_table_changed_is_read_in_full():
+    plan = plan_table_strategy(600, 1000, {}, 0.001, 4)
+
+    assert plan["strategy"] == "full"
+    assert plan["estimated_seconds"] == pytest.approx(1.0)
+
+
+def test_measured_costs_override_the_defaults():
+    history = {"full": 0.001, "incremental": 0.001}
+
+    assert plan_table_strategy(900, 1000, history, 0.001, 4)["strategy"] == (
+        "incremental"
+    )
+
+
+def test_missing_strategy_is_estimated_from_the_measured_one():
+    plan = plan_table_strategy(300, 1000, {"incremental": 0.004}, 0.5, 4)
+
+    assert plan["strategy"] == "full"
+    assert plan["estimated_seconds"] == pytest.approx(1.0)
+
+
+def test_table_without_row_estimate_counts_its_changes():
+    assert plan_table_strategy(50, 0, {}, 0.001, 4)["strategy"] == "full"
+
+
+def test_first_measurement_becomes_the_history():
+    plan = {"strategy": "incremental", "changed_rows": 100, "live_rows": 1000}
+
+    assert update_extract_history({}, plan, 2.0) == {"incremental": 0.02}
+
+
+def test_measurements_are_averaged_into_the_history():
+    plan = {"strategy": "full", "changed_rows": 100, "live_rows": 1000}
+    history = {"full": 0.002, "incremental": 0.01}
+
+    updated = update_extract_history(history, plan, 1.0, weight=0.5)
+
+    assert updated == {"full": pytest.approx(0.0015), "incremental": 0.01}
+
+
+def test_skipped_tables_leave_the_history_alone():
+    history = {"full": 0.002}
+    plan = {"strategy": "skip", "changed_rows": 0, "live_rows": 1000}
+
+    assert update_extract_history(history, plan, 0.0) is history
+
+
+def test_scan_reads_at_least_the_changed_rows_when_the_estimate_lags_behind():
+    plan = plan_table_strategy(300, 20, {}, 0.001, 4)
+
+    assert plan["strategy"] == "full"
+    assert plan["estimated_seconds"] == pytest.approx(0.3)
@@ -0,0 +1,147 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from extract import extract_table
+
+
+@pytest.fixture
+def mock_db_connection():
+    mock_conn = MagicMock()
+    mock_conn.columns = [{"name": "id"}, {"name": "name"}]
+    return mock_conn
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.csv")
+@patch("extract.format_to_csv", return_value="mocked_csv_data")
+@patch("extract.store_in_s3")
+def test_buffered_mode_stores_whole_table(
+    mock_store_in_s3, mock_format_to_csv, mock_create_file_name, mock_db_connection
+):
+    mock_s3_client = MagicMock()
+    mock_db_connection.run.return_value = [[1, "Test"]]
+
+    result = extract_table(
+        mock_s3_client, mock_db_connection, "table1", "SELECT * FROM table1", "buffered"
+    )
+
+    assert result == "mocked_file_name.csv"
+    mock_format_to_csv.assert_called_once_with([[1, "Test"]], ["id", "name"])
+    mock_store_in_s3.assert_called_once_with(
+        mock_s3_client,
+        "mocked_csv_data",
+        "banana-squad-ingested-data",
+        "mocked_file_name.csv",
+    )
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.csv")
+@patch("extract.stream_query", return_value=3)
+@patch("extract.S3StreamWriter")
+def test_stream_mode_closes_writer(
+    mock_writer_cls, mock_stream_query, mock_create_file_name, mock_db_connection
+):
+    mock_s3_client = MagicMock()
+
+    result = extract_table(
+        mock_s3_client, mock_db_connection, "table1", "SELECT * FROM table1", "stream"
+    )
+
+    assert result == "mocked_file_name.csv"
+    mock_writer_cls.assert_called_once_with(
+        mock_s3_client,
+        "banana-squad-ingested-data",
+        "mocked_file_name.csv",
+        pipeline=None,
+    )
+    mock_writer_cls.return_value.close.assert_called_once()
+    mock_writer_cls.return_value.abort.assert_not_called()
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.csv")
+@patch("extract.stream_query", return_value=0)
+@patch("extract.S3StreamWriter")
+def test_stream_mode_aborts_when_no_rows(
+    mock_writer_cls, mock_stream_query, mock_create_file_name, mock_db_connection
+):
+    result = extract_table(
+        MagicMock(), mock_db_connection, "table1", "SELECT * FROM table1", "stream"
+    )
+
+    assert result is None
+    mock_writer_cls.return_value.abort.assert_called_once()
+    mock_writer_cls.return_value.close.assert_not_called()
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.csv")
+@patch("extract.stream_query", side_effect=Exception("Database error"))
+@patch("extract.S3StreamWriter")
+def test_stream_mode_aborts_on_error(
+    mock_writer_cls, mock_stream_query, mock_create_file_name, mock_db_connection
+):
+    with pytest.raises(Exception, match="Database error"):
+        extract_table(
+            MagicMock(), mock_db_connection, "table1", "SELECT * FROM table1", "stream"
+        )
+
+    mock_writer_cls.return_value.abort.assert_called_once()
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.csv")
+def test_unknown_mode_raises(mock_create_file_name, mock_db_connection):
+    with pytest.raises(ValueError, match="Unknown extract mode"):
+        extract_table(
+            MagicMock(), mock_db_connection, "table1", "SELECT * FROM table1", "bogus"
+        )
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.csv")
+@patch("extract.copy_query", return_value=2)
+@patch("extract.S3StreamWriter")
+def test_copy_mode_streams_server_csv(
+    mock_writer_cls, mock_copy_query, mock_create_file_name, mock_db_connection
+):
+    result = extract_table(
+        MagicMock(), mock_db_connection, "table1", "SELECT * FROM table1", "copy"
+    )
+
+    assert result == "mocked_file_name.csv"
+    mock_copy_query.assert_called_once_with(
+        mock_db_connection, "SELECT * FROM table1", mock_writer_cls.return_value
+    )
+    mock_writer_cls.return_value.close.assert_called_once()
+    mock_db_connection.run.assert_not_called()
+
+
+@patch("extract.create_file_name", return_value="mocked_file_name.parquet")
+@patch("extract.format_to_parquet", return_value="mocked_parquet_data")
+@patch("extract.store_in_s3")
+def test_buffered_mode_can_write_parquet(
+    mock_store_in_s3, mock_format_to_parquet, mock_create_file_name, mock_db_connection
+):
+    mock_db_connection.run.return_value = [[1, "Test"]]
+
+    result = extract_table(
+        MagicMock(),
+        mock_db_connection,
+        "table1",
+        "SELECT * FROM table1",
+        "buffered",
+        "parquet",
+    )
+
+    assert result == "mocked_file_name.parquet"
+    mock_create_file_name.assert_called_once_with("table1", "parquet", None, None)
+    mock_format_to_parquet.assert_called_once_with(
+        [[1, "Test"]], mock_db_connection.columns
+    )
+
+
+def test_copy_mode_cannot_write_parquet(mock_db_connection):
+    with pytest.raises(ValueError, match="copy extract mode"):
+        extract_table(
+            MagicMock(),
+            mock_db_connection,
+            "table1",
+            "SELECT * FROM table1",
+            "copy",
+            "parquet",
+        )
@@ -0,0 +1,224 @@
+import queue
+import pytest
+from unittest.mock import MagicMock, patch
+from extract import extract_table_changes, extract_table_scan
+
+WATERMARK = {"last_updated": "2024-01-01T00:00:00", "id": 5}
+PAGE_END = {"last_updated": "2024-01-02T00:00:00", "id": 7}
+HIGH_WATER_MARK = {"last_updated": "2024-01-03T00:00:00", "id": 9}
+
+
+@patch("extract.extract_table")
+@patch("extract.get_high_water_mark", return_value=None)
+def test_no_changes_keeps_watermark(mock_high_water_mark, mock_extract_table):
+    conn = MagicMock()
+
+    result = extract_table_changes(MagicMock(), conn, "table1", "table1_id", WATERMARK)
+
+    assert result == ([], WATERMARK)
+    mock_high_water_mark.assert_called_once_with(conn, "table1", "table1_id", WATERMARK)
+    mock_extract_table.assert_not_called()
+
+
+@patch("extract.EXTRACT_PAGE_SIZE", 2)
+@patch("extract.extract_table", side_effect=["page1.csv", "page2.csv"])
+@patch("extract.get_page_end", side_effect=[PAGE_END, HIGH_WATER_MARK])
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_pages_up_to_high_water_mark(
+    mock_high_water_mark, mock_page_end, mock_extract_table
+):
+    s3_client = MagicMock()
+    conn = MagicMock()
+
+    result = extract_table_changes(s3_client, conn, "table1", "table1_id", WATERMARK)
+
+    assert result == (["page1.csv", "page2.csv"], HIGH_WATER_MARK)
+    assert mock_page_end.mock_calls[0].args == (
+        conn,
+        "table1",
+        "table1_id",
+        WATERMARK,
+        HIGH_WATER_MARK,
+        2,
+    )
+    assert mock_page_end.mock_calls[1].args[3] == PAGE_END
+    first_query = mock_extract_table.mock_calls[0].args[3]
+    assert first_query == (
+        "SELECT * FROM table1 WHERE "
+        "(last_updated, table1_id) > ('2024-01-01T00:00:00'::timestamp, 5) AND "
+        "(last_updated, table1_id) <= ('2024-01-02T00:00:00'::timestamp, 7) "
+        "ORDER BY last_updated, table1_id"
+    )
+
+
+@patch("extract.extract_table", return_value="table1.csv")
+@patch("extract.get_page_end", return_value=HIGH_WATER_MARK)
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_full_extract_without_watermark(
+    mock_high_water_mark, mock_page_end, mock_extract_table
+):
+    result = extract_table_changes(MagicMock(), MagicMock(), "table1", "table1_id")
+
+    assert result == (["table1.csv"], HIGH_WATER_MARK)
+    query = mock_extract_table.mock_calls[0].args[3]
+    assert query == (
+        "SELECT * FROM table1 WHERE "
+        "(last_updated, table1_id) <= ('2024-01-03T00:00:00'::timestamp, 9) "
+        "ORDER BY last_updated, table1_id"
+    )
+
+
+@patch("extract.extract_table", side_effect=Exception("Database error"))
+@patch("extract.get_page_end", return_value=HIGH_WATER_MARK)
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_error_is_raised(mock_high_water_mark, mock_page_end, mock_extract_table):
+    with pytest.raises(Exception, match="Database error"):
+        extract_table_changes(MagicMock(), MagicMock(), "table1", "table1_id")
+
+
+@patch("extract.extract_table", side_effect=["page1.csv", "page2.csv"])
+@patch("extract.get_page_end", side_effect=[PAGE_END, HIGH_WATER_MARK])
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_stops_after_page_when_checkpoint_deadline_passed(
+    mock_high_water_mark, mock_page_end, mock_extract_table
+):
+    checkpoint = MagicMock()
+    checkpoint.should_stop.side_effect = [False, True]
+
+    result = extract_table_changes(
+        MagicMock(), MagicMock(), "table1", "table1_id", WATERMARK, checkpoint
+    )
+
+    assert result == (["page1.csv"], PAGE_END)
+    checkpoint.record_page.assert_called_once_with("table1", ["page1.csv"], PAGE_END)
+
+
+@patch("extract.extract_table", return_value="design.csv")
+@patch("extract.get_page_end", return_value=HIGH_WATER_MARK)
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_selects_only_columns_read_by_transforms(
+    mock_high_water_mark, mock_page_end, mock_extract_table
+):
+    extract_table_changes(MagicMock(), MagicMock(), "design", "design_id")
+
+    query = mock_extract_table.mock_calls[0].args[3]
+    assert query.startswith(
+        "SELECT design_id, last_updated, design_name, file_location, file_name "
+        "FROM design WHERE "
+    )
+
+
+@patch("extract.extract_table", return_value="design.csv")
+@patch("extract.get_page_end", return_value=HIGH_WATER_MARK)
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_rows_of_a_source_carry_its_id(
+    mock_high_water_mark, mock_page_end, mock_extract_table
+):
+    source = {"id": "eu", "secret": "totesys_eu"}
+
+    extract_table_changes(
+        MagicMock(), MagicMock(), "design", "design_id", source=source
+    )
+
+    query = mock_extract_table.mock_calls[0].args[3]
+    assert query.startswith(
+        "SELECT design_id, last_updated, design_name, file_location, file_name, "
+        "'eu'::text AS source_id FROM design WHERE "
+    )
+
+
+@patch("extract.run_table_tasks")
+@patch("extract.get_key_slices", return_value=["id < 10", "id >= 10"])
+@patch("extract.get_table_policy", return_value={"partitions": 2})
+@patch("extract.get_page_end", return_value=HIGH_WATER_MARK)
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_pages_are_read_in_key_range_slices(
+    mock_high_water_mark,
+    mock_page_end,
+    mock_policy,
+    mock_key_slices,
+    mock_run_table_tasks,
+):
+    s3_client = MagicMock()
+    conn = MagicMock()
+    idle_conn = MagicMock()
+    pool = queue.Queue()
+    pool.put(idle_conn)
+    checkpoint = MagicMock()
+    checkpoint.should_stop.return_value = False
+    mock_run_table_tasks.return_value = ["part0.csv", None]
+
+    result = extract_table_changes(
+        s3_client, conn, "table1", "id", WATERMARK, checkpoint, pool=pool
+    )
+
+    assert result == (["part0.csv"], HIGH_WATER_MARK)
+    mock_key_slices.assert_called_once_with(conn, "table1", "id", 2)
+    run_conn, tasks, workers = mock_run_table_tasks.call_args.args
+    assert run_conn is conn and workers == 2
+    slice_pool = mock_run_table_tasks.call_args.kwargs["pool"]
+    assert slice_pool is not pool
+    assert pool.get_nowait() is idle_conn
+    assert [task.keywords["part"] for task in tasks] == [0, 1]
+    assert tasks[1].keywords["query"] == (
+        "SELECT * FROM table1 WHERE "
+        "(last_updated, id) > ('2024-01-01T00:00:00'::timestamp, 5) AND "
+        "(last_updated, id) <= ('2024-01-03T00:00:00'::timestamp, 9) AND id >= 10 "
+        "ORDER BY last_updated, id"
+    )
+    checkpoint.record_page.assert_called_once_with(
+        "table1", ["part0.csv"], HIGH_WATER_MARK
+    )
+
+
+@patch("extract.extract_table", side_effect=["page1_part0.csv", "page1_part1.csv"])
+@patch("extract.get_key_slices", return_value=["id < 10", "id >= 10"])
+@patch("extract.get_table_policy", return_value={"partitions": 2})
+@patch("extract.get_page_end", return_value=HIGH_WATER_MARK)
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+@patch("extract.connect")
+def test_slices_run_on_conn_when_no_pool_connection_is_idle(
+    mock_connect,
+    mock_high_water_mark,
+    mock_page_end,
+    mock_policy,
+    mock_key_slices,
+    mock_extract_table,
+):
+    conn = MagicMock()
+
+    result = extract_table_changes(
+        MagicMock(), conn, "table1", "id", WATERMARK, pool=queue.Queue()
+    )
+
+    assert result == (["page1_part0.csv", "page1_part1.csv"], HIGH_WATER_MARK)
+    assert [call.args[1] for call in mock_extract_table.mock_calls] == [conn, conn]
+    mock_connect.assert_not_called()
+
+
+@patch("extract.extract_table", return_value="table1.csv")
+@patch("extract.get_page_end")
+@patch("extract.get_high_water_mark", return_value=HIGH_WATER_MARK)
+def test_scan_reads_the_changes_after_the_watermark_in_one_query(
+    mock_high_water_mark, mock_page_end, mock_extract_table
+):
+    result = extract_table_scan(MagicMock(), MagicMock(), "table1", "id", WATERMARK)
+
+    assert result == (["table1.csv"], HIGH_WATER_MARK)
+    mock_page_end.assert_not_called()
+    assert mock_extract_table.call_args.args[3] == (
+        "SELECT * FROM table1 WHERE "
+        "(last_updated, id) > ('2024-01-01T00:00:00'::timestamp, 5) AND "
+        "(last_updated, id) <= ('2024-01-03T00:00:00'::timestamp, 9)"
+    )
+
+
+@patch("extract.extract_table")
+@patch("extract.get_high_water_mark", return_value=None)
+def test_scan_keeps_the_watermark_without_changes(
+    mock_high_water_mark, mock_extract_table
+):
+    result = extract_table_scan(MagicMock(), MagicMock(), "table1", "id", WATERMARK)
+
+    assert result == ([], WATERMARK)
+    mock_extract_table.assert_not_called()
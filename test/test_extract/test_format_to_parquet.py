@@ -0,0 +1,72 @@
+from util_functions import format_to_parquet, parquet_schema
+from datetime import datetime, date
+from decimal import Decimal
+import pyarrow as pa
+import pyarrow.parquet as pq
+import io
+import pytest
+
+COLUMNS = [
+    {"name": "sales_order_id", "type_oid": 23, "type_modifier": -1},
+    {"name": "created_at", "type_oid": 1114, "type_modifier": -1},
+    {"name": "unit_price", "type_oid": 1700, "type_modifier": (10 << 16 | 2) + 4},
+    {"name": "agreed_delivery_date", "type_oid": 1082, "type_modifier": -1},
+    {"name": "design_name", "type_oid": 1043, "type_modifier": 54},
+    {"name": "details", "type_oid": 3802, "type_modifier": -1},
+]
+
+ROWS = [
+    [
+        1,
+        datetime(2022, 11, 3, 14, 20, 52, 186000),
+        Decimal("3.94"),
+        date(2022, 11, 10),
+        "Steel",
+        {"a": 1},
+    ],
+    [2, datetime(2022, 11, 3, 14, 20, 52), Decimal("2.50"), None, None, None],
+]
+
+
+class TestParquetSchema:
+    def test_keeps_source_column_types(self):
+        schema = parquet_schema(COLUMNS)
+
+        assert schema.field("sales_order_id").type == pa.int32()
+        assert schema.field("created_at").type == pa.timestamp("us")
+        assert schema.field("unit_price").type == pa.decimal128(10, 2)
+        assert schema.field("agreed_delivery_date").type == pa.date32()
+        assert schema.field("design_name").type == pa.string()
+
+    def test_unknown_types_are_strings(self):
+        schema = parquet_schema([{"name": "x", "type_oid": 99999, "type_modifier": -1}])
+
+        assert schema.field("x").type == pa.string()
+
+
+class TestFormatToParquet:
+    def test_returns_readable_parquet_buffer(self):
+        buffer = format_to_parquet(ROWS, COLUMNS)
+
+        assert isinstance(buffer, io.BytesIO)
+        assert buffer.tell() == 0
+        table = pq.read_table(buffer)
+        assert table.num_rows == 2
+        assert table.column_names == [col["name"] for col in COLUMNS]
+
+    def test_values_round_trip(self):
+        table = pq.read_table(format_to_parquet(ROWS, COLUMNS))
+
+        assert table.column("created_at")[0].as_py() == ROWS[0][1]
+        assert table.column("unit_price")[0].as_py() == Decimal("3.94")
+        assert table.column("details")[0].as_py() == "{'a': 1}"
+        assert table.column("design_name")[1].as_py() is None
+
+    def test_is_snappy_compressed(self):
+        metadata = pq.ParquetFile(format_to_parquet(ROWS, COLUMNS)).metadata
+
+        assert metadata.row_group(0).column(0).compression == "SNAPPY"
+
+    def test_raises_exception_for_empty_columns(self):
+        with pytest.raises(ValueError):
+            format_to_parquet(ROWS, [])
@@ -0,0 +1,34 @@
+from util_functions import get_tables
+from unittest.mock import MagicMock
+import pytest
+
+
+def test_returns_tables_with_primary_keys():
+    mock_conn = MagicMock()
+    mock_conn.run.return_value = [
+        ["address", "address_id"],
+        ["sales_order", "sales_order_id"],
+    ]
+
+    result = get_tables(mock_conn)
+
+    assert result == [("address", "address_id"), ("sales_order", "sales_order_id")]
+    query = mock_conn.run.call_args.args[0]
+    assert "constraint_type = 'PRIMARY KEY'" in query
+    assert "table_name != '_prisma_migrations'" in query
+
+
+def test_raises_for_table_without_primary_key():
+    mock_conn = MagicMock()
+    mock_conn.run.return_value = [["address", None]]
+
+    with pytest.raises(ValueError, match="address"):
+        get_tables(mock_conn)
+
+
+def test_raises_for_composite_primary_key():
+    mock_conn = MagicMock()
+    mock_conn.run.return_value = [["link", "a_id"], ["link", "b_id"]]
+
+    with pytest.raises(ValueError, match="link"):
+        get_tables(mock_conn)
@@ -1,29 +1,31 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from extract import initial_extract
+from table_policies import DEFAULT_TABLE_POLICY
 
 
-@pytest.fixture
-def mock_data():
-    return {
-        "mock_table_data": [("table1",)],
-        "mock_rows": [
-            {"id": 1, "name": "Test", "created_at": "2024-01-01 00:00:00"},
-            {"id": 2, "name": "Test2", "created_at": "2024-01-02 00:00:00"},
-        ],
-        "mock_columns": [{"name": "id"}, {"name": "name"}, {"name": "created_at"}],
-    }
+def saved(mock_save_manifest, file_name):
+    """Returns the manifest last stored under file_name, None when none was stored."""
+    manifests = [
+        call.args[1]
+        for call in mock_save_manifest.mock_calls
+        if call.args[3] == file_name
+    ]
+    return manifests[-1] if manifests else None
 
 
-@pytest.fixture
-def mock_db_connection(mock_data):
-    mock_conn = MagicMock()
-    mock_conn.run.side_effect = [
-        mock_data["mock_table_data"],
-        mock_data["mock_rows"],
-    ]
-    mock_conn.columns = mock_data["mock_columns"]
-    return mock_conn
+@pytest.fixture(autouse=True)
+def table_policies():
+    """Lets every test table through the table policies."""
+    with patch("extract.is_table_due", return_value=True):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def mock_save_manifest():
+    """Keeps the manifests out of S3."""
+    with patch("extract.save_manifest") as mock_save:
+        yield mock_save
 
 
 @pytest.fixture
@@ -31,89 +33,200 @@ def mock_s3_client():
     return MagicMock()
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.format_to_csv", return_value="mocked_csv_data")
-@patch("extract.store_in_s3")
+@pytest.fixture
+def mock_db_connection():
+    return MagicMock()
+
+
+@patch("extract.extract_table_changes")
+@patch("extract.get_tables", return_value=[("table1", "table1_id")])
 def test_initial_extract_successful_extraction(
-    mock_store_in_s3,
-    mock_format_to_csv,
-    mock_create_file_name,
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_save_manifest,
     mock_s3_client,
     mock_db_connection,
-    mock_data,
 ):
-    mock_store_in_s3.return_value = True
+    watermark = {"last_updated": "2024-01-02T00:00:00", "id": 2}
+    mock_extract_table_changes.return_value = (["mocked_file_name.csv"], watermark)
 
     result = initial_extract(mock_s3_client, mock_db_connection)
 
     assert result == ["mocked_file_name.csv"]
-    mock_create_file_name.assert_called_once_with("table1")
-    mock_format_to_csv.assert_called_once_with(
-        mock_data["mock_rows"], ["id", "name", "created_at"]
-    )
-    mock_store_in_s3.assert_called_once_with(
+    mock_extract_table_changes.assert_called_once_with(
         mock_s3_client,
-        "mocked_csv_data",
-        "banana-squad-ingested-data",
-        "mocked_file_name.csv",
+        mock_db_connection,
+        table="table1",
+        primary_key="table1_id",
+        watermark=None,
+        checkpoint=None,
+        source=None,
+        pool=None,
+    )
+    mock_save_manifest.assert_any_call(
+        mock_s3_client, {"table1": watermark}, "banana-squad-code", "watermarks.json"
     )
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.store_in_s3", side_effect=Exception("S3 upload failed"))
+@patch("extract.extract_table_changes", side_effect=Exception("S3 upload failed"))
+@patch("extract.get_tables", return_value=[("table1", "table1_id")])
 def test_initial_extract_s3_upload_failure(
-    mock_store_in_s3, mock_create_file_name, mock_s3_client, mock_db_connection
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_save_manifest,
+    mock_s3_client,
+    mock_db_connection,
 ):
     with pytest.raises(Exception, match="S3 upload failed"):
         initial_extract(mock_s3_client, mock_db_connection)
-    mock_store_in_s3.assert_called_once()
+    mock_save_manifest.assert_not_called()
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.format_to_csv", return_value="mocked_csv_data")
-@patch("extract.store_in_s3")
+@patch("extract.extract_table_changes", return_value=([], None))
+@patch("extract.get_tables", return_value=[("table1", "table1_id")])
 def test_initial_extract_no_rows_in_table(
-    mock_store_in_s3,
-    mock_format_to_csv,
-    mock_create_file_name,
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_save_manifest,
     mock_s3_client,
     mock_db_connection,
-    mock_data,
 ):
-    mock_db_connection.run.side_effect = [
-        mock_data["mock_table_data"],
-        [],
-    ]
-
     result = initial_extract(mock_s3_client, mock_db_connection)
 
     assert result == []
-    mock_create_file_name.assert_called_once_with("table1")
-    mock_format_to_csv.assert_not_called()
-    mock_store_in_s3.assert_not_called()
+    mock_save_manifest.assert_any_call(
+        mock_s3_client, {}, "banana-squad-code", "watermarks.json"
+    )
 
 
-@patch("extract.create_file_name", return_value="mocked_file_name.csv")
-@patch("extract.format_to_csv", return_value="mocked_csv_data")
-@patch("extract.store_in_s3")
+@patch("extract.extract_table_changes")
+@patch(
+    "extract.get_tables",
+    return_value=[("table1", "table1_id"), ("table2", "table2_id")],
+)
 def test_initial_extract_multiple_tables(
-    mock_store_in_s3,
-    mock_format_to_csv,
-    mock_create_file_name,
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_save_manifest,
     mock_s3_client,
     mock_db_connection,
-    mock_data,
 ):
-    mock_data["mock_table_data"] = [("table1",), ("table2",)]
-    mock_db_connection.run.side_effect = [
-        mock_data["mock_table_data"],  # Table names
-        mock_data["mock_rows"],  # Rows for table1
-        mock_data["mock_rows"],  # Rows for table2
+    mock_extract_table_changes.side_effect = [
+        (["table1_page1.csv", "table1_page2.csv"], {"last_updated": "a", "id": 1}),
+        (["table2_page1.csv"], {"last_updated": "b", "id": 2}),
     ]
 
     result = initial_extract(mock_s3_client, mock_db_connection)
 
-    assert result == ["mocked_file_name.csv", "mocked_file_name.csv"]
-    assert mock_create_file_name.call_count == 2
-    assert mock_format_to_csv.call_count == 2
-    assert mock_store_in_s3.call_count == 2
+    assert result == ["table1_page1.csv", "table1_page2.csv", "table2_page1.csv"]
+    assert mock_extract_table_changes.call_count == 2
+    saved_watermarks = saved(mock_save_manifest, "watermarks.json")
+    assert saved_watermarks == {
+        "table1": {"last_updated": "a", "id": 1},
+        "table2": {"last_updated": "b", "id": 2},
+    }
+
+
+@patch("extract.extract_table_changes")
+@patch(
+    "extract.get_tables",
+    return_value=[("table1", "table1_id"), ("table2", "table2_id")],
+)
+def test_initial_extract_resumes_from_checkpoint(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_save_manifest,
+    mock_s3_client,
+    mock_db_connection,
+):
+    checkpoint = MagicMock(
+        watermarks={"table1": {"last_updated": "a", "id": 1}},
+        files=["table1_page1.csv", "table1_page2.csv"],
+        finished=True,
+    )
+    mock_extract_table_changes.side_effect = [
+        ([], {"last_updated": "a", "id": 1}),
+        ([], {"last_updated": "b", "id": 2}),
+    ]
+
+    result = initial_extract(mock_s3_client, mock_db_connection, checkpoint)
+
+    assert result == ["table1_page1.csv", "table1_page2.csv"]
+    first_call = mock_extract_table_changes.mock_calls[0]
+    assert first_call.kwargs["watermark"] == {"last_updated": "a", "id": 1}
+    assert first_call.kwargs["checkpoint"] is checkpoint
+    assert saved(mock_save_manifest, "watermarks.json") is not None
+
+
+@patch(
+    "extract.get_table_policy", return_value={**DEFAULT_TABLE_POLICY, "mode": "full"}
+)
+@patch("extract.extract_table_changes", return_value=([], None))
+@patch("extract.get_tables", return_value=[("table1", "table1_id")])
+def test_initial_extract_resumes_full_policy_tables_from_checkpoint(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_policy,
+    mock_save_manifest,
+    mock_s3_client,
+    mock_db_connection,
+):
+    checkpoint = MagicMock(
+        watermarks={"table1": {"last_updated": "a", "id": 1}},
+        files=["table1_page1.csv"],
+        finished=False,
+    )
+
+    result = initial_extract(mock_s3_client, mock_db_connection, checkpoint)
+
+    assert result == ["table1_page1.csv"]
+    watermark = mock_extract_table_changes.call_args.kwargs["watermark"]
+    assert watermark == {"last_updated": "a", "id": 1}
+
+
+@patch("extract.extract_table_changes", return_value=(["page1.csv"], None))
+@patch("extract.get_tables", return_value=[("table1", "table1_id")])
+def test_initial_extract_saves_no_watermarks_when_unfinished(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_save_manifest,
+    mock_s3_client,
+    mock_db_connection,
+):
+    checkpoint = MagicMock(watermarks={}, files=["page1.csv"], finished=False)
+
+    result = initial_extract(mock_s3_client, mock_db_connection, checkpoint)
+
+    assert result == ["page1.csv"]
+    mock_save_manifest.assert_not_called()
+
+
+@patch("extract.get_table_checksums", return_value={"bucket_size": 100})
+@patch("extract.extract_table_changes", return_value=(["page1.csv"], None))
+@patch(
+    "extract.get_tables",
+    return_value=[("payment", "payment_id"), ("staff", "staff_id")],
+)
+def test_initial_extract_stores_checksums_of_checksum_policy_tables(
+    mock_get_tables,
+    mock_extract_table_changes,
+    mock_table_checksums,
+    mock_save_manifest,
+    mock_s3_client,
+    mock_db_connection,
+):
+    with patch(
+        "extract.get_table_policy",
+        side_effect=lambda table: {
+            **DEFAULT_TABLE_POLICY,
+            "mode": "checksum" if table == "payment" else "incremental",
+        },
+    ):
+        initial_extract(mock_s3_client, mock_db_connection)
+
+    mock_table_checksums.assert_called_once_with(
+        mock_s3_client, mock_db_connection, "payment", "payment_id", None
+    )
+    assert saved(mock_save_manifest, "checksums.json") == {
+        "payment": {"bucket_size": 100}
+    }
@@ -0,0 +1,49 @@
+from util_functions import get_key_slices
+from unittest.mock import MagicMock
+
+
+def test_key_range_is_split_into_equal_slices():
+    conn = MagicMock()
+    conn.run.return_value = [[1, 100]]
+
+    result = get_key_slices(conn, "sales_order", "sales_order_id", 4)
+
+    assert result == [
+        "sales_order_id < 26",
+        "sales_order_id >= 26 AND sales_order_id < 51",
+        "sales_order_id >= 51 AND sales_order_id < 76",
+        "sales_order_id >= 76",
+    ]
+    conn.run.assert_called_once_with(
+        "SELECT min(sales_order_id), max(sales_order_id) FROM sales_order"
+    )
+
+
+def test_small_key_range_gets_fewer_slices():
+    conn = MagicMock()
+    conn.run.return_value = [[5, 6]]
+
+    result = get_key_slices(conn, "sales_order", "sales_order_id", 4)
+
+    assert result == ["sales_order_id < 6", "sales_order_id >= 6"]
+
+
+def test_empty_table_is_not_split():
+    conn = MagicMock()
+    conn.run.return_value = [[None, None]]
+
+    assert get_key_slices(conn, "sales_order", "sales_order_id", 4) == []
+
+
+def test_single_key_is_not_split():
+    conn = MagicMock()
+    conn.run.return_value = [[7, 7]]
+
+    assert get_key_slices(conn, "sales_order", "sales_order_id", 4) == []
+
+
+def test_non_integer_key_is_not_split():
+    conn = MagicMock()
+    conn.run.return_value = [["a", "z"]]
+
+    assert get_key_slices(conn, "currency", "currency_code", 4) == []
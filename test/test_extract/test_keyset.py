@@ -0,0 +1,90 @@
+from util_functions import (
+    keyset_predicate,
+    keyset_window,
+    get_high_water_mark,
+    get_page_end,
+)
+from unittest.mock import MagicMock
+from datetime import datetime
+
+AFTER = {"last_updated": "2024-01-01T00:00:00", "id": 5}
+UPTO = {"last_updated": "2024-01-03T00:00:00", "id": 9}
+
+
+class TestKeysetPredicate:
+    def test_compares_last_updated_and_primary_key(self):
+        result = keyset_predicate("staff_id", AFTER)
+
+        assert result == (
+            "(last_updated, staff_id) > ('2024-01-01T00:00:00'::timestamp, 5)"
+        )
+
+    def test_compares_last_updated_only_without_id(self):
+        watermark = {"last_updated": "2024-01-01T00:00:00", "id": None}
+
+        result = keyset_predicate("staff_id", watermark, "<=")
+
+        assert result == "last_updated <= '2024-01-01T00:00:00'::timestamp"
+
+    def test_escapes_quotes(self):
+        watermark = {"last_updated": "2024'; DROP TABLE staff; --", "id": 1}
+
+        result = keyset_predicate("staff_id", watermark)
+
+        assert "'2024''; DROP TABLE staff; --'" in result
+
+
+class TestKeysetWindow:
+    def test_open_window_selects_everything(self):
+        assert keyset_window("staff_id", None, None) == "TRUE"
+
+    def test_closed_window(self):
+        result = keyset_window("staff_id", AFTER, UPTO)
+
+        assert result == (
+            "(last_updated, staff_id) > ('2024-01-01T00:00:00'::timestamp, 5) AND "
+            "(last_updated, staff_id) <= ('2024-01-03T00:00:00'::timestamp, 9)"
+        )
+
+
+class TestGetHighWaterMark:
+    def test_returns_newest_row(self):
+        mock_conn = MagicMock()
+        mock_conn.run.return_value = [[datetime(2024, 1, 3), 9]]
+
+        result = get_high_water_mark(mock_conn, "staff", "staff_id")
+
+        assert result == {"last_updated": "2024-01-03T00:00:00", "id": 9}
+        mock_conn.run.assert_called_once_with(
+            "SELECT last_updated, staff_id FROM staff WHERE TRUE "
+            "ORDER BY last_updated DESC, staff_id DESC LIMIT 1"
+        )
+
+    def test_returns_none_without_rows_after_watermark(self):
+        mock_conn = MagicMock()
+        mock_conn.run.return_value = []
+
+        result = get_high_water_mark(mock_conn, "staff", "staff_id", AFTER)
+
+        assert result is None
+        assert "(last_updated, staff_id) >" in mock_conn.run.call_args.args[0]
+
+
+class TestGetPageEnd:
+    def test_returns_last_row_of_page(self):
+        mock_conn = MagicMock()
+        mock_conn.run.return_value = [[datetime(2024, 1, 2), 7]]
+
+        result = get_page_end(mock_conn, "staff", "staff_id", AFTER, UPTO, 100)
+
+        assert result == {"last_updated": "2024-01-02T00:00:00", "id": 7}
+        query = mock_conn.run.call_args.args[0]
+        assert query.endswith("ORDER BY last_updated, staff_id LIMIT 1 OFFSET 99")
+
+    def test_last_page_ends_at_high_water_mark(self):
+        mock_conn = MagicMock()
+        mock_conn.run.return_value = []
+
+        result = get_page_end(mock_conn, "staff", "staff_id", AFTER, UPTO, 100)
+
+        assert result == UPTO
@@ -1,31 +1,68 @@
-from extract import lambda_handler
+from extract import lambda_handler, extract_source
+from util_functions import ExtractCheckpoint
 from moto import mock_aws
 from botocore.exceptions import NoCredentialsError, ClientError
 from pg8000.exceptions import InterfaceError, DatabaseError
 from unittest.mock import patch, MagicMock
 from datetime import datetime
+import json
+import pytest
+import time
+
+
+def manifests(stored):
+    """Returns a load_manifest replacement reading from stored, file name -> manifest."""
+    return lambda s3_client, bucket_name, file_name: stored.get(file_name, {})
+
+
+def stored_manifest(mock_s3, file_name):
+    """Returns the manifest last put in the mocked S3 bucket under file_name."""
+    bodies = [
+        call.kwargs["Body"]
+        for call in mock_s3.put_object.mock_calls
+        if call.kwargs["Key"] == file_name
+    ]
+    return json.loads(bodies[-1])
+
+
+@pytest.fixture(autouse=True)
+def mock_load_manifest():
+    """Keeps the planner's statistics out of the database and the stored manifests out
+    of S3, none is stored unless a test sets one."""
+    with patch("extract.get_live_rows", return_value={}), patch(
+        "extract.load_manifest", side_effect=manifests({})
+    ) as mock_load:
+        yield mock_load
 
 
 @mock_aws
 @patch("extract.create_s3_client")
-@patch("extract.connect")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={})
 @patch("extract.initial_extract")
 @patch("extract.continuous_extract")
 def test_continuous_extract_called_when_last_extracted_exists(
-    mock_continuous, mock_initial, mock_connect, mock_s3_client
+    mock_continuous,
+    mock_initial,
+    mock_counters,
+    mock_connect,
+    mock_s3_client,
 ):
     mock_s3 = MagicMock()
     mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
     mock_s3_client.return_value = mock_s3
 
     mock_conn = MagicMock()
+    mock_conn.run.return_value = [[datetime(2024, 11, 25, 15, 0, 0, 123456)]]
     mock_connect.return_value = mock_conn
 
     mock_continuous.return_value = {"updated_tables": ["table1", "table2"]}
 
     result = lambda_handler({}, {})
 
-    mock_continuous.assert_called_once_with(mock_s3, mock_conn)
+    mock_continuous.assert_called_once_with(
+        mock_s3, mock_conn, set(), {}, None, None, set(), {}
+    )
     mock_initial.assert_not_called()
 
     assert result["result"] == "Success"
@@ -33,11 +70,18 @@ def test_continuous_extract_called_when_last_extracted_exists(
 
 @mock_aws
 @patch("extract.create_s3_client")
-@patch("extract.connect")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={})
+@patch("extract.ExtractCheckpoint.load")
 @patch("extract.initial_extract")
 @patch("extract.continuous_extract")
 def test_initial_extract_called_when_last_extracted_missing(
-    mock_continuous, mock_initial, mock_connect, mock_s3_client
+    mock_continuous,
+    mock_initial,
+    mock_load_checkpoint,
+    mock_counters,
+    mock_connect,
+    mock_s3_client,
 ):
     mock_s3 = MagicMock()
     mock_s3.list_objects.return_value = (
@@ -46,13 +90,19 @@ def test_initial_extract_called_when_last_extracted_missing(
     mock_s3_client.return_value = mock_s3
 
     mock_conn = MagicMock()
+    mock_conn.run.return_value = [[datetime(2024, 11, 25, 15, 0, 0, 123456)]]
     mock_connect.return_value = mock_conn
 
     mock_initial.return_value = {"updated_tables": ["table1", "table2"]}
+    checkpoint = ExtractCheckpoint(mock_s3, "banana-squad-code", "checkpoint.json")
+    mock_load_checkpoint.return_value = checkpoint
 
     result = lambda_handler({}, {})
 
-    mock_initial.assert_called_once_with(mock_s3, mock_conn)
+    mock_initial.assert_called_once_with(mock_s3, mock_conn, checkpoint, None)
+    mock_s3.delete_object.assert_called_once_with(
+        Bucket="banana-squad-code", Key="checkpoint.json"
+    )
     mock_continuous.assert_not_called()
 
     assert result["result"] == "Success"
@@ -96,7 +146,7 @@ def test_client_error_during_s3_creation(mock_create_s3_client):
     assert "Error creating S3 client" in result["error"]
 
 
-@patch("extract.connect")
+@patch("extract.get_connection")
 @patch("extract.create_s3_client")
 def test_unexpected_error_during_put_object(mock_create_s3_client, mock_conn):
 
@@ -109,3 +159,499 @@ def test_unexpected_error_during_put_object(mock_create_s3_client, mock_conn):
 
     assert result["result"] == "Failure"
     assert "Unexpected error" in result["error"]
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"staff": 3})
+@patch("util_functions.load_manifest", return_value={})
+@patch("extract.initial_extract", return_value=["table1.csv"])
+def test_extract_runs_inside_snapshot_and_stores_database_time(
+    mock_initial, mock_load, mock_counters, mock_connect, mock_create_s3_client
+):
+    mock_s3 = MagicMock()
+    mock_s3.list_objects.return_value = {}
+    mock_create_s3_client.return_value = mock_s3
+    mock_conn = MagicMock()
+    mock_conn.run.return_value = [[datetime(2024, 11, 25, 15, 0, 0, 123456)]]
+    mock_connect.return_value = mock_conn
+
+    result = lambda_handler({}, {})
+
+    assert result["result"] == "Success"
+    queries = [call.args[0] for call in mock_conn.run.mock_calls]
+    assert queries == [
+        "SELECT pg_try_advisory_lock(hashtext('extract'))",
+        "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+        "SELECT transaction_timestamp()::timestamp",
+        "COMMIT",
+        "SELECT pg_advisory_unlock(hashtext('extract'))",
+    ]
+    mock_s3.put_object.assert_any_call(
+        Body="2024-11-25 15:00:00.123456",
+        Bucket="banana-squad-code",
+        Key="last_extracted.txt",
+    )
+    mock_s3.put_object.assert_any_call(
+        Body='{\n    "staff": 3\n}',
+        Bucket="banana-squad-code",
+        Key="change_counters.json",
+    )
+    mock_conn.close.assert_not_called()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.discard_connection")
+@patch("extract.get_change_counters", return_value={})
+@patch("extract.initial_extract", side_effect=Exception("Database error"))
+def test_connection_is_discarded_after_failure(
+    mock_initial,
+    mock_counters,
+    mock_discard_connection,
+    mock_get_connection,
+    mock_create_s3_client,
+):
+    mock_create_s3_client.return_value.list_objects.return_value = {}
+    mock_get_connection.return_value.run.return_value = [[datetime(2024, 11, 25)]]
+
+    result = lambda_handler({}, {})
+
+    assert result["result"] == "Failure"
+    mock_discard_connection.assert_called_once()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"staff": 3, "sales_order": 7})
+@patch("extract.continuous_extract")
+def test_run_is_skipped_without_writing_to_s3_when_nothing_changed(
+    mock_continuous,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"staff": 3, "sales_order": 7}, "refresh_times.json": {}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
+
+    result = lambda_handler({}, {})
+
+    assert result == {"result": "Success", "message": "No changes to extract"}
+    mock_continuous.assert_not_called()
+    queries = [call.args[0] for call in mock_connect.return_value.run.call_args_list]
+    assert "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY" not in queries
+    mock_s3.put_object.assert_not_called()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters")
+@patch("extract.continuous_extract")
+def test_run_is_skipped_while_another_invocation_extracts_the_source(
+    mock_continuous, mock_counters, mock_connect, mock_create_s3_client
+):
+    mock_connect.return_value.run.return_value = [[False]]
+    mock_s3 = mock_create_s3_client.return_value
+
+    result = lambda_handler({"tables": ["staff"]}, {})
+
+    assert result == {"result": "Success", "message": "Extract in progress"}
+    mock_connect.return_value.run.assert_called_once_with(
+        "SELECT pg_try_advisory_lock(hashtext('extract'))"
+    )
+    mock_counters.assert_not_called()
+    mock_continuous.assert_not_called()
+    mock_s3.put_object.assert_not_called()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"staff": 3, "sales_order": 8})
+@patch("extract.continuous_extract", return_value=["sales_order.csv"])
+def test_only_changed_tables_are_extracted(
+    mock_continuous,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"staff": 3, "sales_order": 7}, "refresh_times.json": {}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
+    mock_conn = mock_connect.return_value
+    mock_conn.run.return_value = [[datetime(2024, 11, 25)]]
+
+    result = lambda_handler({}, {})
+
+    assert result["result"] == "Success"
+    mock_continuous.assert_called_once_with(
+        mock_s3, mock_conn, {"staff"}, {}, None, None, {"sales_order"}, {}
+    )
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={})
+@patch("extract.ExtractCheckpoint.load")
+@patch("extract.invoke_continuation")
+@patch("extract.initial_extract", return_value=["table1/page1.csv"])
+def test_unfinished_initial_extract_continues_in_new_invocation(
+    mock_initial,
+    mock_invoke,
+    mock_load_checkpoint,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+):
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {}
+    mock_connect.return_value.run.return_value = [[datetime(2024, 11, 25)]]
+    checkpoint = ExtractCheckpoint(mock_s3, "banana-squad-code", "checkpoint.json")
+    checkpoint.finished = False
+    mock_load_checkpoint.return_value = checkpoint
+    context = MagicMock(function_name="extract")
+
+    result = lambda_handler({"continuation": 2}, context)
+
+    assert result["result"] == "Success"
+    mock_invoke.assert_called_once_with("extract", 3)
+    keys = [call.kwargs["Key"] for call in mock_s3.put_object.mock_calls]
+    assert keys == ["checkpoint.json"]
+    mock_s3.delete_object.assert_not_called()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={})
+@patch("extract.ExtractCheckpoint.load")
+@patch("extract.initial_extract")
+def test_scheduled_run_leaves_running_initial_extract_alone(
+    mock_initial,
+    mock_load_checkpoint,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+):
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {}
+    mock_load_checkpoint.return_value = ExtractCheckpoint(
+        mock_s3, "banana-squad-code", "checkpoint.json", saved_at=time.time() - 10
+    )
+
+    result = lambda_handler({}, {})
+
+    assert result == {"result": "Success", "message": "Initial extract in progress"}
+    mock_initial.assert_not_called()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"currency": 4, "payment": 9})
+@patch("extract.continuous_extract")
+def test_run_is_skipped_when_only_tables_not_due_changed(
+    mock_continuous,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"currency": 3, "payment": 7}, "refresh_times.json": {"currency": time.time()}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
+
+    result = lambda_handler({}, {})
+
+    assert result == {"result": "Success", "message": "No changes to extract"}
+    mock_continuous.assert_not_called()
+    mock_s3.put_object.assert_not_called()
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"currency": 4, "staff": 9})
+@patch("extract.continuous_extract", return_value=["staff.csv"])
+def test_tables_not_due_keep_their_old_change_counter(
+    mock_continuous,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"currency": 3, "staff": 7}, "refresh_times.json": {"currency": time.time()}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
+    mock_connect.return_value.run.return_value = [[datetime(2024, 11, 25)]]
+
+    result = lambda_handler({}, {})
+
+    assert result["result"] == "Success"
+    assert mock_continuous.call_args.args[2] == {"currency"}
+    assert stored_manifest(mock_s3, "change_counters.json") == {"currency": 3, "staff": 9}
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"payment": 4, "staff": 9})
+@patch("extract.continuous_extract", return_value=["staff.csv"])
+def test_notified_run_extracts_only_the_notified_tables(
+    mock_continuous,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"payment": 3, "staff": 7}, "refresh_times.json": {}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
+    mock_connect.return_value.run.return_value = [[datetime(2024, 11, 25)]]
+
+    result = lambda_handler({"tables": ["staff"]}, {})
+
+    assert result["result"] == "Success"
+    assert mock_continuous.call_args.args[2] == {"payment"}
+    assert mock_continuous.call_args.args[4] == ["staff"]
+    assert stored_manifest(mock_s3, "change_counters.json") == {"payment": 3, "staff": 9}
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={})
+@patch("extract.initial_extract")
+def test_notified_run_waits_for_the_initial_extract(
+    mock_initial, mock_counters, mock_connect, mock_create_s3_client
+):
+    mock_create_s3_client.return_value.list_objects.return_value = {}
+
+    result = lambda_handler({"tables": ["staff"]}, {})
+
+    assert result == {"result": "Success", "message": "Initial extract has not run yet"}
+    mock_initial.assert_not_called()
+
+
+@patch("extract.get_connection")
+@patch("extract.listen_for_changes")
+@patch("extract.stop_listening_for_changes")
+@patch("extract.wait_for_changes", side_effect=[{"staff", "address"}, set()])
+@patch("extract.lambda_handler", return_value={"result": "Success"})
+def test_listening_run_extracts_every_batch_of_notified_tables(
+    mock_extract, mock_wait, mock_stop, mock_listen, mock_connect
+):
+    result = lambda_handler({"listen": 10}, {})
+
+    assert result["result"] == "Success"
+    assert result["extracts"] == [{"result": "Success"}]
+    mock_extract.assert_called_once_with({"tables": ["address", "staff"]}, {})
+    assert mock_wait.call_count == 2
+    assert mock_wait.call_args.args[:3] == (
+        mock_connect.return_value,
+        "totesys_changes",
+        5,
+    )
+    assert mock_listen.call_count == 2
+    mock_stop.assert_called_once()
+
+
+@patch("extract.get_connection")
+@patch("extract.discard_connection")
+@patch("extract.listen_for_changes", side_effect=Exception("Connection lost"))
+def test_listening_run_discards_the_connection_after_failure(
+    mock_listen, mock_discard, mock_connect
+):
+    result = lambda_handler({"listen": 10}, {})
+
+    assert result["result"] == "Failure"
+    mock_discard.assert_called_once()
+
+
+@patch("extract.get_connection")
+@patch("extract.get_tables", return_value=[("staff", "staff_id"), ("payment", "payment_id")])
+@patch("extract.install_change_triggers")
+def test_change_triggers_are_installed_on_every_table(
+    mock_install, mock_tables, mock_connect
+):
+    result = lambda_handler({"install_change_triggers": True}, {})
+
+    assert result["result"] == "Success"
+    mock_install.assert_called_once_with(
+        mock_connect.return_value, ["staff", "payment"], "totesys_changes"
+    )
+
+
+SOURCES = [
+    {"id": "eu", "secret": "totesys_eu"},
+    {"id": "us", "secret": "totesys_us"},
+]
+
+
+@patch("extract.EXTRACT_SOURCES", SOURCES)
+@patch("extract.create_s3_client")
+@patch("extract.extract_source")
+def test_every_source_is_extracted_into_one_report(
+    mock_extract_source, mock_create_s3_client
+):
+    mock_extract_source.side_effect = lambda s3, event, context, source: {
+        "result": "Success",
+        "extraction_type": "Continuous",
+        "timestamp": f"2024-11-25 15:00:0{SOURCES.index(source)}",
+        "updated_tables": [f"staff/2024/11/25/file-{source['id']}.csv"],
+    }
+    mock_s3 = mock_create_s3_client.return_value
+
+    result = lambda_handler({}, {})
+
+    assert result["result"] == "Success"
+    assert set(result["sources"]) == {"eu", "us"}
+    assert [call.args[3] for call in mock_extract_source.mock_calls] == SOURCES
+    report_call = mock_s3.put_object.call_args.kwargs
+    assert report_call["Key"] == (
+        "reports/Continuous_extract_2024-11-25 15:00:01_success.json"
+    )
+    report = json.loads(report_call["Body"])
+    assert report["updated_tables"] == [
+        "staff/2024/11/25/file-eu.csv",
+        "staff/2024/11/25/file-us.csv",
+    ]
+    assert report["sources"]["us"]["updated_tables"] == [
+        "staff/2024/11/25/file-us.csv"
+    ]
+
+
+@patch("extract.EXTRACT_SOURCES", SOURCES)
+@patch("extract.create_s3_client")
+@patch("extract.invoke_continuation")
+@patch("extract.extract_source")
+def test_failed_source_does_not_stop_the_others(
+    mock_extract_source, mock_invoke, mock_create_s3_client
+):
+    results = {
+        "eu": {"result": "Failure", "error": "Unexpected error"},
+        "us": {"result": "Success", "continues": True},
+    }
+    mock_extract_source.side_effect = lambda s3, event, context, source: results[
+        source["id"]
+    ]
+    context = MagicMock(function_name="extract")
+
+    result = lambda_handler({}, context)
+
+    assert result["result"] == "Failure"
+    assert result["sources"]["eu"]["error"] == "Unexpected error"
+    assert result["sources"]["us"]["message"] == (
+        "Initial extract continues in invocation 1"
+    )
+    mock_invoke.assert_called_once_with("extract", 1)
+    mock_create_s3_client.return_value.put_object.assert_not_called()
+
+
+@patch("extract.EXTRACT_SOURCES", SOURCES)
+@patch("extract.create_s3_client")
+@patch("extract.extract_source", return_value={"result": "Success", "message": "x"})
+def test_event_can_limit_the_run_to_one_source(
+    mock_extract_source, mock_create_s3_client
+):
+    lambda_handler({"source": "us"}, {})
+
+    mock_extract_source.assert_called_once()
+    assert mock_extract_source.call_args.args[3] == SOURCES[1]
+
+
+@patch("extract.EXTRACT_SOURCES", SOURCES)
+@patch("extract.listen_and_extract")
+def test_listening_needs_a_source_when_there_are_several(mock_listen):
+    result = lambda_handler({"listen": 10}, {})
+
+    assert result["result"] == "Failure"
+    mock_listen.assert_not_called()
+
+    lambda_handler({"listen": 10, "source": "us"}, {})
+
+    assert mock_listen.call_args.args[2] == SOURCES[1]
+
+
+@patch("extract.EXTRACT_SOURCES", SOURCES)
+def test_unknown_source_fails():
+    result = lambda_handler({"source": "apac"}, {})
+
+    assert result == {"result": "Failure", "error": "Unknown extract source: apac"}
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"staff": 4})
+@patch("extract.continuous_extract", return_value=["staff/file-eu.csv"])
+def test_source_keeps_its_own_manifests(
+    mock_continuous,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"staff": 3}, "refresh_times.json": {}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "eu/last_extracted.txt"}]}
+    mock_connect.return_value.run.return_value = [[datetime(2024, 11, 25)]]
+
+    result = extract_source(mock_s3, {}, {}, SOURCES[0])
+
+    assert result["extraction_type"] == "Continuous"
+    assert result["updated_tables"] == ["staff/file-eu.csv"]
+    mock_connect.assert_called_once_with("totesys_eu")
+    loaded = [call.args[2] for call in mock_load_manifest.mock_calls]
+    assert "eu/change_counters.json" in loaded
+    assert mock_continuous.call_args.args[5] == SOURCES[0]
+    keys = [call.kwargs["Key"] for call in mock_s3.put_object.mock_calls]
+    assert keys == [
+        "eu/extract_history.json",
+        "eu/change_counters.json",
+        "eu/last_extracted.txt",
+    ]
+
+
+@patch("extract.create_s3_client")
+@patch("extract.get_connection")
+@patch("extract.get_change_counters", return_value={"staff": 30, "sales_order": 7})
+@patch("extract.get_live_rows", return_value={"staff": 1000, "sales_order": 5000})
+@patch("extract.continuous_extract", return_value=["staff.csv"])
+def test_plan_and_measured_cost_are_recorded_in_the_report(
+    mock_continuous,
+    mock_live_rows,
+    mock_counters,
+    mock_connect,
+    mock_create_s3_client,
+    mock_load_manifest,
+):
+    mock_load_manifest.side_effect = manifests(
+        {"change_counters.json": {"staff": 10, "sales_order": 7}, "refresh_times.json": {}}
+    )
+    mock_s3 = mock_create_s3_client.return_value
+    mock_s3.list_objects.return_value = {"Contents": [{"Key": "last_extracted.txt"}]}
+    mock_connect.return_value.run.return_value = [[datetime(2024, 11, 25)]]
+    mock_continuous.side_effect = lambda *args: args[7].update({"staff": 0.5}) or [
+        "staff.csv"
+    ]
+
+    result = lambda_handler({}, {})
+
+    assert result["result"] == "Success"
+    assert mock_continuous.call_args.args[6] == set()
+    report = json.loads(mock_s3.put_object.call_args.kwargs["Body"])
+    assert report["plan"]["staff"]["strategy"] == "incremental"
+    assert report["plan"]["staff"]["changed_rows"] == 20
+    assert report["plan"]["staff"]["seconds"] == 0.5
+    assert report["plan"]["sales_order"]["strategy"] == "skip"
+    saved_history = stored_manifest(mock_s3, "extract_history.json")
+    assert saved_history == {"staff": {"incremental": 0.025}}
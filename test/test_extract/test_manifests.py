@@ -0,0 +1,45 @@
+from util_functions import (
+    load_manifest,
+    save_manifest,
+    load_row_hashes,
+    save_row_hashes,
+)
+from moto import mock_aws
+from botocore.exceptions import ClientError
+import boto3
+import pytest
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket="test-bucket")
+        yield s3_client
+
+
+def test_saved_manifest_can_be_loaded(s3_client):
+    watermarks = {"staff": {"last_updated": "2024-01-01T00:00:00", "id": 5}}
+
+    save_manifest(s3_client, watermarks, "test-bucket", "watermarks.json")
+    result = load_manifest(s3_client, "test-bucket", "watermarks.json")
+
+    assert result == watermarks
+
+
+def test_load_returns_empty_dict_when_missing(s3_client):
+    assert load_manifest(s3_client, "test-bucket", "watermarks.json") == {}
+
+
+def test_load_raises_other_errors(s3_client):
+    with pytest.raises(ClientError):
+        load_manifest(s3_client, "missing-bucket", "watermarks.json")
+
+
+def test_row_hashes_are_loaded_for_the_bucket_checksum_they_were_taken_for(s3_client):
+    key = "row_hashes/payment/0.json"
+    save_row_hashes(s3_client, {"1": "a"}, [1, "x"], "test-bucket", key)
+
+    assert load_row_hashes(s3_client, "test-bucket", key, [1, "x"]) == {"1": "a"}
+    assert load_row_hashes(s3_client, "test-bucket", key, [1, "y"]) == {}
+    assert load_row_hashes(s3_client, "test-bucket", "missing.json", [1, "x"]) == {}
@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock, patch
+from extract import plan_extract
+
+
+@patch("extract.get_live_rows", return_value={"staff": 20, "sales_order": 1000})
+@patch("extract.load_manifest")
+@patch("extract.get_table_policy")
+def test_changed_tables_are_planned_from_counters_and_history(
+    mock_policy, mock_load_manifest, mock_live_rows
+):
+    mock_policy.side_effect = lambda table: {
+        "mode": "full" if table == "currency" else "incremental"
+    }
+    mock_load_manifest.return_value = {"sales_order": {"incremental": 0.00001}}
+    counters = {"staff": 30, "sales_order": 500, "currency": 9, "design": 4}
+    previous = {"staff": 10, "sales_order": 400, "currency": 1, "design": 4}
+
+    plan, history = plan_extract(
+        MagicMock(), MagicMock(), counters, previous, {"design"}
+    )
+
+    assert history == mock_load_manifest.return_value
+    assert mock_load_manifest.call_args.args[2] == "extract_history.json"
+    assert plan["staff"]["strategy"] == "full"
+    assert plan["staff"]["changed_rows"] == 20
+    assert plan["sales_order"]["strategy"] == "incremental"
+    assert plan["sales_order"]["changed_rows"] == 100
+    assert plan["design"]["strategy"] == "skip"
+    assert "currency" not in plan
+
+
+@patch("extract.get_live_rows", return_value={"staff": 1000})
+@patch("extract.load_manifest", return_value={})
+@patch("extract.get_table_policy", return_value={"mode": "incremental"})
+def test_reset_counters_count_every_change_since_the_reset(
+    mock_policy, mock_load_manifest, mock_live_rows
+):
+    plan, _ = plan_extract(
+        MagicMock(),
+        MagicMock(),
+        {"staff": 5},
+        {"staff": 900},
+        set(),
+        {"id": "eu", "secret": "totesys_eu"},
+    )
+
+    assert plan["staff"]["changed_rows"] == 5
+    assert mock_load_manifest.call_args.args[2] == "eu/extract_history.json"
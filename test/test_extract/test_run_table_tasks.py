@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from extract import run_table_tasks, extract_tables
+from table_policies import DEFAULT_TABLE_POLICY
+
+
+def test_single_worker_runs_tasks_in_order_on_conn():
+    conn = MagicMock()
+    seen = []
+    tasks = [lambda c, i=i: seen.append((i, c)) or i for i in range(3)]
+
+    result = run_table_tasks(conn, tasks, workers=1)
+
+    assert result == [0, 1, 2]
+    assert seen == [(0, conn), (1, conn), (2, conn)]
+
+
+@patch("extract.connect")
+def test_workers_use_one_connection_each(mock_connect):
+    conn = MagicMock()
+    mock_connect.side_effect = [MagicMock(), MagicMock()]
+    lock = threading.Lock()
+    in_use = set()
+    max_in_use = []
+
+    def task(worker_conn, i):
+        with lock:
+            assert worker_conn not in in_use
+            in_use.add(worker_conn)
+            max_in_use.append(len(in_use))
+        time.sleep(0.01)
+        with lock:
+            in_use.remove(worker_conn)
+        return i
+
+    tasks = [lambda c, i=i: task(c, i) for i in range(8)]
+
+    result = run_table_tasks(conn, tasks, workers=3)
+
+    assert result == list(range(8))
+    assert mock_connect.call_count == 2
+    assert max(max_in_use) <= 3
+
+
+@patch("extract.connect")
+def test_connections_are_capped_by_number_of_tasks(mock_connect):
+    run_table_tasks(MagicMock(), [lambda c: 1, lambda c: 2], workers=10)
+
+    assert mock_connect.call_count == 1
+
+
+@patch("extract.connect")
+def test_task_error_is_raised_and_extra_connections_closed(mock_connect):
+    extra_connection = MagicMock()
+    mock_connect.return_value = extra_connection
+
+    def failing_task(c):
+        raise Exception("Database error")
+
+    with pytest.raises(Exception, match="Database error"):
+        run_table_tasks(MagicMock(), [lambda c: 1, failing_task], workers=2)
+
+    extra_connection.close.assert_called_once()
+
+
+@patch("extract.connect")
+def test_worker_connections_join_exported_snapshot(mock_connect):
+    conn = MagicMock()
+    conn.run.return_value = [["00000003-0000001B-1"]]
+
+    run_table_tasks(conn, [lambda c: 1, lambda c: 2], workers=2)
+
+    conn.run.assert_called_once_with("SELECT pg_export_snapshot()")
+    worker_queries = [call.args[0] for call in mock_connect.return_value.run.mock_calls]
+    assert "SET TRANSACTION SNAPSHOT '00000003-0000001B-1'" in worker_queries
+
+
+@patch("extract.connect")
+def test_given_pool_is_used_without_opening_connections(mock_connect):
+    conn, pooled_conn = MagicMock(), MagicMock()
+    pool = queue.Queue()
+    pool.put(pooled_conn)
+
+    result = run_table_tasks(conn, [lambda c: c, lambda c: c], workers=2, pool=pool)
+
+    assert result == [pooled_conn, pooled_conn]
+    mock_connect.assert_not_called()
+
+
+@patch("extract.EXTRACT_WORKERS", 2)
+@patch("extract.extract_table", return_value=None)
+@patch("extract.get_page_end")
+@patch("extract.get_high_water_mark")
+@patch(
+    "extract.get_key_slices", return_value=["id < 5", "id >= 5 AND id < 9", "id >= 9"]
+)
+@patch(
+    "extract.get_table_policy", return_value={**DEFAULT_TABLE_POLICY, "partitions": 3}
+)
+@patch("extract.connect")
+def test_key_range_slices_count_against_extract_workers(
+    mock_connect,
+    mock_policy,
+    mock_key_slices,
+    mock_high_water_mark,
+    mock_page_end,
+    mock_extract_table,
+):
+    pages = [
+        {"last_updated": "2024-01-0{}T00:00:00".format(day), "id": day}
+        for day in (1, 2, 3)
+    ]
+    mock_high_water_mark.return_value = pages[-1]
+    mock_page_end.side_effect = pages
+
+    extract_tables(MagicMock(), MagicMock(), [("sales_order", "id")], {})
+
+    assert mock_connect.call_count == 1
+    assert mock_extract_table.call_count == 9
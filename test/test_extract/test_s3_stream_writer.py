@@ -0,0 +1,127 @@
+from util_functions import S3StreamWriter, UploadPipeline
+from moto import mock_aws
+from unittest.mock import MagicMock
+import boto3
+import pytest
+import threading
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket="test-bucket")
+        yield s3_client
+
+
+def test_small_file_is_uploaded_with_put_object(s3_client):
+    writer = S3StreamWriter(s3_client, "test-bucket", "test.csv")
+    writer.write(b"column1,column2\n")
+    writer.write("value1,value2\n")
+    writer.close()
+
+    response = s3_client.get_object(Bucket="test-bucket", Key="test.csv")
+
+    assert response["Body"].read() == b"column1,column2\nvalue1,value2\n"
+    assert writer.bytes_written == 30
+
+
+def test_large_file_is_uploaded_in_parts(s3_client):
+    part_size = 5 * 1024 * 1024
+    writer = S3StreamWriter(s3_client, "test-bucket", "test.csv", part_size)
+    for _ in range(3):
+        writer.write(b"a" * part_size)
+    writer.write(b"tail")
+    writer.close()
+
+    response = s3_client.get_object(Bucket="test-bucket", Key="test.csv")
+    content = response["Body"].read()
+
+    assert len(content) == 3 * part_size + 4
+    assert content.endswith(b"tail")
+    assert len(writer._parts) == 4
+
+
+def test_buffer_never_exceeds_part_size():
+    mock_s3_client = MagicMock()
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": "id"}
+    mock_s3_client.upload_part.return_value = {"ETag": "etag"}
+    writer = S3StreamWriter(mock_s3_client, "test-bucket", "test.csv", part_size=10)
+
+    for _ in range(25):
+        writer.write(b"ab")
+        assert len(writer._buffer) < 10
+
+    assert mock_s3_client.upload_part.call_count == 5
+    mock_s3_client.create_multipart_upload.assert_called_once()
+
+
+def test_abort_removes_multipart_upload(s3_client):
+    part_size = 5 * 1024 * 1024
+    writer = S3StreamWriter(s3_client, "test-bucket", "test.csv", part_size)
+    writer.write(b"a" * part_size)
+    writer.abort()
+
+    uploads = s3_client.list_multipart_uploads(Bucket="test-bucket")
+    objects = s3_client.list_objects(Bucket="test-bucket")
+
+    assert "Uploads" not in uploads
+    assert "Contents" not in objects
+
+
+def test_abort_before_first_part_does_not_call_s3():
+    mock_s3_client = MagicMock()
+    writer = S3StreamWriter(mock_s3_client, "test-bucket", "test.csv")
+    writer.write(b"column1,column2\n")
+    writer.abort()
+
+    assert mock_s3_client.mock_calls == []
+
+
+def test_pipelined_parts_are_completed_in_order(s3_client):
+    part_size = 5 * 1024 * 1024
+    pipeline = UploadPipeline(workers=3, queue_size=2)
+    writer = S3StreamWriter(s3_client, "test-bucket", "test.csv", part_size, pipeline)
+    for letter in b"abc":
+        writer.write(bytes([letter]) * part_size)
+    writer.write(b"tail")
+    writer.close()
+
+    content = s3_client.get_object(Bucket="test-bucket", Key="test.csv")["Body"].read()
+
+    assert len(content) == 3 * part_size + 4
+    assert content[:1] == b"a" and content[part_size : part_size + 1] == b"b"
+    assert [part["PartNumber"] for part in writer._parts] == [1, 2, 3, 4]
+
+
+def test_pipeline_blocks_reader_when_queue_is_full():
+    release = threading.Event()
+    pipeline = UploadPipeline(workers=1, queue_size=2)
+    pipeline.submit(release.wait)
+    pipeline.submit(release.wait)
+
+    third = threading.Thread(target=pipeline.submit, args=(lambda: None,))
+    third.start()
+    third.join(timeout=0.2)
+    assert third.is_alive()
+
+    release.set()
+    third.join(timeout=5)
+    assert not third.is_alive()
+
+
+def test_failed_pipelined_part_aborts_upload():
+    mock_s3_client = MagicMock()
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": "id"}
+    mock_s3_client.upload_part.side_effect = Exception("Upload failed")
+    pipeline = UploadPipeline(workers=2, queue_size=2)
+    writer = S3StreamWriter(mock_s3_client, "test-bucket", "test.csv", 10, pipeline)
+
+    writer.write(b"a" * 10)
+    with pytest.raises(Exception, match="Upload failed"):
+        writer.close()
+
+    mock_s3_client.complete_multipart_upload.assert_not_called()
+    mock_s3_client.abort_multipart_upload.assert_called_once_with(
+        Bucket="test-bucket", Key="test.csv", UploadId="id"
+    )
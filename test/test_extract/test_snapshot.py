@@ -0,0 +1,57 @@
+from util_functions import start_snapshot, export_snapshot, join_snapshot
+from extract import connect_to_snapshot
+from unittest.mock import MagicMock, patch
+from datetime import datetime
+import pytest
+
+
+def test_start_snapshot_returns_database_time():
+    mock_conn = MagicMock()
+    mock_conn.run.side_effect = [None, [[datetime(2024, 11, 25, 15, 0)]]]
+
+    result = start_snapshot(mock_conn)
+
+    assert result == datetime(2024, 11, 25, 15, 0)
+    assert mock_conn.run.mock_calls[0].args[0] == (
+        "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+    )
+
+
+def test_export_snapshot_returns_snapshot_id():
+    mock_conn = MagicMock()
+    mock_conn.run.return_value = [["00000003-0000001B-1"]]
+
+    assert export_snapshot(mock_conn) == "00000003-0000001B-1"
+    mock_conn.run.assert_called_once_with("SELECT pg_export_snapshot()")
+
+
+def test_join_snapshot_sets_transaction_snapshot():
+    mock_conn = MagicMock()
+
+    join_snapshot(mock_conn, "00000003-0000001B-1")
+
+    queries = [call.args[0] for call in mock_conn.run.mock_calls]
+    assert queries == [
+        "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+        "SET TRANSACTION SNAPSHOT '00000003-0000001B-1'",
+    ]
+
+
+@patch("extract.connect")
+def test_connect_to_snapshot_joins_snapshot(mock_connect):
+    worker_conn = connect_to_snapshot("00000003-0000001B-1")
+
+    assert worker_conn is mock_connect.return_value
+    assert worker_conn.run.mock_calls[-1].args[0] == (
+        "SET TRANSACTION SNAPSHOT '00000003-0000001B-1'"
+    )
+
+
+@patch("extract.connect")
+def test_connect_to_snapshot_closes_connection_on_error(mock_connect):
+    mock_connect.return_value.run.side_effect = Exception("invalid snapshot")
+
+    with pytest.raises(Exception, match="invalid snapshot"):
+        connect_to_snapshot("bad")
+
+    mock_connect.return_value.close.assert_called_once()
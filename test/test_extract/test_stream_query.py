@@ -0,0 +1,113 @@
+from util_functions import stream_query
+from unittest.mock import MagicMock
+import io
+import pytest
+
+
+@pytest.fixture
+def mock_db_connection():
+    mock_conn = MagicMock()
+    mock_conn.columns = [{"name": "id"}, {"name": "name"}]
+    return mock_conn
+
+
+def test_writes_header_once_and_all_batches(mock_db_connection):
+    mock_db_connection.run.side_effect = [
+        None,
+        None,
+        [[1, "Test"], [2, "Test2"]],
+        [[3, "Test3"]],
+        [],
+        None,
+        None,
+    ]
+    writer = io.BytesIO()
+
+    row_count = stream_query(mock_db_connection, "SELECT * FROM table1", writer, 2)
+
+    assert row_count == 3
+    assert writer.getvalue() == b"id,name\r\n1,Test\r\n2,Test2\r\n3,Test3\r\n"
+    queries = [call.args[0] for call in mock_db_connection.run.mock_calls]
+    assert queries == [
+        "START TRANSACTION READ ONLY",
+        "DECLARE extract_cursor NO SCROLL CURSOR FOR SELECT * FROM table1",
+        "FETCH FORWARD 2 FROM extract_cursor",
+        "FETCH FORWARD 2 FROM extract_cursor",
+        "FETCH FORWARD 2 FROM extract_cursor",
+        "CLOSE extract_cursor",
+        "COMMIT",
+    ]
+
+
+def test_writes_nothing_when_no_rows(mock_db_connection):
+    mock_db_connection.run.side_effect = [None, None, [], None, None]
+    writer = io.BytesIO()
+
+    row_count = stream_query(mock_db_connection, "SELECT * FROM table1", writer, 2)
+
+    assert row_count == 0
+    assert writer.getvalue() == b""
+
+
+def test_rolls_back_on_database_error(mock_db_connection):
+    mock_db_connection.run.side_effect = [
+        None,
+        None,
+        Exception("Database error"),
+        None,
+    ]
+
+    with pytest.raises(Exception, match="Database error"):
+        stream_query(mock_db_connection, "SELECT * FROM table1", io.BytesIO(), 2)
+
+    assert mock_db_connection.run.mock_calls[-1].args[0] == "ROLLBACK"
+
+
+def test_uses_current_transaction_when_not_owning_one(mock_db_connection):
+    mock_db_connection.run.side_effect = [None, [[1, "Test"]], [], None]
+    writer = io.BytesIO()
+
+    row_count = stream_query(
+        mock_db_connection,
+        "SELECT * FROM table1",
+        writer,
+        2,
+        own_transaction=False,
+    )
+
+    assert row_count == 1
+    queries = [call.args[0] for call in mock_db_connection.run.mock_calls]
+    assert "START TRANSACTION READ ONLY" not in queries
+    assert "COMMIT" not in queries
+
+
+def test_writes_parquet_with_one_row_group_per_batch():
+    import pyarrow.parquet as pq
+
+    mock_conn = MagicMock()
+    mock_conn.columns = [
+        {"name": "id", "type_oid": 23, "type_modifier": -1},
+        {"name": "name", "type_oid": 25, "type_modifier": -1},
+    ]
+    mock_conn.run.side_effect = [
+        None,
+        [[1, "Test"], [2, "Test2"]],
+        [[3, "Test3"]],
+        [],
+        None,
+    ]
+    writer = io.BytesIO()
+
+    row_count = stream_query(
+        mock_conn,
+        "SELECT * FROM table1",
+        writer,
+        2,
+        own_transaction=False,
+        output_format="parquet",
+    )
+
+    parquet_file = pq.ParquetFile(io.BytesIO(writer.getvalue()))
+    assert row_count == 3
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.read().column("id").to_pylist() == [1, 2, 3]
@@ -0,0 +1,46 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+import pyarrow as pa
+import pytest
+from load_utils import insert_data_to_table
+
+
+@pytest.fixture
+def conn():
+    conn = MagicMock()
+    conn.cursor.return_value.__enter__.return_value = MagicMock()
+    return conn
+
+
+def test_inserts_every_row_as_python_values(conn):
+    table = pa.table(
+        {
+            "design_id": pa.array([1, 2], pa.int64()),
+            "unit_price": pa.array([Decimal("2.50"), None], pa.decimal128(10, 2)),
+            "created_at": [datetime(2024, 1, 1), datetime(2024, 1, 2)],
+        }
+    )
+
+    insert_data_to_table(conn, "dim_design", table)
+
+    cur = conn.cursor.return_value.__enter__.return_value
+    query = cur.execute.call_args_list[0].args[0]
+    assert "INSERT INTO dim_design (design_id, unit_price, created_at)" in query
+    assert [call.args[1] for call in cur.execute.call_args_list] == [
+        (1, Decimal("2.50"), datetime(2024, 1, 1)),
+        (2, None, datetime(2024, 1, 2)),
+    ]
+    assert type(cur.execute.call_args_list[0].args[1][0]) is int
+    conn.commit.assert_called_once()
+
+
+def test_rolls_back_when_an_insert_fails(conn):
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.execute.side_effect = Exception("duplicate key")
+
+    with pytest.raises(Exception, match="duplicate key"):
+        insert_data_to_table(conn, "dim_design", pa.table({"design_id": [1]}))
+
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
@@ -4,7 +4,7 @@ from moto import mock_aws
 from unittest.mock import patch, MagicMock
 from load import lambda_handler, S3_BUCKET
 from botocore.exceptions import ClientError
-import pandas as pd
+import pyarrow as pa
 import json
 
 
@@ -28,7 +28,8 @@ def test_lambda_handler_unexpected_table():
     }
 
     with patch("load.create_s3_client", return_value=s3_client), \
-         patch("load.connect") as mock_connect, \
+         patch("load.get_connection") as mock_connect, \
+         patch("load.discard_connection") as mock_discard_connection, \
          patch("load.load_parquet_from_s3", return_value=None):
         conn_mock = MagicMock()
         mock_connect.return_value = conn_mock
@@ -37,7 +38,7 @@ def test_lambda_handler_unexpected_table():
         with pytest.raises(ValueError, match="Unexpected table name: unknown_table"):
             lambda_handler(event, None)
 
-        conn_mock.close.assert_called_once()
+        mock_discard_connection.assert_called_once()
 
 
 
@@ -60,7 +61,38 @@ def test_lambda_handler_general_exception():
     }
 
     with patch("load.create_s3_client", return_value=s3_client), \
-         patch("load.connect", side_effect=Exception("Database connection failed")):
+         patch("load.get_connection", side_effect=Exception("Database connection failed")):
         # Call lambda_handler and expect Exception
         with pytest.raises(Exception, match="Database connection failed"):
-            lambda_handler(event, None)
\ No newline at end of file
+            lambda_handler(event, None)
+
+
+@mock_aws
+def test_lambda_handler_keeps_connection_after_success():
+    """Test lambda_handler leaves the connection open for the next invocation."""
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=S3_BUCKET)
+    event = {"Records": [{"s3": {"object": {"key": "dim_design/test.parquet"}}}]}
+
+    with patch("load.create_s3_client", return_value=s3_client), \
+         patch("load.get_connection") as mock_connect, \
+         patch("load.discard_connection") as mock_discard_connection, \
+         patch("load.load_parquet_from_s3", return_value=pa.table({})), \
+         patch("load.insert_data_to_table") as mock_insert:
+        lambda_handler(event, None)
+
+        mock_insert.assert_called_once()
+        mock_discard_connection.assert_not_called()
+        mock_connect.return_value.close.assert_not_called()
+
+
+def test_lambda_handler_skips_reference_snapshots():
+    """Test lambda_handler leaves the transform's reference snapshots alone."""
+    event = {"Records": [{"s3": {"object": {"key": "reference/address.parquet"}}}]}
+
+    with patch("load.create_s3_client") as mock_create_s3_client, \
+         patch("load.get_connection") as mock_connect:
+        lambda_handler(event, None)
+
+        mock_create_s3_client.assert_not_called()
+        mock_connect.assert_not_called()
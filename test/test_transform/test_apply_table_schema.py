@@ -0,0 +1,68 @@
+from decimal import Decimal
+import pandas as pd
+from table_schemas import apply_table_schema, TABLE_DTYPES
+
+
+def sales_order_frame():
+    return pd.DataFrame(
+        {
+            "sales_order_id": [1, 2],
+            "created_at": ["2022-11-03 14:20:52.186000", "2022-11-03 14:20:52"],
+            "unit_price": [3.94, 2.5],
+            "currency_id": [1, 2],
+            "agreed_delivery_date": ["2022-11-10", "2022-11-10"],
+        }
+    )
+
+
+def test_converts_columns_to_table_dtypes():
+    df = apply_table_schema(sales_order_frame(), "sales_order")
+
+    assert df["sales_order_id"].dtype == "Int32"
+    assert df["currency_id"].dtype == "Int16"
+    assert df["agreed_delivery_date"].dtype == "category"
+    assert list(df["unit_price"]) == [Decimal("3.94"), Decimal("2.50")]
+    assert pd.api.types.is_datetime64_any_dtype(df["created_at"])
+    assert df["created_at"][0] == pd.Timestamp("2022-11-03 14:20:52.186")
+
+
+def test_keeps_integer_columns_with_missing_values():
+    df = apply_table_schema(
+        pd.DataFrame({"staff_id": [1, 2], "department_id": [3.0, None]}), "staff"
+    )
+
+    assert df["department_id"].dtype == "Int16"
+    assert df["department_id"][0] == 3
+    assert pd.isna(df["department_id"][1])
+
+
+def test_leaves_unknown_tables_and_missing_columns_alone():
+    df = apply_table_schema(pd.DataFrame({"payment_id": [1]}), "payment")
+    assert df["payment_id"].dtype == "int64"
+
+    df = apply_table_schema(pd.DataFrame({"currency_code": ["GBP"]}), "currency")
+    assert list(df.columns) == ["currency_code"]
+
+
+def test_keeps_column_whose_values_do_not_fit():
+    df = apply_table_schema(pd.DataFrame({"design_id": ["not a number"]}), "design")
+
+    assert df["design_id"].dtype == object
+
+
+def test_reports_memory_saved_per_table():
+    report = {}
+
+    apply_table_schema(sales_order_frame(), "sales_order", report)
+    apply_table_schema(sales_order_frame(), "sales_order", report)
+
+    entry = report["sales_order"]
+    assert entry["inferred_bytes"] > entry["schema_bytes"] > 0
+    assert entry["saved_bytes"] == entry["inferred_bytes"] - entry["schema_bytes"]
+    assert 0 < entry["saved_percent"] < 100
+
+
+def test_every_transformed_table_has_a_schema():
+    from table_policies import get_consumed_tables
+
+    assert get_consumed_tables() <= set(TABLE_DTYPES)
@@ -133,4 +133,18 @@ def test_missing_column():
     df = pd.DataFrame(data)
 
     with pytest.raises(KeyError):
-        dim_currency(df)
\ No newline at end of file
+        dim_currency(df)
+
+def test_currency_names_from_projected_extract():
+    df = pd.DataFrame(
+        {
+            "currency_id": [1, 2],
+            "last_updated": ["2024-11-21 10:30:00", "2024-11-21 11:30:00"],
+            "currency_code": ["GBP", "EUR"],
+        }
+    )
+
+    result = dim_currency(df)
+
+    assert list(result.columns) == ["currency_id", "currency_code", "currency_name"]
+    assert list(result["currency_name"]) == ["British Pound Sterling", "Euro"]
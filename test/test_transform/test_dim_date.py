@@ -28,3 +28,8 @@ def test_dim_date_range():
     df = dim_date(start, end)
     expected_rows = (pd.to_datetime(end) - pd.to_datetime(start)).days + 1
     assert len(df) == expected_rows, "Row count does not match the date range."
+
+
+def test_dim_date_ids():
+    df = dim_date("2024-12-31", "2025-01-01")
+    assert list(df["date_id"]) == [20241231, 20250101]
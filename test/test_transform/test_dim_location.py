@@ -74,3 +74,32 @@ def test_return_expected_data_with_missing_values():
     result = dim_location(input_data)
 
     assert result.equals(expected_data)
+
+
+def test_return_expected_data_from_projected_extract():
+    df = pd.DataFrame(
+        {
+            "address_id": [1],
+            "last_updated": ["2024-11-21 10:30:00"],
+            "address_line_1": ["6826 Herzog Via"],
+            "address_line_2": [None],
+            "district": ["Avon"],
+            "city": ["New Patienceburgh"],
+            "postal_code": ["28441"],
+            "country": ["Turkey"],
+            "phone": ["1803 637401"],
+        }
+    )
+
+    result = dim_location(df)
+
+    assert list(result.columns) == [
+        "location_id",
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ]
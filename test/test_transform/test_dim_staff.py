@@ -131,4 +131,31 @@ def test_staff_empty_inputs():
 
     result = dim_staff(staff_df, department_df)
 
-    pd.testing.assert_frame_equal(result, expected_output)
\ No newline at end of file
+    pd.testing.assert_frame_equal(result, expected_output)
+
+def test_staff_of_several_sources_join_their_own_departments():
+    staff_df = pd.DataFrame(
+        {
+            "staff_id": [1, 1],
+            "first_name": ["John", "Jane"],
+            "last_name": ["Doe", "Smith"],
+            "department_id": [10, 10],
+            "email_address": ["john.doe@example.com", "jane.smith@example.com"],
+            "source_id": ["us", "eu"],
+        }
+    )
+    department_df = pd.DataFrame(
+        {
+            "department_id": [10, 10],
+            "department_name": ["HR", "Finance"],
+            "location": ["Leeds", "New York"],
+            "source_id": ["eu", "us"],
+        }
+    )
+
+    result = dim_staff(staff_df, department_df)
+
+    assert result[["source_id", "staff_id", "department_name"]].values.tolist() == [
+        ["eu", 1, "HR"],
+        ["us", 1, "Finance"],
+    ]
@@ -5,7 +5,7 @@ from transform_utils import fact_sales_order
 
 
 class TestFactSalesOrder(unittest.TestCase):
-    @patch("transform_utils.connect")
+    @patch("transform_utils.get_connection")
     @patch("transform_utils.table_has_data")
     @patch("transform_utils.get_current_max_id")
     def test_no_existing_data(self, mock_get_current_max_id, mock_table_has_data, mock_connect):
@@ -30,7 +30,7 @@ class TestFactSalesOrder(unittest.TestCase):
         self.assertIn("last_updated_date", result_df.columns)
         self.assertNotIn("created_at", result_df.columns)
     
-    @patch("transform_utils.connect")
+    @patch("transform_utils.get_connection")
     @patch("transform_utils.table_has_data")
     @patch("transform_utils.get_current_max_id")
     def test_existing_data(self, mock_get_current_max_id, mock_table_has_data, mock_connect):
@@ -55,7 +55,7 @@ class TestFactSalesOrder(unittest.TestCase):
         self.assertIn("last_updated_time", result_df.columns)
         self.assertNotIn("last_updated", result_df.columns)    
    
-    @patch("transform_utils.connect")
+    @patch("transform_utils.get_connection")
     @patch("transform_utils.table_has_data")
     @patch("transform_utils.get_current_max_id")
     def test_invalid_timestamps(self, mock_get_current_max_id, mock_table_has_data, mock_connect):
@@ -74,5 +74,25 @@ class TestFactSalesOrder(unittest.TestCase):
         self.assertTrue(pd.isna(result_df["created_date"].iloc[0]))
         self.assertTrue(pd.isna(result_df["last_updated_date"].iloc[0]))
     
+    @patch("transform_utils.get_connection")
+    @patch("transform_utils.table_has_data")
+    @patch("transform_utils.get_current_max_id")
+    def test_typed_timestamps_from_parquet(self, mock_get_current_max_id, mock_table_has_data, mock_connect):
+        mock_table_has_data.return_value = False
+        mock_connect.return_value = MagicMock()
+
+        df = pd.DataFrame(
+            {
+                "staff_id": [101],
+                "created_at": [pd.Timestamp("2024-11-27 12:30:00.123")],
+                "last_updated": [pd.Timestamp("2024-11-27 13:00:00")],
+            }
+        )
+
+        result_df = fact_sales_order(df)
+
+        self.assertEqual(result_df["created_date"].iloc[0], pd.Timestamp("2024-11-27").date())
+        self.assertEqual(str(result_df["last_updated_time"].iloc[0]), "13:00:00")
+
 if __name__ == "__main__":
     unittest.main()
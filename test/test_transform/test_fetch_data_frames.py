@@ -0,0 +1,83 @@
+import threading
+import time
+import pandas as pd
+from unittest.mock import MagicMock, patch
+from transform import fetch_data_frames
+
+
+def fake_read(frames, delays=None, failures=()):
+    def read_data_frame(s3_client, bucket, key, memory_report=None):
+        time.sleep((delays or {}).get(key, 0))
+        if key in failures:
+            raise ValueError(f"cannot parse {key}")
+        memory_report[key.split("/")[0]] = {"inferred_bytes": 100, "schema_bytes": 40}
+        return frames[key]
+
+    return read_data_frame
+
+
+def test_returns_frames_in_key_order():
+    keys = ["design/1.csv", "design/2.csv", "staff/1.csv"]
+    frames = {key: pd.DataFrame({"key": [key]}) for key in keys}
+    # the first key finishes last
+    delays = {"design/1.csv": 0.2}
+
+    with patch("transform.read_data_frame", fake_read(frames, delays)):
+        result, errors = fetch_data_frames(MagicMock(), "bucket", keys, workers=3)
+
+    assert list(result) == keys
+    assert errors == {}
+
+
+def test_fetches_files_concurrently():
+    keys = [f"design/{n}.csv" for n in range(4)]
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def read_data_frame(s3_client, bucket, key, memory_report=None):
+        with lock:
+            running.append(key)
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(key)
+        return pd.DataFrame()
+
+    with patch("transform.read_data_frame", read_data_frame):
+        fetch_data_frames(MagicMock(), "bucket", keys, workers=2)
+
+    assert max(peak) == 2
+
+
+def test_reports_failed_and_timed_out_files():
+    keys = ["design/ok.csv", "design/bad.csv", "design/slow.csv"]
+    frames = {key: pd.DataFrame() for key in keys}
+    read = fake_read(frames, {"design/slow.csv": 1}, failures={"design/bad.csv"})
+
+    start = time.monotonic()
+    with patch("transform.read_data_frame", read):
+        result, errors = fetch_data_frames(
+            MagicMock(), "bucket", keys, workers=3, timeout=0.2
+        )
+
+    assert time.monotonic() - start < 1
+    assert list(result) == ["design/ok.csv"]
+    assert errors["design/bad.csv"] == "ValueError: cannot parse design/bad.csv"
+    assert errors["design/slow.csv"] == "timed out after 0.2 seconds"
+
+
+def test_adds_memory_saved_by_every_file():
+    keys = ["design/1.csv", "design/2.csv"]
+    frames = {key: pd.DataFrame() for key in keys}
+    memory_report = {}
+
+    with patch("transform.read_data_frame", fake_read(frames)):
+        fetch_data_frames(MagicMock(), "bucket", keys, memory_report, workers=2)
+
+    assert memory_report["design"]["inferred_bytes"] == 200
+    assert memory_report["design"]["saved_bytes"] == 120
+
+
+def test_no_keys():
+    assert fetch_data_frames(MagicMock(), "bucket", []) == ({}, {})
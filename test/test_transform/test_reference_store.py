@@ -0,0 +1,167 @@
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_aws
+from reference_store import (
+    PROCESSED_BUCKET,
+    get_dimension_inputs,
+    load_snapshot,
+    upsert_rows,
+)
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(
+            Bucket=PROCESSED_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        yield client
+
+
+def counterparties(*rows):
+    return pd.DataFrame(
+        rows, columns=["counterparty_id", "counterparty_legal_name", "legal_address_id"]
+    )
+
+
+def addresses(*rows):
+    return pd.DataFrame(rows, columns=["address_id", "city"])
+
+
+def test_upsert_replaces_rows_and_adds_new_keys():
+    snapshot = addresses((1, "Leeds"), (2, "York"))
+    delta = addresses((3, "Hull"), (2, "Bath"), (2, "Bristol"))
+
+    result = upsert_rows(snapshot, delta, "address_id")
+
+    assert result.values.tolist() == [[1, "Leeds"], [2, "Bristol"], [3, "Hull"]]
+
+
+def test_first_run_stores_snapshots_and_returns_every_row(s3_client):
+    data_frames = {
+        "counterparty": counterparties((1, "Fahey", 10), (2, "Leannon", 20)),
+        "address": addresses((10, "Leeds"), (20, "York")),
+    }
+
+    counterparty, address = get_dimension_inputs(
+        s3_client, "dim_counterparty", data_frames
+    )
+
+    assert list(counterparty["counterparty_id"]) == [1, 2]
+    assert list(address["address_id"]) == [10, 20]
+    assert list(load_snapshot(s3_client, "address")["city"]) == ["Leeds", "York"]
+
+
+def test_changed_lookup_row_recomputes_rows_referencing_it(s3_client):
+    get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {
+            "counterparty": counterparties((1, "Fahey", 10), (2, "Leannon", 20)),
+            "address": addresses((10, "Leeds"), (20, "York")),
+        },
+    )
+
+    counterparty, address = get_dimension_inputs(
+        s3_client, "dim_counterparty", {"address": addresses((20, "Bath"))}
+    )
+
+    assert counterparty.values.tolist() == [[2, "Leannon", 20]]
+    assert address.values.tolist() == [[20, "Bath"]]
+
+
+def test_changed_main_row_is_joined_to_stored_lookup_rows(s3_client):
+    get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {
+            "counterparty": counterparties((1, "Fahey", 10)),
+            "address": addresses((10, "Leeds"), (20, "York")),
+        },
+    )
+
+    counterparty, address = get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {"counterparty": counterparties((1, "Fahey and Sons", 20))},
+    )
+
+    assert counterparty.values.tolist() == [[1, "Fahey and Sons", 20]]
+    assert address.values.tolist() == [[20, "York"]]
+
+
+def test_nothing_to_recompute(s3_client):
+    assert (
+        get_dimension_inputs(s3_client, "dim_staff", {"address": addresses()}) is None
+    )
+
+
+def test_skips_dimension_without_lookup_rows(s3_client):
+    result = get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {"counterparty": counterparties((1, "Fahey", 10))},
+    )
+
+    assert result is None
+    assert load_snapshot(s3_client, "counterparty") is None
+
+
+def test_missing_snapshot_is_seeded_and_every_row_using_it_recomputed(s3_client):
+    read_table = {
+        "counterparty": counterparties((1, "Fahey", 10), (2, "Leannon", 20)),
+        "address": addresses((10, "Leeds"), (20, "York")),
+    }.get
+
+    counterparty, address = get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {"counterparty": counterparties((1, "Fahey and Sons", 10))},
+        read_table,
+    )
+
+    assert counterparty.values.tolist() == [
+        [1, "Fahey and Sons", 10],
+        [2, "Leannon", 20],
+    ]
+    assert list(address["city"]) == ["Leeds", "York"]
+    assert list(load_snapshot(s3_client, "address")["city"]) == ["Leeds", "York"]
+    assert list(
+        load_snapshot(s3_client, "counterparty")["counterparty_legal_name"]
+    ) == [
+        "Fahey and Sons",
+        "Leannon",
+    ]
+
+
+def test_rows_of_several_sources_are_keyed_and_joined_per_source(s3_client):
+    def tagged(frame, *sources):
+        return frame.assign(source_id=list(sources))
+
+    get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {
+            "counterparty": tagged(
+                counterparties((1, "Fahey", 10), (1, "Kub", 10)), "eu", "us"
+            ),
+            "address": tagged(addresses((10, "Leeds"), (10, "Boston")), "eu", "us"),
+        },
+    )
+
+    counterparty, address = get_dimension_inputs(
+        s3_client,
+        "dim_counterparty",
+        {"address": tagged(addresses((10, "Bath")), "us")},
+    )
+
+    assert counterparty.values.tolist() == [[1, "Kub", 10, "us"]]
+    assert address.values.tolist() == [[10, "Bath", "us"]]
+    snapshot = load_snapshot(s3_client, "address")
+    assert snapshot[["source_id", "city"]].values.tolist() == [
+        ["eu", "Leeds"],
+        ["us", "Bath"],
+    ]
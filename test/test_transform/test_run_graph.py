@@ -0,0 +1,84 @@
+import threading
+import time
+import pytest
+from transform import run_graph
+
+
+def test_runs_nodes_after_their_inputs():
+    order = []
+
+    def node(name, value):
+        def run(*inputs):
+            order.append(name)
+            return value + sum(inputs)
+
+        return run
+
+    nodes = {
+        "c": (node("c", 100), ["a", "b"]),
+        "a": (node("a", 10), ["x"]),
+        "b": (node("b", 20), ["x"]),
+    }
+
+    outputs, timings = run_graph(nodes, {"x": 1}, workers=2)
+
+    assert outputs == {"c": 132, "a": 11, "b": 21}
+    assert order[-1] == "c"
+    assert set(timings) == {"a", "b", "c"}
+
+
+def test_runs_independent_nodes_concurrently():
+    both_running = threading.Barrier(2, timeout=1)
+
+    def node(*inputs):
+        both_running.wait()
+        return "done"
+
+    outputs, _ = run_graph(
+        {"a": (node, ["x"]), "b": (node, ["x"])}, {"x": 1}, workers=2
+    )
+
+    assert outputs == {"a": "done", "b": "done"}
+
+
+def test_calls_nodes_with_available_inputs_and_skips_nodes_without_any():
+    nodes = {
+        "partial": (lambda *inputs: list(inputs), ["x", "missing"]),
+        "skipped": (lambda *inputs: "ran", ["missing"]),
+        "after_skipped": (lambda *inputs: "ran", ["skipped"]),
+        "no_output": (lambda *inputs: None, ["x"]),
+    }
+
+    outputs, timings = run_graph(nodes, {"x": 1}, workers=2)
+
+    assert outputs == {"partial": [1]}
+    assert set(timings) == {"partial", "no_output"}
+
+
+def test_raises_first_error_after_running_nodes_finish():
+    finished = []
+
+    def slow(*inputs):
+        time.sleep(0.1)
+        finished.append("slow")
+
+    def failing(*inputs):
+        raise ValueError("bad data")
+
+    nodes = {
+        "slow": (slow, ["x"]),
+        "failing": (failing, ["x"]),
+        "after": (lambda *inputs: finished.append("after"), ["failing"]),
+    }
+
+    with pytest.raises(ValueError, match="bad data"):
+        run_graph(nodes, {"x": 1}, workers=2)
+
+    assert finished == ["slow"]
+
+
+def test_cycle_raises():
+    nodes = {"a": (lambda x: x, ["b"]), "b": (lambda x: x, ["a"])}
+
+    with pytest.raises(ValueError, match="cycle"):
+        run_graph(nodes, {}, workers=1)
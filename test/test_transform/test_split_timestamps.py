@@ -0,0 +1,62 @@
+from datetime import date, time
+import pandas as pd
+from timestamps import parse_timestamps, split_timestamps, get_date_ids
+
+
+def test_parses_timestamps_of_mixed_precision():
+    result = parse_timestamps(
+        pd.Series(["2022-11-03 14:20:52.186000", "2022-11-03 14:20:52"])
+    )
+
+    assert list(result) == [
+        pd.Timestamp("2022-11-03 14:20:52.186"),
+        pd.Timestamp("2022-11-03 14:20:52"),
+    ]
+
+
+def test_repeated_and_missing_values_keep_their_rows():
+    series = pd.Series(
+        ["2022-11-03 14:20:52", None, "not a timestamp", "2022-11-03 14:20:52"],
+        index=[10, 11, 12, 13],
+    )
+
+    result = parse_timestamps(series)
+
+    assert list(result.index) == [10, 11, 12, 13]
+    assert result[10] == result[13] == pd.Timestamp("2022-11-03 14:20:52")
+    assert pd.isna(result[11]) and pd.isna(result[12])
+
+
+def test_column_without_values_is_parsed_to_nat():
+    result = parse_timestamps(pd.Series([None, None], index=[4, 5]))
+
+    assert result.dtype == "datetime64[ns]"
+    assert list(result.index) == [4, 5]
+    assert result.isna().all()
+
+
+def test_datetime_columns_are_returned_as_they_are():
+    series = pd.Series([pd.Timestamp("2024-11-27 13:00:00")])
+
+    assert parse_timestamps(series) is series
+
+
+def test_splits_timestamps_into_date_time_and_date_id():
+    result = split_timestamps(
+        pd.Series(["2024-11-27 12:30:00.123456", None], index=[3, 4])
+    )
+
+    assert list(result.index) == [3, 4]
+    assert result["date"][3] == date(2024, 11, 27)
+    assert result["time"][3] == time(12, 30, 0, 123456)
+    assert result["date_id"][3] == 20241127
+    assert result[["date", "time", "date_id"]].loc[4].isna().all()
+    assert str(result["date"].dtype) == "date32[day][pyarrow]"
+    assert str(result["time"].dtype) == "time64[us][pyarrow]"
+
+
+def test_date_ids_are_yyyymmdd_integers():
+    date_ids = get_date_ids(pd.date_range("2024-12-31", "2025-01-01"))
+
+    assert list(date_ids) == [20241231, 20250101]
+    assert date_ids.dtype == "Int32"
@@ -6,9 +6,12 @@ import pandas as pd
 import json
 import io
 from transform import lambda_handler, get_data_frame
+from cached_resources import clear_clients
+from table_schemas import apply_table_schema
 
 @pytest.fixture
 def s3_mock():
+    clear_clients()
     with mock_aws():
         s3_client = boto3.client("s3", region_name="eu-west-2")
         s3_client.create_bucket(
@@ -55,6 +58,60 @@ def test_get_data_frame_success(s3_mock):
     assert not df.empty
     assert df.shape == (2, 2)
 
+def test_get_data_frame_reads_parquet(s3_mock):
+    buffer = io.BytesIO()
+    pd.DataFrame(
+        {"sales_order_id": [1], "created_at": [pd.Timestamp("2022-11-03 14:20:52")]}
+    ).to_parquet(buffer, index=False)
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="sales_order/2024/11/25/2024-11-25T15:00:00.parquet",
+        Body=buffer.getvalue(),
+    )
+
+    df = get_data_frame(
+        s3_mock,
+        "banana-squad-ingested-data",
+        "sales_order/2024/11/25/2024-11-25T15:00:00.parquet",
+    )
+
+    assert df.shape == (1, 2)
+    assert pd.api.types.is_datetime64_any_dtype(df["created_at"])
+
+def test_get_data_frame_reads_csv_with_table_column_types(s3_mock):
+    key = "address/2024/11/25/2024-11-25T15:00:00.csv"
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=key,
+        Body=(
+            "address_id,address_line_2,postal_code,created_at\n"
+            '1,,01234,2022-11-03 14:20:49.962000\n'
+            '2,"",28441,2022-11-03 14:20:49\n'
+        ),
+    )
+
+    df = get_data_frame(s3_mock, "banana-squad-ingested-data", key)
+
+    assert list(df["address_id"]) == [1, 2]
+    assert list(df["postal_code"]) == ["01234", "28441"]
+    assert pd.isna(df["address_line_2"][0])
+    assert df["address_line_2"][1] == ""
+    assert pd.api.types.is_datetime64_any_dtype(df["created_at"])
+
+
+def test_get_data_frame_can_read_csv_with_pandas(s3_mock):
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="address.csv",
+        Body="address_id,postal_code\n1,28441",
+    )
+
+    with patch("transform.TRANSFORM_CSV_ENGINE", "pandas"):
+        df = get_data_frame(s3_mock, "banana-squad-ingested-data", "address.csv")
+
+    assert df.shape == (1, 2)
+    assert list(df["postal_code"]) == [28441]
+
 def test_get_data_frame_failure(s3_mock):
     df = get_data_frame(s3_mock, "banana-squad-ingested-data", "nonexistent.csv")
     assert df is None
@@ -67,4 +124,240 @@ def test_lambda_handler_missing_table(s3_mock, fake_event):
         Body=json.dumps(data),
     )
     response = lambda_handler(fake_event, None)
-    assert response == "Transformation completed"
\ No newline at end of file
+    assert response == "Transformation completed"
+def test_lambda_handler_combines_pages_of_a_table(s3_mock, fake_event):
+    keys = [
+        "design/2024/11/25/2024-11-25T15:00:00.000001.csv",
+        "design/2024/11/25/2024-11-25T15:00:00.000002.csv",
+    ]
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=keys[0],
+        Body="design_id,design_name,file_location,file_name\n1,Wooden,/usr,wooden.json",
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=keys[1],
+        Body="design_id,design_name,file_location,file_name\n2,Steel,/usr,steel.json",
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="updated_tables.json",
+        Body=json.dumps({"updated_tables": keys}),
+    )
+
+    received = []
+
+    def dim_design(df):
+        received.append(df)
+        return df
+
+    with patch("transform.dim_design", dim_design):
+        lambda_handler(fake_event, None)
+
+    assert len(received) == 1
+    assert list(received[0]["design_id"]) == [1, 2]
+    assert received[0]["design_name"].dtype == "category"
+
+
+def test_lambda_handler_applies_schema_once_per_table(s3_mock, fake_event):
+    keys = [
+        f"design/2024/11/25/2024-11-25T15:00:00.00000{page}.csv" for page in (1, 2, 3)
+    ]
+    for page, key in enumerate(keys, start=1):
+        s3_mock.put_object(
+            Bucket="banana-squad-ingested-data",
+            Key=key,
+            Body=f"design_id,design_name,file_location,file_name\n{page},D{page},/usr,d.json",
+        )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="updated_tables.json",
+        Body=json.dumps({"updated_tables": keys}),
+    )
+
+    received = []
+
+    def dim_design(df):
+        received.append(df)
+        return df
+
+    with patch("transform.dim_design", dim_design), patch(
+        "transform.apply_table_schema", wraps=apply_table_schema
+    ) as mock_schema:
+        lambda_handler(fake_event, None)
+
+    combined = [call for call in mock_schema.mock_calls if len(call.args) == 2]
+    assert len(combined) == 1
+    assert list(received[0]["design_id"]) == [1, 2, 3]
+
+
+def test_lambda_handler_unions_shards_of_a_table(s3_mock, fake_event):
+    keys = {
+        "eu": "design/2024/11/25/2024-11-25T15:00:00.000001-eu.csv",
+        "us": "design/2024/11/25/2024-11-25T15:00:00.000002-us.csv",
+    }
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=keys["eu"],
+        Body="design_id,design_name,file_location,file_name\n1,Wooden,/usr,wooden.json",
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=keys["us"],
+        Body="design_id,design_name,file_location,file_name\n7,Steel,/usr,steel.json",
+    )
+    report = {
+        "updated_tables": list(keys.values()),
+        "sources": {
+            source: {"extraction_type": "Continuous", "updated_tables": [key]}
+            for source, key in keys.items()
+        },
+    }
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="updated_tables.json",
+        Body=json.dumps(report),
+    )
+
+    received = []
+
+    def dim_design(df):
+        received.append(df)
+        return df
+
+    with patch("transform.dim_design", dim_design):
+        lambda_handler(fake_event, None)
+
+    assert len(received) == 1
+    assert list(received[0]["design_id"]) == [1, 7]
+
+
+def test_lambda_handler_runs_transforms_sharing_a_table(s3_mock, fake_event):
+    keys = [
+        "address/2024/11/25/2024-11-25T15:00:00.000001.csv",
+        "counterparty/2024/11/25/2024-11-25T15:00:00.000001.csv",
+    ]
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=keys[0],
+        Body=(
+            "address_id,address_line_1,address_line_2,district,city,postal_code,country,phone\n"
+            "1,6826 Herzog Via,,Avon,New Patienceburgh,28441,Turkey,1803 637401"
+        ),
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=keys[1],
+        Body="counterparty_id,counterparty_legal_name,legal_address_id\n1,Fahey and Sons,1",
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="updated_tables.json",
+        Body=json.dumps({"updated_tables": keys}),
+    )
+
+    lambda_handler(fake_event, None)
+
+    stored = {
+        obj["Key"]
+        for obj in s3_mock.list_objects(Bucket="banana-squad-processed-data")["Contents"]
+    }
+    assert "dim_location/2024/11/25/2024-11-25T15:00:00.000001.parquet" in stored
+    assert "dim_counterparty/2024/11/25/2024-11-25T15:00:00.000001.parquet" in stored
+    location = pd.read_parquet(
+        io.BytesIO(
+            s3_mock.get_object(
+                Bucket="banana-squad-processed-data",
+                Key="dim_location/2024/11/25/2024-11-25T15:00:00.000001.parquet",
+            )["Body"].read()
+        )
+    )
+    assert list(location["location_id"]) == [1]
+    assert list(location["postal_code"]) == ["28441"]
+
+
+def test_lambda_handler_recomputes_counterparties_of_a_changed_address(
+    s3_mock, fake_event
+):
+    address_header = (
+        "address_id,address_line_1,address_line_2,district,city,postal_code,country,phone\n"
+    )
+    runs = [
+        {
+            "address/2024/11/25/2024-11-25T15:00:00.000001.csv": address_header
+            + "1,6826 Herzog Via,,Avon,New Patienceburgh,28441,Turkey,1803 637401",
+            "counterparty/2024/11/25/2024-11-25T15:00:00.000001.csv": (
+                "counterparty_id,counterparty_legal_name,legal_address_id\n"
+                "1,Fahey and Sons,1"
+            ),
+        },
+        {
+            "address/2024/11/25/2024-11-25T15:20:00.000001.csv": address_header
+            + "1,6826 Herzog Via,,Avon,Aliso Viejo,28441,Turkey,1803 637401",
+        },
+    ]
+    for files in runs:
+        for key, body in files.items():
+            s3_mock.put_object(Bucket="banana-squad-ingested-data", Key=key, Body=body)
+        s3_mock.put_object(
+            Bucket="banana-squad-ingested-data",
+            Key="updated_tables.json",
+            Body=json.dumps({"updated_tables": list(files)}),
+        )
+        lambda_handler(fake_event, None)
+
+    counterparty = pd.read_parquet(
+        io.BytesIO(
+            s3_mock.get_object(
+                Bucket="banana-squad-processed-data",
+                Key="dim_counterparty/2024/11/25/2024-11-25T15:20:00.000001.parquet",
+            )["Body"].read()
+        )
+    )
+    assert list(counterparty["counterparty_id"]) == [1]
+    assert list(counterparty["counterparty_legal_city"]) == ["Aliso Viejo"]
+
+
+def test_lambda_handler_seeds_missing_reference_snapshot_from_ingested_files(
+    s3_mock, fake_event
+):
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="address/2024/11/25/2024-11-25T14:00:00.000001.csv",
+        Body="address_id,city\n10,Leeds\n20,York",
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="address/2024/11/25/2024-11-25T14:30:00.000001.csv",
+        Body="address_id,city\n20,Bath",
+    )
+    key = "counterparty/2024/11/25/2024-11-25T15:00:00.000001.csv"
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key=key,
+        Body="counterparty_id,counterparty_legal_name,legal_address_id\n1,Fahey,20",
+    )
+    s3_mock.put_object(
+        Bucket="banana-squad-ingested-data",
+        Key="updated_tables.json",
+        Body=json.dumps({"updated_tables": [key]}),
+    )
+
+    received = []
+
+    def dim_counterparty(counterparty, address):
+        received.append(address)
+        return counterparty
+
+    with patch("transform.dim_counterparty", dim_counterparty):
+        lambda_handler(fake_event, None)
+
+    assert received[0][["address_id", "city"]].values.tolist() == [[20, "Bath"]]
+    snapshot = s3_mock.get_object(
+        Bucket="banana-squad-processed-data", Key="reference/address.parquet"
+    )
+    assert pd.read_parquet(io.BytesIO(snapshot["Body"].read()))["city"].tolist() == [
+        "Leeds",
+        "Bath",
+    ]
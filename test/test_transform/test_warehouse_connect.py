@@ -0,0 +1,29 @@
+import sys
+from unittest.mock import patch, MagicMock
+from transform_utils import connect
+
+
+def test_connect_commits_every_query():
+    mock_secret = {
+        "user": "test_user",
+        "database": "test_db",
+        "password": "test_password",
+        "host": "test_host",
+        "port": 5432,
+    }
+    mock_pg8000 = MagicMock()
+
+    with patch("transform_utils.get_secret", return_value=mock_secret), patch.dict(
+        sys.modules, {"pg8000": mock_pg8000}
+    ):
+        conn = connect()
+
+    mock_pg8000.connect.assert_called_once_with(
+        user="test_user",
+        database="test_db",
+        password="test_password",
+        host="test_host",
+        port=5432,
+    )
+    assert conn is mock_pg8000.connect.return_value
+    assert conn.autocommit is True